@@ -0,0 +1,22 @@
+"""
+ASGI config for backend project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Served in production by gunicorn with uvicorn workers (see gunicorn.conf.py).
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# The hot public reads have async views; use them when served over ASGI.
+os.environ.setdefault('ASYNC_READ_VIEWS', 'True')
+# Each ASGI request runs its sync code on a fresh thread, so a connection
+# kept open past the request is never reused; set DB_POOL=True to reuse them.
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+
+application = get_asgi_application()
@@ -11,7 +11,9 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 from pathlib import Path
+import importlib.util
 import os
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -64,6 +66,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.profiling.ProfilingMiddleware',  # outermost, so it times everything below
+    'core.db_router.ReplicaPinMiddleware',  # routes every query below
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -112,9 +116,146 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD', 'django_password'),
         'HOST': os.getenv('DB_HOST', 'db'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        # Seconds a worker thread keeps its connection open across requests;
+        # 0 reconnects on every request, "None" never closes it.
+        'CONN_MAX_AGE': None if os.getenv('DB_CONN_MAX_AGE') == 'None' else int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        # Test a reused connection (once per request) before handing it out,
+        # so a database restart costs a reconnect instead of a 500.
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
     }
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default']['OPTIONS'] = {'timeout': 30}
+elif os.getenv('DB_POOL', 'False') == 'True':
+    # A psycopg 3 pool per worker process, shared by its threads. Requests
+    # check a connection out and return it when they finish, so persistent
+    # connections (CONN_MAX_AGE) are turned off. Size max_size to the
+    # worker's threads; a request waits up to DB_POOL_TIMEOUT seconds for a
+    # free connection before failing. The wait shows up as ``db_connect`` in
+    # core.profiling.
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '4')),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+            'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', '600')),
+            'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', '3600')),
+        },
+    }
+
+# Read replicas: one database alias per host in DB_REPLICA_HOSTS, with the
+# primary's credentials. core.db_router sends reads there and writes to the
+# primary; a user who wrote reads from the primary for REPLICA_PIN_SECONDS,
+# which should exceed the replicas' usual lag.
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(','))):
+    alias = f'replica_{index + 1}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'OPTIONS': dict(DATABASES['default'].get('OPTIONS', {})),
+        # Tests run against the primary's test database.
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.db_router.PrimaryReplicaRouter']
+TEST_RUNNER = 'core.test_runner.TestRunner'
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '10'))
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at a shared
+# cache (e.g. django.core.cache.backends.redis.RedisCache) when running more
+# than one worker so they agree on the catalog version, throttle counts and
+# auth claim invalidations. gunicorn.conf.py won't start several workers
+# on a process-local one, and read replicas need a shared one too.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# The replica pins and the catalog's bumped-at marker (core.db_router,
+# core.cache) only keep users on the primary if every process sees them.
+if DATABASE_REPLICAS and CACHES['default']['BACKEND'].endswith(('LocMemCache', 'DummyCache')):
+    raise ImproperlyConfigured(
+        'DB_REPLICA_HOSTS needs a shared CACHE_BACKEND (Redis, Memcached): '
+        'read-your-writes pins in a process-local cache are lost between workers.'
+    )
+
+# Serve the hot public reads (session list/detail/bookings) with the async
+# views. backend/asgi.py turns this on; under WSGI they would only add an
+# event loop per request.
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False') == 'True'
+
+# Seconds a cached catalog response may live; writes invalidate it sooner.
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', '300'))
+
+
+# Shared counters for core.throttling: CacheCounterStore (atomic cache
+# increments; share them through Redis/Memcached) or DatabaseCounterStore
+THROTTLE_STORE = os.getenv('THROTTLE_STORE', 'core.throttling.CacheCounterStore')
+
+
+# Resized WebP/AVIF copies of uploaded images (core.images)
+IMAGE_VARIANT_WIDTHS = [int(w) for w in os.getenv('IMAGE_VARIANT_WIDTHS', '320,640,1280').split(',')]
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', '2'))
+IMAGE_VARIANTS_SYNC = os.getenv('IMAGE_VARIANTS_SYNC', 'False') == 'True'
+
+
+# Direct-to-storage uploads (core.uploads): largest accepted file in bytes,
+# and how long a presigned upload stays valid in seconds
+DIRECT_UPLOAD_MAX_SIZE = int(os.getenv('DIRECT_UPLOAD_MAX_SIZE', str(10 * 1024 * 1024)))
+DIRECT_UPLOAD_EXPIRES = int(os.getenv('DIRECT_UPLOAD_EXPIRES', '600'))
+
+
+# Shared S3/MinIO client (core.s3): connections per process, and multipart
+# uploads (files above the threshold go up in chunks, this many at once)
+S3_MAX_POOL_CONNECTIONS = int(os.getenv('S3_MAX_POOL_CONNECTIONS', '32'))
+S3_MULTIPART_THRESHOLD = int(os.getenv('S3_MULTIPART_THRESHOLD', str(8 * 1024 * 1024)))
+S3_MULTIPART_CHUNKSIZE = int(os.getenv('S3_MULTIPART_CHUNKSIZE', str(8 * 1024 * 1024)))
+S3_MAX_CONCURRENCY = int(os.getenv('S3_MAX_CONCURRENCY', '8'))
+
+# Cache-Control written on media objects. Keys are content hashes, so the
+# bytes behind a URL never change.
+MEDIA_CACHE_CONTROL = os.getenv('MEDIA_CACHE_CONTROL', 'public, max-age=31536000, immutable')
+
+
+# Request profiling (core.profiling): fraction of requests sampled, and
+# whether sampled responses carry a Server-Timing header.
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0.01'))
+PROFILING_SERVER_TIMING = os.getenv('PROFILING_SERVER_TIMING', str(DEBUG)) == 'True'
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'plain')  # plain or json
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+        'json': {'()': 'core.logs.JSONFormatter'},
+    },
+    'handlers': {
+        'console': {'class': 'core.logs.QueuedStreamHandler', 'formatter': LOG_FORMAT},
+    },
+    'loggers': {
+        'core': {'handlers': ['console'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
+
+
+# OAuth role selection state (see core.temp_storage)
+OAUTH_STATE_STORE = os.getenv('OAUTH_STATE_STORE', 'core.temp_storage.SignedStateStore')
+OAUTH_STATE_TTL = int(os.getenv('OAUTH_STATE_TTL', '600'))
+OAUTH_STATE_MAX_ENTRIES = int(os.getenv('OAUTH_STATE_MAX_ENTRIES', '10000'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -160,7 +301,7 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # Storage backends (default to local filesystem)
 STORAGES = {
     'default': {
-        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'BACKEND': 'core.storage.MediaStorage',
     },
     'staticfiles': {
         'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
@@ -187,6 +328,8 @@ if USE_MINIO:
     AWS_S3_FILE_OVERWRITE = False
     AWS_DEFAULT_ACL = 'public-read'
     AWS_QUERYSTRING_AUTH = False
+    # Endpoint browsers use for direct uploads (presigned POSTs)
+    MINIO_UPLOAD_ENDPOINT = os.getenv('MINIO_UPLOAD_ENDPOINT', f"http://{os.getenv('MINIO_EXTERNAL_ENDPOINT', 'localhost:9000')}")
     # Keep MEDIA_URL simple for nginx proxying
     MEDIA_URL = '/media/'
 
@@ -196,20 +339,36 @@ if USE_MINIO:
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # REST Framework settings
+# MessagePack is offered (Accept: application/msgpack) only when installed.
+HAS_MSGPACK = importlib.util.find_spec('msgpack') is not None
+
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.ORJSONRenderer',
+        *(['core.renderers.MessagePackRenderer'] if HAS_MSGPACK else []),
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.renderers.ORJSONParser',
+        *(['core.renderers.MessagePackParser'] if HAS_MSGPACK else []),
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.ClaimsJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'core.throttling.AnonRateThrottle',
+        'core.throttling.UserRateThrottle',
+        'core.throttling.ScopedRateThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': os.getenv('RATE_LIMIT_ANON', '100/day'),
         'user': os.getenv('RATE_LIMIT_USER', '1000/day'),
+        'bookings': os.getenv('RATE_LIMIT_BOOKINGS', '30/hour'),
     }
 }
 
@@ -222,15 +381,27 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': True,
-    'UPDATE_LAST_LOGIN': True,
+    # Recorded by core.last_login instead of a synchronous UPDATE per login.
+    'UPDATE_LAST_LOGIN': False,
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
     'AUTH_HEADER_TYPES': ('Bearer',),
     'AUTH_HEADER_NAME': 'HTTP_AUTHORIZATION',
     'USER_ID_FIELD': 'id',
     'USER_ID_CLAIM': 'user_id',
+    'TOKEN_OBTAIN_SERIALIZER': 'core.authentication.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'core.authentication.ClaimsTokenRefreshSerializer',
 }
 
+# Per-process cache of the users resolved from access tokens
+AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL', '60'))
+AUTH_USER_CACHE_MAX_ENTRIES = int(os.getenv('AUTH_USER_CACHE_MAX_ENTRIES', '10000'))
+
+# Write-behind buffer for User.last_login (core.last_login)
+LAST_LOGIN_WRITE_BEHIND = os.getenv('LAST_LOGIN_WRITE_BEHIND', 'True') == 'True'
+LAST_LOGIN_FLUSH_INTERVAL = float(os.getenv('LAST_LOGIN_FLUSH_INTERVAL', '5'))
+LAST_LOGIN_FLUSH_SIZE = int(os.getenv('LAST_LOGIN_FLUSH_SIZE', '500'))
+
 # OAuth Login Redirect
 LOGIN_REDIRECT_URL = '/accounts/profile/'  # This will trigger our custom callback
 ACCOUNT_LOGOUT_REDIRECT_URL = '/login'
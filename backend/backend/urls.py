@@ -18,6 +18,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -52,3 +53,6 @@ urlpatterns = [
 # Serve media files in development/production
 if settings.DEBUG or not settings.USE_MINIO:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+# runserver served static files itself in DEBUG; gunicorn needs the route.
+urlpatterns += staticfiles_urlpatterns()
@@ -0,0 +1,71 @@
+"""
+Authenticated request latency and user queries: simplejwt's
+JWTAuthentication (one user SELECT per request) vs ClaimsJWTAuthentication.
+
+    python -m benchmarks.auth --repeat 200
+"""
+import argparse
+import logging
+from datetime import timedelta
+from unittest import mock
+
+from benchmarks.common import measure, print_table, setup, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bookings', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    setup()
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+    from rest_framework.views import APIView
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from core.authentication import ClaimsJWTAuthentication, ClaimsRefreshToken
+    from core.models import Booking, Session, User
+
+    # The IsCreator case is a 403 on purpose; don't log every one.
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+
+    with test_database():
+        creator = User.objects.create(username='creator', email='creator@example.com', role=User.CREATOR)
+        student = User.objects.create(username='student', email='student@example.com')
+        now = timezone.now()
+        sessions = Session.objects.bulk_create([
+            Session(creator=creator, title=f'Session {i}', description='About', date=now + timedelta(days=i), price=10)
+            for i in range(args.bookings)
+        ])
+        Booking.objects.bulk_create([Booking(user=student, session=s) for s in sessions])
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(student).access_token}')
+        cases = [
+            ('GET', '/api/bookings/my/?view=compact'),
+            ('POST', '/api/sessions/create/'),  # rejected by IsCreator
+        ]
+        backends = [('JWTAuthentication', JWTAuthentication), ('ClaimsJWTAuthentication', ClaimsJWTAuthentication)]
+
+        rows = []
+        for method, url in cases:
+            request = getattr(client, method.lower())
+            for name, backend in backends:
+                with mock.patch.object(APIView, 'authentication_classes', [backend]), \
+                        mock.patch.object(APIView, 'throttle_classes', []):
+                    request(url)
+                    with CaptureQueriesContext(connection) as ctx:
+                        request(url)
+                    queries = [q['sql'] for q in ctx.captured_queries]
+                    stats = measure(lambda: request(url), repeat=args.repeat)
+                user_queries = sum('FROM "core_user"' in sql for sql in queries)
+                rows.append([f'{method} {url}', name, len(queries), user_queries,
+                             stats['median'], stats['p95']])
+
+        print_table(['request', 'authentication', 'queries', 'user queries', 'median ms', 'p95 ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Benchmarks run against a throwaway test database built from the configured
+DATABASES settings, so they never touch development data. Run them from the
+backend directory, e.g. ``python -m benchmarks.search``.
+"""
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+import django
+
+
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def measure(fn, repeat=50, warmup=5):
+    """Run ``fn`` repeatedly and return latency stats in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'median': statistics.median(samples),
+        'p95': samples[max(0, int(len(samples) * 0.95) - 1)],
+        'max': samples[-1],
+    }
+
+
+def print_table(headers, rows):
+    rows = [[_format(value) for value in row] for row in rows]
+    widths = [max(len(str(h)), *(len(r[i]) for r in rows)) for i, h in enumerate(headers)]
+    print('  '.join(str(h).rjust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print('  '.join(value.rjust(w) for value, w in zip(row, widths)))
+
+
+def _format(value):
+    if isinstance(value, float):
+        return f'{value:.3f}'
+    return str(value)
@@ -0,0 +1,127 @@
+"""
+Connection setup cost per request under each connection mode:
+
+- per-request: CONN_MAX_AGE=0, a new connection for every request (the old
+  behaviour)
+- persistent: CONN_MAX_AGE=60 with CONN_HEALTH_CHECKS, one connection per
+  thread reused across requests
+- pool: DB_POOL, a psycopg 3 pool shared by the threads
+
+Each thread runs request cycles of request_started, one query and
+request_finished, the same signals Django's handlers send. The script
+reports connects per request and the connect time (``db_connect`` in
+core.profiling), which under the pool is the wait for a free connection.
+It refuses to run on anything but PostgreSQL (DB_HOST etc.): Django never
+closes in-memory SQLite connections, so there would be no churn to
+measure. The pool needs psycopg 3.
+
+    python -m benchmarks.connections --repeat 500
+    python -m benchmarks.connections --threads 8 --pool-size 4
+"""
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import print_table, setup, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=300, help="Requests per thread.")
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--pool-size', type=int, default=4)
+    args = parser.parse_args()
+
+    setup()
+    from django.core.signals import request_finished, request_started
+    from django.db import connection, connections
+    from django.db.backends.signals import connection_created
+    from core.models import Session
+    from core.profiling import ProfilingMiddleware, RequestProfile
+
+    if connection.vendor != 'postgresql':
+        parser.exit(1, f"Connection churn needs PostgreSQL, not {connection.vendor}: set DB_ENGINE, DB_HOST etc.\n")
+
+    modes = {
+        'per-request': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False},
+        'persistent': {'CONN_MAX_AGE': 60, 'CONN_HEALTH_CHECKS': True},
+        'pool': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'pool': {
+            'min_size': args.pool_size, 'max_size': args.pool_size, 'timeout': 30,
+        }},
+    }
+    connects = []
+    connection_created.connect(lambda **kwargs: connects.append(1), weak=False)
+
+    def physical_connects(pooled):
+        # Django sends connection_created for every pool checkout too.
+        if pooled:
+            return connections['default'].pool.get_stats().get('connections_num', 0)
+        return len(connects)
+
+    middleware = ProfilingMiddleware(lambda request: None)
+
+    def request_cycle():
+        profile = RequestProfile()
+        start = time.perf_counter()
+        request_started.send(sender=None)
+        try:
+            with middleware.wrap_connections(profile):
+                list(Session.objects.order_by('pk')[:20])
+        finally:
+            request_finished.send(sender=None)
+        return (time.perf_counter() - start) * 1000, profile.timings.get('db_connect', 0) * 1000
+
+    def worker(barrier):
+        barrier.wait()
+        try:
+            return [request_cycle() for _ in range(args.repeat)]
+        finally:
+            connection.close()
+
+    with test_database():
+        settings_dict = connection.settings_dict
+        original = {key: settings_dict.get(key) for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+        original_options = dict(settings_dict['OPTIONS'])
+        connection.close()
+
+        rows = []
+        try:
+            for name, mode in modes.items():
+                settings_dict['CONN_MAX_AGE'] = mode['CONN_MAX_AGE']
+                settings_dict['CONN_HEALTH_CHECKS'] = mode['CONN_HEALTH_CHECKS']
+                settings_dict['OPTIONS'] = {**original_options, **({'pool': mode['pool']} if 'pool' in mode else {})}
+                if 'pool' in mode:
+                    # Open it up front, as a warm worker would have it.
+                    connections['default'].pool.open(wait=True)
+
+                opened = physical_connects('pool' in mode)
+                barrier = threading.Barrier(args.threads)
+                start = time.perf_counter()
+                with ThreadPoolExecutor(args.threads) as executor:
+                    futures = [executor.submit(worker, barrier) for _ in range(args.threads)]
+                    results = [result for future in futures for result in future.result()]
+                elapsed = time.perf_counter() - start
+                opened = physical_connects('pool' in mode) - opened
+                if 'pool' in mode:
+                    connections['default'].close_pool()
+
+                latencies = sorted(ms for ms, _ in results)
+                connect_ms = [ms for _, ms in results]
+                rows.append([
+                    name, len(results) / elapsed, statistics.median(latencies),
+                    latencies[max(0, int(len(latencies) * 0.95) - 1)],
+                    opened / len(results), statistics.mean(connect_ms), max(connect_ms),
+                ])
+        finally:
+            settings_dict.update(original)
+            settings_dict['OPTIONS'] = original_options
+
+    print_table(
+        ['mode', 'req/s', 'median ms', 'p95 ms', 'connects/req', 'connect ms/req', 'max connect ms'], rows,
+    )
+
+
+if __name__ == '__main__':
+    main()
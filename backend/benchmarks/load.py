@@ -0,0 +1,211 @@
+"""
+Load test of the public read endpoints under each application server:
+
+- runserver: manage.py runserver, the previous Dockerfile command
+- gunicorn-wsgi: gunicorn gthread workers on backend.wsgi (sync views)
+- gunicorn-asgi: gunicorn uvicorn workers on backend.asgi (async views)
+
+Each server is started on a local port against a seeded SQLite database.
+Client processes then hit the session list, detail and bookings endpoints
+over keep-alive connections for --duration seconds. The script reports
+requests/sec and latency percentiles.
+
+    python -m benchmarks.load --duration 20 --concurrency 64 --workers 4
+    python -m benchmarks.load --servers gunicorn-asgi --cache-timeout 0
+
+``--cache-timeout 0`` turns the catalog cache off, so every request reaches
+the ORM. gunicorn's workers need a shared cache: CACHE_BACKEND and
+CACHE_LOCATION from the environment (e.g. Redis), else a file-based cache.
+Run it on an otherwise idle machine: the clients share its CPUs.
+"""
+import argparse
+import http.client
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+
+from benchmarks.common import print_table
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVERS = {
+    'runserver': lambda port, args: [
+        sys.executable, 'manage.py', 'runserver', '--noreload', f'127.0.0.1:{port}',
+    ],
+    'gunicorn-wsgi': lambda port, args: [
+        sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+        '--workers', str(args.workers), 'backend.wsgi:application', '--worker-class', 'gthread',
+    ],
+    'gunicorn-asgi': lambda port, args: [
+        sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+        '--workers', str(args.workers), 'backend.asgi:application', '--worker-class', 'uvicorn_worker.UvicornWorker',
+    ],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--servers', nargs='+', default=list(SERVERS), choices=list(SERVERS))
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--concurrency', type=int, default=32, help="Concurrent keep-alive connections.")
+    parser.add_argument('--client-processes', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=4, help="gunicorn workers.")
+    parser.add_argument('--sessions', type=int, default=500)
+    parser.add_argument('--cache-timeout', type=int, default=300)
+    parser.add_argument('--db', default='/tmp/benchmark_load.sqlite3')
+    args = parser.parse_args()
+
+    env = {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': 'backend.settings',
+        'DB_ENGINE': 'django.db.backends.sqlite3',
+        'DB_NAME': args.db,
+        'DEBUG': 'False',
+        'USE_MINIO': 'False',
+        'PROFILING_SAMPLE_RATE': '0',
+        'LOG_LEVEL': 'WARNING',
+        # UserRateThrottle counts anonymous clients by IP too.
+        'RATE_LIMIT_ANON': '100000000/day',
+        'RATE_LIMIT_USER': '100000000/day',
+        'CATALOG_CACHE_TIMEOUT': str(args.cache_timeout),
+        'CACHE_BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'CACHE_LOCATION': os.getenv('CACHE_LOCATION', '/tmp/benchmark_load_cache'),
+        'GUNICORN_MAX_REQUESTS': '0',
+    }
+    os.environ.update(env)
+    session_ids = seed(args.sessions)
+
+    rows = []
+    for name in args.servers:
+        port = free_port()
+        # Only the ASGI entry point turns the async views on.
+        server_env = {**env, 'ASYNC_READ_VIEWS': 'True' if name == 'gunicorn-asgi' else 'False'}
+        server = subprocess.Popen(
+            SERVERS[name](port, args), cwd=BACKEND_DIR, env=server_env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True,
+        )
+        try:
+            wait_until_up(port)
+            latencies, errors = run_load(port, session_ids, args)
+        finally:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait(timeout=30)
+        latencies.sort()
+        rows.append([
+            name, len(latencies) / args.duration,
+            percentile(latencies, 50), percentile(latencies, 99), errors,
+        ])
+
+    print_table(['server', 'req/s', 'p50 ms', 'p99 ms', 'errors'], rows)
+
+
+def seed(count):
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.utils import timezone
+    from core.models import Booking, Session, User
+
+    call_command('migrate', verbosity=0)
+    if Session.objects.count() < count:
+        creator, _ = User.objects.get_or_create(username='load-creator', defaults={'role': User.CREATOR})
+        students = [User.objects.get_or_create(username=f'load-student-{i}')[0] for i in range(5)]
+        now = timezone.now()
+        sessions = Session.objects.bulk_create([
+            Session(creator=creator, title=f'Session {i}', description='About this session',
+                    date=now + timedelta(days=i), price=10)
+            for i in range(count - Session.objects.count())
+        ])
+        Booking.objects.bulk_create([
+            Booking(user=student, session=session) for session in sessions[:50] for student in students
+        ])
+    return list(Session.objects.values_list('pk', flat=True)[:200])
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/api/sessions/?page_size=1')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f'Server on port {port} did not come up')
+
+
+def run_load(port, session_ids, args):
+    per_process = max(1, args.concurrency // args.client_processes)
+    with ProcessPoolExecutor(args.client_processes) as pool:
+        futures = [
+            pool.submit(client_process, port, session_ids, per_process, args.duration, index)
+            for index in range(args.client_processes)
+        ]
+        latencies, errors = [], 0
+        for future in futures:
+            process_latencies, process_errors = future.result()
+            latencies.extend(process_latencies)
+            errors += process_errors
+    return latencies, errors
+
+
+def client_process(port, session_ids, connections, duration, index):
+    deadline = time.monotonic() + duration
+    with ThreadPoolExecutor(connections) as pool:
+        results = list(pool.map(
+            lambda i: client_connection(port, session_ids, deadline, random.Random(index * 1000 + i)),
+            range(connections),
+        ))
+    return [ms for latencies, _ in results for ms in latencies], sum(errors for _, errors in results)
+
+
+def client_connection(port, session_ids, deadline, rng):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    latencies, errors = [], 0
+    while time.monotonic() < deadline:
+        session_id = rng.choice(session_ids)
+        path = rng.choice([
+            '/api/sessions/?page_size=20',
+            '/api/sessions/?page_size=20&sort=price',
+            f'/api/sessions/{session_id}/',
+            f'/api/sessions/{session_id}/bookings/',
+        ])
+        start = time.perf_counter()
+        try:
+            connection.request('GET', path, headers={'Accept': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            continue
+        if response.status != 200:
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+    connection.close()
+    return latencies, errors
+
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Payload size and latency of full vs compact vs sparse representations.
+
+    python -m benchmarks.payload --sessions 500 --bookings 200
+"""
+import argparse
+from datetime import timedelta
+
+from benchmarks.common import measure, print_table, setup, test_database
+
+DUMMY_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sessions', type=int, default=500)
+    parser.add_argument('--bookings', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+
+    setup()
+    from django.test.utils import override_settings
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+    from core.models import Booking, Session, User
+
+    with test_database(), override_settings(CACHES=DUMMY_CACHE):
+        creator = User.objects.create(username='creator', email='creator@example.com', role=User.CREATOR)
+        student = User.objects.create(username='student', email='student@example.com')
+        now = timezone.now()
+        sessions = Session.objects.bulk_create([
+            Session(
+                creator=creator, title=f'Session {i}', description='Lorem ipsum dolor sit amet. ' * 40,
+                date=now + timedelta(days=i), price=i % 50,
+            )
+            for i in range(args.sessions)
+        ])
+        Booking.objects.bulk_create([Booking(user=student, session=s) for s in sessions[:args.bookings]])
+
+        client = APIClient()
+        client.force_authenticate(student)
+        cases = [
+            ('sessions', '/api/sessions/?page_size=100'),
+            ('sessions', '/api/sessions/?page_size=100&view=compact'),
+            ('sessions', '/api/sessions/?page_size=100&fields=id,title,date,price'),
+            ('my bookings', '/api/bookings/my/'),
+            ('my bookings', '/api/bookings/my/?view=compact'),
+            ('my bookings', '/api/bookings/my/?fields=id,booked_at,session&view=compact'),
+        ]
+        rows = []
+        for name, url in cases:
+            size = len(client.get(url).content)
+            stats = measure(lambda: client.get(url), repeat=args.repeat)
+            rows.append([name, url.split('?', 1)[-1] if '?' in url else '-', size, stats['median'], stats['p95']])
+
+        print_table(['endpoint', 'params', 'bytes', 'median ms', 'p95 ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
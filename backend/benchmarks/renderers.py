@@ -0,0 +1,59 @@
+"""
+Render time and size of SessionListView payloads per renderer.
+
+Serializes N sessions once with SessionSerializer, then times rendering the
+same data with DRF's stdlib JSONRenderer, ORJSONRenderer and (when msgpack
+is installed) MessagePackRenderer.
+
+    python -m benchmarks.renderers --sizes 10 100 1000
+"""
+import argparse
+from datetime import timedelta
+
+from benchmarks.common import measure, print_table, setup, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    setup()
+    from django.utils import timezone
+    from rest_framework.renderers import JSONRenderer
+    from core.models import Session, User
+    from core.renderers import MessagePackRenderer, ORJSONRenderer, msgpack
+    from core.serializers import SessionSerializer
+
+    renderers = [('stdlib json', JSONRenderer()), ('orjson', ORJSONRenderer())]
+    if msgpack is not None:
+        renderers.append(('msgpack', MessagePackRenderer()))
+
+    with test_database():
+        creator = User.objects.create(username='creator', email='creator@example.com', role=User.CREATOR)
+        now = timezone.now()
+        Session.objects.bulk_create([
+            Session(
+                creator=creator, title=f'Session {i}', description='Lorem ipsum dolor sit amet. ' * 10,
+                date=now + timedelta(days=i), price=i % 50,
+            )
+            for i in range(max(args.sizes))
+        ])
+
+        rows = []
+        for size in args.sizes:
+            sessions = Session.objects.select_related('creator').order_by('-created_at', '-id')[:size]
+            data = {'next': None, 'results': SessionSerializer(sessions, many=True).data}
+            baseline = None
+            for name, renderer in renderers:
+                body = renderer.render(data, renderer.media_type, {})
+                stats = measure(lambda: renderer.render(data, renderer.media_type, {}), repeat=args.repeat)
+                baseline = baseline or stats['median']
+                rows.append([size, name, len(body), stats['median'], stats['p95'], baseline / stats['median']])
+
+        print_table(['rows', 'renderer', 'bytes', 'median ms', 'p95 ms', 'speedup'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Search latency as the session table grows.
+
+Compares the indexed full-text search (first page, ranked) against a naive
+``icontains`` scan at each table size. The queried terms are planted in a
+fixed number of sessions, so the result set stays the same while the table
+grows: indexed latency should stay roughly flat, while the scan grows
+linearly. Ranking cost itself scales with the number of matches, not with
+the table size.
+
+    python -m benchmarks.search --sizes 1000 10000 100000 300000
+"""
+import argparse
+import random
+from datetime import timedelta
+
+from benchmarks.common import measure, print_table, setup, test_database
+
+WORDS = (
+    'python django rust golang painting guitar yoga chess cooking baking '
+    'photography algebra calculus physics chemistry biology history poetry '
+    'marketing finance design drawing piano singing running cycling'
+).split()
+
+
+NEEDLES = 50
+
+
+def populate(Session, creator, start, stop, now):
+    rng = random.Random(start)
+    batch = []
+    for i in range(start, stop):
+        title = ' '.join(rng.sample(WORDS, 3)).title()
+        description = ' '.join(rng.choices(WORDS, k=30))
+        if i < NEEDLES:
+            title = f'{title} Needle'
+            if i % 2:
+                description = f'{description} haystack'
+        batch.append(Session(
+            creator=creator, title=title, description=description,
+            date=now + timedelta(days=i % 365), price=i % 100,
+        ))
+        if len(batch) == 5000:
+            Session.objects.bulk_create(batch)
+            batch = []
+    Session.objects.bulk_create(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 300000])
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+
+    setup()
+    from django.utils import timezone
+    from core.models import Session, User
+    from core.search import search_sessions
+
+    queries = ['needle', 'needle haystack', 'missing']
+
+    with test_database() as connection:
+        print(f'Database: {connection.vendor}')
+        creator = User.objects.create(username='bench', role=User.CREATOR)
+        now = timezone.now()
+        rows = []
+        total = 0
+        for size in sorted(args.sizes):
+            populate(Session, creator, total, size, now)
+            total = size
+            for query in queries:
+                indexed = measure(lambda: list(search_sessions(query).order_by('-rank', '-id')[:20]),
+                                  repeat=args.repeat)
+                scan = measure(lambda: list(Session.objects.filter(title__icontains=query.split()[0])
+                                            .order_by('-created_at')[:20]), repeat=max(3, args.repeat // 5))
+                rows.append([size, query, indexed['median'], indexed['p95'], scan['median']])
+
+        print_table(['rows', 'query', 'fts median ms', 'fts p95 ms', 'icontains median ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
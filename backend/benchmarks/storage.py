@@ -0,0 +1,98 @@
+"""
+Upload throughput of the media storage: stock S3Boto3Storage (one client
+and connection pool per thread, boto3's transfer defaults) vs
+MinIOMediaStorage on the shared client from core.s3.
+
+- large: one large image at a time, multipart above the threshold.
+- small: many small images saved concurrently from a thread pool.
+
+Runs against an in-process moto S3 by default; pass ``--endpoint`` to use a
+real S3 stand-in such as the docker-compose MinIO (network round trips are
+where pooling and parallel parts pay off).
+
+    python -m benchmarks.storage --large-mb 32 --small 400 --threads 16
+    python -m benchmarks.storage --endpoint http://localhost:9000
+"""
+import argparse
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from benchmarks.common import print_table, setup
+
+MB = 1024 * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--endpoint', help='S3 endpoint; defaults to an in-process moto')
+    parser.add_argument('--bucket', default='benchmark-media')
+    parser.add_argument('--large-mb', type=int, nargs='+', default=[16, 64])
+    parser.add_argument('--small', type=int, default=400, help='number of small uploads')
+    parser.add_argument('--small-kb', type=int, default=64)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup()
+    from django.core.files.base import ContentFile
+    from django.test.utils import override_settings
+    from storages.backends.s3boto3 import S3Boto3Storage
+    from core.storage import MinIOMediaStorage
+
+    if args.endpoint:
+        aws = nullcontext()
+        credentials = {'AWS_S3_ENDPOINT_URL': args.endpoint}
+    else:
+        from moto import mock_aws
+        aws = mock_aws()
+        credentials = {'AWS_S3_ENDPOINT_URL': None, 'AWS_ACCESS_KEY_ID': 'bench', 'AWS_SECRET_ACCESS_KEY': 'bench'}
+
+    cases = [('stock S3Boto3Storage', S3Boto3Storage), ('MinIOMediaStorage', MinIOMediaStorage)]
+
+    with aws, override_settings(AWS_STORAGE_BUCKET_NAME=args.bucket, AWS_S3_REGION_NAME='us-east-1',
+                                AWS_DEFAULT_ACL=None, **credentials):
+        client = MinIOMediaStorage().client
+        if args.bucket not in [bucket['Name'] for bucket in client.list_buckets()['Buckets']]:
+            client.create_bucket(Bucket=args.bucket)
+
+        rows = []
+        for size in args.large_mb:
+            payload = os.urandom(size * MB)
+            for name, storage_class in cases:
+                storage = storage_class()
+                best = min(
+                    timed(lambda: storage.save(f'bench/{uuid.uuid4().hex}.jpg', ContentFile(payload)))
+                    for _ in range(args.repeat)
+                )
+                rows.append([f'1 x {size} MB', name, best * 1000, size / best])
+
+        payload = os.urandom(args.small_kb * 1024)
+        for name, storage_class in cases:
+            def burst():
+                # A fresh storage and pool, like a newly started worker.
+                storage = storage_class()
+                with ThreadPoolExecutor(args.threads) as pool:
+                    list(pool.map(
+                        lambda i: storage.save(f'bench/{uuid.uuid4().hex}.jpg', ContentFile(payload)),
+                        range(args.small),
+                    ))
+            best = min(timed(burst) for _ in range(args.repeat))
+            rows.append([
+                f'{args.small} x {args.small_kb} KB, {args.threads} threads', name,
+                best * 1000, args.small * args.small_kb / 1024 / best,
+            ])
+
+        print_table(['uploads', 'storage', 'best ms', 'MB/s'], rows)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Per-request overhead of the throttles: DRF's UserRateThrottle (timestamp
+list per client) vs the sliding-window throttle on each counter store, for
+clients that already made N requests in the current period.
+
+    python -m benchmarks.throttle --history 10 1000 10000
+"""
+import argparse
+import time
+from types import SimpleNamespace
+
+from benchmarks.common import measure, print_table, setup, test_database
+
+RATE = '1000000/day'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--history', type=int, nargs='+', default=[10, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=500)
+    args = parser.parse_args()
+
+    setup()
+    from django.core.cache import cache
+    from django.test.utils import override_settings
+    from rest_framework import throttling
+    from core import throttling as sliding
+
+    class DRFThrottle(throttling.UserRateThrottle):
+        rate = RATE
+
+    class SlidingThrottle(sliding.UserRateThrottle):
+        rate = RATE
+
+    cases = [
+        ('drf UserRateThrottle', DRFThrottle, None),
+        ('sliding window, cache', SlidingThrottle, 'core.throttling.CacheCounterStore'),
+        ('sliding window, database', SlidingThrottle, 'core.throttling.DatabaseCounterStore'),
+    ]
+
+    with test_database():
+        rows = []
+        for history in args.history:
+            for name, throttle_class, store in cases:
+                cache.clear()
+                request = SimpleNamespace(user=SimpleNamespace(pk=history, is_authenticated=True))
+                with override_settings(THROTTLE_STORE=store or 'core.throttling.CacheCounterStore'):
+                    if store is None:
+                        now = time.time()
+                        key = throttle_class().get_cache_key(request, None)
+                        cache.set(key, [now - i * 0.001 for i in range(history)], 86400)
+                    else:
+                        for _ in range(min(history, 50)):
+                            throttle_class().allow_request(request, None)
+                    stats = measure(lambda: throttle_class().allow_request(request, None), repeat=args.repeat)
+                rows.append([history, name, stats['median'] * 1000, stats['p95'] * 1000])
+
+        print_table(['prior requests', 'throttle', 'median us', 'p95 us'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,32 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_index(sender, using, **kwargs):
+    from django.db import connections
+    from .search import ensure_sqlite_triggers
+
+    ensure_sqlite_triggers(connections[using])
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.contrib.auth.signals import user_logged_in
+        from django.db.models.signals import post_delete, post_save
+        from .authentication import invalidate_saved_user
+        from .images import schedule_variants
+        from .last_login import update_last_login
+
+        post_migrate.connect(ensure_search_index, sender=self)
+        # Swap django.contrib.auth's synchronous last_login UPDATE for the
+        # write-behind buffer.
+        user_logged_in.disconnect(dispatch_uid='update_last_login')
+        user_logged_in.connect(update_last_login, dispatch_uid='update_last_login')
+        for model in ('Session', 'User'):
+            post_save.connect(schedule_variants, sender=self.get_model(model))
+        # Token claims and cached snapshots of a changed user go stale.
+        for signal in (post_save, post_delete):
+            signal.connect(invalidate_saved_user, sender=self.get_model('User'))
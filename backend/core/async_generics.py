@@ -0,0 +1,78 @@
+"""
+Async counterparts of DRF's generic read views.
+
+DRF dispatches synchronously, so under ASGI every DRF view runs in a
+thread. These classes keep the request on the event loop instead:
+authentication, permissions and throttling run in a worker thread (they may
+query the database), and the handler uses the async ORM. Everything else
+(filter backends, ``get_queryset``, serializers, paginators, renderers) is
+the same code the sync views use, so the two return identical responses.
+
+Querysets must select every relation the serializer reads; a lazy load in
+async context raises ``SynchronousOnlyOperation``.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from rest_framework import generics
+from rest_framework.response import Response
+
+
+class AsyncAPIViewMixin:
+    async def dispatch(self, request, *args, **kwargs):
+        # Mirrors APIView.dispatch.
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        if hasattr(self.paginator, 'apaginate_queryset'):
+            return await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+        return await sync_to_async(self.paginator.paginate_queryset)(queryset, self.request, view=self)
+
+    async def aget_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+
+class AsyncListAPIView(AsyncAPIViewMixin, generics.GenericAPIView):
+    async def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        objects = [obj async for obj in queryset]
+        return Response(self.get_serializer(objects, many=True).data)
+
+
+class AsyncRetrieveAPIView(AsyncAPIViewMixin, generics.GenericAPIView):
+    async def get(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        return Response(self.get_serializer(instance).data)
@@ -0,0 +1,215 @@
+"""
+JWT authentication that resolves ``request.user`` without a database query.
+
+Tokens issued through ``ClaimsRefreshToken`` carry the claims permission
+checks need (``role``, ``username``) and the time they were taken
+(``claims_at``). ``ClaimsJWTAuthentication`` builds the user from those
+claims, or from a small per-process TTL cache, as a ``User`` instance whose
+other columns are deferred; the first access to one of them loads the rest
+of the row in a single query.
+
+Saving a ``User`` (other than with ``update_fields`` that miss the
+snapshot columns) or deleting one calls ``invalidate_user()``: it drops this
+process's cached entry and records the change in the shared cache, so
+tokens whose claims predate it, and other processes' cached snapshots, fall
+back to the database. ``QuerySet.update()`` sends no signal; call
+``invalidate_user()`` after it. The refresh endpoint re-reads the claims, so
+refreshed access tokens carry the current ones.
+
+The markers only reach other worker processes through a shared cache
+(Redis, Memcached); gunicorn.conf.py refuses to start several workers on a
+process-local one.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.db import router
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .last_login import record_login
+from .models import User
+
+CLAIM_FIELDS = ('username', 'role')
+SNAPSHOT_FIELDS = ('id', 'is_active', *CLAIM_FIELDS)
+CHANGED_KEY = 'auth-user-changed:{}'
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """Refresh token whose access tokens carry the user's role claims."""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token.set_claims(user)
+        return token
+
+    def set_claims(self, user):
+        for field in CLAIM_FIELDS:
+            self[field] = getattr(user, field)
+        # Access tokens get a new "iat" but copy these claims, so staleness
+        # is judged against the time the claims were read.
+        self['claims_at'] = time.time()
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        # UPDATE_LAST_LOGIN is off; the write goes through the buffer.
+        record_login(self.user)
+        return data
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refresh that mints access tokens with the user's current claims."""
+    token_class = ClaimsRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.filter(
+            **{api_settings.USER_ID_FIELD: refresh.payload.get(api_settings.USER_ID_CLAIM)}
+        ).first()
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        refresh.set_claims(user)
+        # The parent checks the user again and handles rotation.
+        return super().validate({**attrs, 'refresh': str(refresh)})
+
+
+class UserClaimsCache:
+    """Per-process LRU of user snapshots, bounded in size and age."""
+
+    def __init__(self, ttl=None, max_entries=None, clock=time.monotonic):
+        self.ttl = ttl if ttl is not None else getattr(settings, 'AUTH_USER_CACHE_TTL', 60)
+        self.max_entries = max_entries or getattr(settings, 'AUTH_USER_CACHE_MAX_ENTRIES', 10000)
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, user_id, claims_at, changed_at=None):
+        """The snapshot, unless it expired or predates ``changed_at``."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, cached_claims_at, read_at, snapshot = entry
+            if (expires_at <= self.clock() or cached_claims_at != claims_at
+                    or (changed_at is not None and read_at <= changed_at)):
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return snapshot
+
+    def set(self, user_id, claims_at, snapshot, read_at=None):
+        with self._lock:
+            read_at = read_at if read_at is not None else time.time()
+            self._entries[user_id] = (self.clock() + self.ttl, claims_at, read_at, snapshot)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+@lru_cache(maxsize=None)
+def get_user_cache():
+    return UserClaimsCache()
+
+
+@receiver(setting_changed)
+def _reset_user_cache(setting, **kwargs):
+    if setting.startswith('AUTH_USER_CACHE_'):
+        get_user_cache.cache_clear()
+
+
+def invalidate_user(user_or_id):
+    """Forget cached claims for a user after their role, username or status changed."""
+    user_id = getattr(user_or_id, 'pk', user_or_id)
+    get_user_cache().delete(user_id)
+    # Refresh tokens keep minting access tokens with the old claims, so the
+    # marker has to outlive them.
+    timeout = api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()
+    cache.set(CHANGED_KEY.format(user_id), time.time(), timeout)
+
+
+def invalidate_saved_user(sender, instance, created=False, update_fields=None, **kwargs):
+    """``post_save``/``post_delete`` receiver for ``User``."""
+    if created or (update_fields is not None and not set(update_fields) & set(SNAPSHOT_FIELDS)):
+        return
+    invalidate_user(instance)
+
+
+def build_user(snapshot):
+    """A ``User`` holding only the snapshot columns; the rest are deferred."""
+    # from_db() expects the values in model field order.
+    field_names = [f.attname for f in User._meta.concrete_fields if f.attname in snapshot]
+    user = User.from_db(router.db_for_read(User), field_names, [snapshot[name] for name in field_names])
+    user._from_claims = True
+    return user
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    Drop-in replacement for ``JWTAuthentication`` that only reads the user
+    row for tokens without claims (issued before this class was enabled) or
+    whose claims were invalidated.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            # The claim is serialized as a string; key caches by the real pk.
+            user_id = User._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        claims_at = validated_token.get('claims_at')
+        # Set by invalidate_user() in whichever process made the change.
+        changed_at = cache.get(CHANGED_KEY.format(user_id))
+        user_cache = get_user_cache()
+        snapshot = user_cache.get(user_id, claims_at, changed_at)
+        if snapshot is None:
+            read_at = time.time()
+            snapshot = self.snapshot_from_token(validated_token, user_id, claims_at, changed_at)
+            if snapshot is None:
+                snapshot = self.snapshot_from_db(user_id)
+            user_cache.set(user_id, claims_at, snapshot, read_at)
+
+        if not snapshot['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return build_user(snapshot)
+
+    def snapshot_from_token(self, validated_token, user_id, claims_at, changed_at):
+        if claims_at is None or any(field not in validated_token for field in CLAIM_FIELDS):
+            return None
+        if changed_at is not None and claims_at <= changed_at:
+            return None
+        # Tokens are only issued (and refreshed) for active users;
+        # deactivation goes through invalidate_user() and the database path.
+        snapshot = {'id': user_id, 'is_active': True}
+        snapshot.update((field, validated_token[field]) for field in CLAIM_FIELDS)
+        return snapshot
+
+    def snapshot_from_db(self, user_id):
+        snapshot = User.objects.filter(
+            **{api_settings.USER_ID_FIELD: user_id}
+        ).values(*SNAPSHOT_FIELDS).first()
+        if snapshot is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        return snapshot
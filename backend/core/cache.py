@@ -0,0 +1,156 @@
+"""
+Versioned response cache for the public session catalog.
+
+Every cached response is keyed on a catalog version counter. Writes that can
+change what the catalog shows bump the counter instead of hunting down
+individual keys, so stale entries are simply never read again and expire on
+their own. Works with any Django cache backend; use a shared one (Redis,
+Memcached) in production so all workers see the same version.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .db_router import reads_from_primary, replica_pin_seconds
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_BUMPED_KEY = 'catalog:bumped-at'
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def get_catalog_version():
+    cache = get_cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Seed from the clock rather than 1, so a counter lost to eviction or
+        # a cache restart never reuses a version that older entries live under.
+        cache.add(CATALOG_VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+async def aget_catalog_version():
+    cache = get_cache()
+    version = await cache.aget(CATALOG_VERSION_KEY)
+    if version is None:
+        await cache.aadd(CATALOG_VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        version = await cache.aget(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """
+    Invalidate every cached catalog response once the current transaction
+    commits. Bumping earlier would let a concurrent reader cache the
+    pre-write rows under the new version.
+    """
+    transaction.on_commit(_incr_catalog_version)
+
+
+def _incr_catalog_version():
+    cache = get_cache()
+    cache.set(CATALOG_BUMPED_KEY, time.time(), timeout=replica_pin_seconds())
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        get_catalog_version()
+
+
+def may_cache_entry():
+    """
+    Whether a catalog response just built may be cached. A replica can lag
+    the last catalog write by up to ``REPLICA_PIN_SECONDS``; until then only
+    responses read from the primary are cached, or a stale one would be
+    served under the new version until it expired. The marker lives in the
+    catalog cache, which must be shared with replicas configured.
+    """
+    return reads_from_primary() or get_cache().get(CATALOG_BUMPED_KEY) is None
+
+
+async def amay_cache_entry():
+    return reads_from_primary() or await get_cache().aget(CATALOG_BUMPED_KEY) is None
+
+
+def make_etag(data, media_type):
+    payload = json.dumps(data, default=str, separators=(',', ':'))
+    digest = hashlib.sha256(f'{media_type}\n{payload}'.encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+class CatalogCacheMixin:
+    """
+    Serve GET requests from the versioned catalog cache, with strong ETags.
+
+    A request whose ``If-None-Match`` matches the cached entry is answered
+    with 304 straight from the cache, without touching the ORM.
+    """
+    def get(self, request, *args, **kwargs):
+        cache = get_cache()
+        # Read the version before the queryset so that a write committing
+        # mid-request can only leave this response under an outdated key.
+        key = self.get_catalog_cache_key(request, get_catalog_version())
+        entry = cache.get(key)
+
+        if entry is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            entry = self.make_catalog_entry(request, response)
+            if may_cache_entry():
+                cache.set(key, entry, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+        return self.catalog_response(request, entry)
+
+    def make_catalog_entry(self, request, response):
+        return (make_etag(response.data, request.accepted_media_type), response.data)
+
+    def catalog_response(self, request, entry):
+        etag, data = entry
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and self.etag_matches(etag, if_none_match):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+    def get_catalog_cache_key(self, request, version):
+        url = request.build_absolute_uri()
+        digest = hashlib.sha256(f'{request.accepted_media_type}\n{url}'.encode()).hexdigest()
+        return f'catalog:{version}:{digest}'
+
+    def etag_matches(self, etag, header):
+        etags = parse_etags(header)
+        return '*' in etags or etag in etags or f'W/{etag}' in etags
+
+
+class AsyncCatalogCacheMixin(CatalogCacheMixin):
+    """``CatalogCacheMixin`` for async views: a cache hit never leaves the event loop."""
+
+    async def get(self, request, *args, **kwargs):
+        cache = get_cache()
+        key = self.get_catalog_cache_key(request, await aget_catalog_version())
+        entry = await cache.aget(key)
+
+        if entry is None:
+            # Skip CatalogCacheMixin.get and call the async view's handler.
+            response = await super(CatalogCacheMixin, self).get(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            entry = self.make_catalog_entry(request, response)
+            if await amay_cache_entry():
+                await cache.aset(key, entry, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+        return self.catalog_response(request, entry)
@@ -0,0 +1,138 @@
+"""
+Primary/replica database routing with read-your-writes stickiness.
+
+``PrimaryReplicaRouter`` sends every write to ``default`` (the primary) and
+reads to a random alias in ``DATABASE_REPLICAS``. Reads stay on the primary:
+
+- outside a request (management commands, background threads),
+- for the rest of a request once it has written, and for the whole of an
+  unsafe (POST, PUT, PATCH, DELETE) request, so read-modify-write sees
+  current rows,
+- for ``PRIMARY_ONLY_MODELS``, which are read back right after every write,
+- for a user who wrote within the last ``REPLICA_PIN_SECONDS``, so they see
+  their own change while the replicas catch up. The pin is a cache key per
+  user, set by ``ReplicaPinMiddleware`` when the request finishes, so the
+  default cache must be shared by every worker; settings refuses
+  ``DB_REPLICA_HOSTS`` with a process-local one.
+
+Only authenticated users are pinned: the user is whoever DRF authenticated,
+which the middleware reads back from the request after the view ran.
+"""
+import contextvars
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.functional import LazyObject, empty
+from rest_framework.permissions import SAFE_METHODS
+
+# Rows read back straight after they are written on every request.
+PRIMARY_ONLY_MODELS = {'core.throttlecounter', 'sessions.session'}
+
+_routing = contextvars.ContextVar('db_routing', default=None)
+
+
+def replica_pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+
+
+def pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+class RequestRouting:
+    """Where the current request's reads go."""
+
+    def __init__(self, request):
+        self.request = request
+        self.primary = request.method not in SAFE_METHODS
+        self.wrote = False
+        self.checked_user = None
+
+    def use_primary(self):
+        if not self.primary:
+            user_id = self.user_id()
+            if user_id is not None and user_id != self.checked_user:
+                self.checked_user = user_id
+                self.primary = cache.get(pin_key(user_id)) is not None
+        return self.primary
+
+    def user_id(self):
+        user = getattr(self.request, 'user', None)
+        # Don't resolve a lazy session user from inside the router: that
+        # would query, and route, again.
+        if isinstance(user, LazyObject) and user._wrapped is empty:
+            return None
+        if user is None or not user.is_authenticated:
+            return None
+        return user.pk
+
+    def pin(self):
+        user_id = self.user_id()
+        if self.wrote and user_id is not None:
+            cache.set(pin_key(user_id), 1, replica_pin_seconds())
+
+
+def reads_from_primary():
+    """Whether reads made now go to the primary (they do without replicas)."""
+    routing = _routing.get()
+    if not getattr(settings, 'DATABASE_REPLICAS', None) or routing is None:
+        return True
+    return routing.primary
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', None)
+        routing = _routing.get()
+        if (not replicas or routing is None or model._meta.label_lower in PRIMARY_ONLY_MODELS
+                or routing.use_primary()):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None and model._meta.label_lower not in PRIMARY_ONLY_MODELS:
+            routing.wrote = routing.primary = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+
+class ReplicaPinMiddleware:
+    """Track each request's routing and pin users who wrote to the primary."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        routing = RequestRouting(request)
+        token = _routing.set(routing)
+        try:
+            response = self.get_response(request)
+            routing.pin()
+        finally:
+            _routing.reset(token)
+        return response
+
+    async def __acall__(self, request):
+        routing = RequestRouting(request)
+        token = _routing.set(routing)
+        try:
+            response = await self.get_response(request)
+            if routing.wrote:
+                await sync_to_async(routing.pin)()
+        finally:
+            _routing.reset(token)
+        return response
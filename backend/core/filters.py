@@ -0,0 +1,75 @@
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+class SessionFilterSerializer(serializers.Serializer):
+    date_after = serializers.DateTimeField(required=False)
+    date_before = serializers.DateTimeField(required=False)
+    price_min = serializers.DecimalField(max_digits=8, decimal_places=2, required=False)
+    price_max = serializers.DecimalField(max_digits=8, decimal_places=2, required=False)
+    creator = serializers.IntegerField(required=False, min_value=1)
+    upcoming = serializers.BooleanField(required=False, default=False)
+
+
+class SessionFilterBackend(BaseFilterBackend):
+    """
+    Server-side filters for the session catalog.
+
+    ?date_after= / ?date_before=   range on Session.date (ISO 8601)
+    ?price_min= / ?price_max=      range on Session.price
+    ?creator=<id>                  sessions of one creator
+    ?upcoming=true                 sessions that have not started yet
+    """
+    def filter_queryset(self, request, queryset, view):
+        params = SessionFilterSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        filters = params.validated_data
+
+        if 'date_after' in filters:
+            queryset = queryset.filter(date__gte=filters['date_after'])
+        if 'date_before' in filters:
+            queryset = queryset.filter(date__lte=filters['date_before'])
+        if filters['upcoming']:
+            queryset = queryset.filter(date__gte=timezone.now())
+        if 'price_min' in filters:
+            queryset = queryset.filter(price__gte=filters['price_min'])
+        if 'price_max' in filters:
+            queryset = queryset.filter(price__lte=filters['price_max'])
+        if 'creator' in filters:
+            queryset = queryset.filter(creator_id=filters['creator'])
+        return queryset
+
+
+class SessionOrderingFilter(BaseFilterBackend):
+    """
+    ?sort=date|-date|price|-price|popularity (newest first by default).
+
+    Every ordering ends on ``id`` so it is unique, which keyset pagination
+    relies on; ``KeysetPagination`` picks the ordering up from here.
+    """
+    sort_param = 'sort'
+    default_sort = 'newest'
+    orderings = {
+        'newest': ('-created_at', '-id'),
+        'date': ('date', 'id'),
+        '-date': ('-date', '-id'),
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+        'popularity': ('-bookings_count', '-id'),
+    }
+
+    def get_sort(self, request):
+        sort = request.query_params.get(self.sort_param, self.default_sort)
+        if sort not in self.orderings:
+            raise ValidationError({
+                self.sort_param: f"Unknown sort '{sort}'. Choose from: {', '.join(self.orderings)}."
+            })
+        return sort
+
+    def get_ordering(self, request, queryset, view):
+        return self.orderings[self.get_sort(request)]
+
+    def filter_queryset(self, request, queryset, view):
+        return queryset.order_by(*self.get_ordering(request, queryset, view))
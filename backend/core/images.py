@@ -0,0 +1,131 @@
+"""
+Resized WebP/AVIF variants of uploaded images.
+
+When a ``Session.image`` or ``User.avatar`` is saved with a new file, a
+``post_save`` receiver queues ``generate_variants`` on a background thread
+pool once the transaction commits. The job writes one file per width and
+format next to the original (``photo.jpg`` -> ``photo.w640.webp``) and
+records them in the model's ``*_variants`` JSON field:
+
+    {"source": "photo.jpg", "formats": {"webp": {"320": "photo.w320.webp"}}}
+
+``variant_srcsets()`` turns that into ``srcset`` strings for the API.
+With ``IMAGE_VARIANTS_SYNC = True`` jobs run inline when the transaction
+commits instead, which is what the tests use.
+
+Queued jobs live only in the worker process, so a restart drops them; the
+``backfill_image_variants`` command (the ``image-variants`` job in
+docker-compose.yml) regenerates whatever is missing.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps, features
+
+from .cache import bump_catalog_version
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WIDTHS = (320, 640, 1280)
+FORMATS = {'avif': ('AVIF', {'quality': 60}), 'webp': ('WEBP', {'quality': 80, 'method': 4})}
+
+# model label -> (image field, variants field)
+IMAGE_FIELDS = {
+    'core.session': ('image', 'image_variants'),
+    'core.user': ('avatar', 'avatar_variants'),
+}
+
+
+def enabled_formats():
+    return [name for name in FORMATS if features.check(name)]
+
+
+def variant_name(name, width, fmt):
+    stem, _ = os.path.splitext(name)
+    return f'{stem}.w{width}.{fmt}'
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=getattr(settings, 'IMAGE_VARIANT_WORKERS', 2),
+        thread_name_prefix='image-variants',
+    )
+
+
+def schedule_variants(sender, instance, **kwargs):
+    """``post_save`` receiver: queue variants for a newly uploaded image."""
+    image_field, variants_field = IMAGE_FIELDS[sender._meta.label_lower]
+    name = getattr(instance, image_field).name
+    variants = getattr(instance, variants_field, None) or {}
+    if not name or variants.get('source') == name:
+        return
+
+    label, pk = sender._meta.label_lower, instance.pk
+    if getattr(settings, 'IMAGE_VARIANTS_SYNC', False):
+        transaction.on_commit(lambda: generate_variants(label, pk, name))
+    else:
+        transaction.on_commit(lambda: get_executor().submit(run_in_worker, label, pk, name))
+
+
+def run_in_worker(label, pk, name):
+    try:
+        generate_variants(label, pk, name)
+    except Exception:
+        logger.exception("Failed to generate image variants for %s %s", label, pk)
+    finally:
+        connections.close_all()
+
+
+def generate_variants(label, pk, name):
+    model = apps.get_model(label)
+    image_field, variants_field = IMAGE_FIELDS[label]
+    storage = model._meta.get_field(image_field).storage
+    widths = getattr(settings, 'IMAGE_VARIANT_WIDTHS', DEFAULT_WIDTHS)
+
+    with storage.open(name) as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+
+    # Never upscale: widths above the original collapse into the original.
+    targets = sorted({min(width, image.width) for width in widths})
+    formats = {}
+    for width in targets:
+        resized = image
+        if width < image.width:
+            resized = image.resize((width, round(image.height * width / image.width)), Image.Resampling.LANCZOS)
+        for fmt in enabled_formats():
+            pil_format, options = FORMATS[fmt]
+            buffer = BytesIO()
+            resized.save(buffer, pil_format, **options)
+            saved = storage.save(variant_name(name, width, fmt), ContentFile(buffer.getvalue()))
+            formats.setdefault(fmt, {})[str(width)] = saved
+
+    # Only attach the variants if the image was not replaced meanwhile.
+    updated = model._base_manager.filter(pk=pk, **{image_field: name}).update(
+        **{variants_field: {'source': name, 'formats': formats}}
+    )
+    if updated:
+        # Sessions show their image and embed their creator's avatar.
+        bump_catalog_version()
+    return formats
+
+
+def variant_srcsets(file, variants):
+    """``{format: "url 320w, url 640w"}`` for the variants of ``file``."""
+    if not file or not variants or variants.get('source') != file.name:
+        return {}
+    storage = file.storage
+    return {
+        fmt: ', '.join(f'{storage.url(name)} {width}w' for width, name in sorted(sizes.items(), key=lambda i: int(i[0])))
+        for fmt, sizes in variants.get('formats', {}).items()
+    }
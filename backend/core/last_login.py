@@ -0,0 +1,153 @@
+"""
+Write-behind buffer for ``User.last_login``.
+
+Every login used to ``UPDATE`` the user row on the request path. Logins are
+now recorded in a per-process buffer that keeps the latest timestamp per
+user and writes them in bulk from a background thread, every
+``LAST_LOGIN_FLUSH_INTERVAL`` seconds or as soon as ``LAST_LOGIN_FLUSH_SIZE``
+users are pending. Whatever is left is flushed when the process exits.
+
+With ``LAST_LOGIN_WRITE_BEHIND = False`` logins are written synchronously,
+which is what tests that assert on ``last_login`` want.
+"""
+import atexit
+import logging
+import os
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+def write_last_logins(pending):
+    """
+    Store ``{user_id: timestamp}`` with one UPDATE per batch. A timestamp
+    never moves ``last_login`` backwards, so buffers of several workers can
+    flush in any order.
+    """
+    items = sorted(pending.items())
+    for start in range(0, len(items), BATCH_SIZE):
+        batch = items[start:start + BATCH_SIZE]
+        latest = Case(
+            *[When(pk=user_id, then=Value(when)) for user_id, when in batch],
+            output_field=DateTimeField(),
+        )
+        User.objects.filter(pk__in=[user_id for user_id, _ in batch]).update(
+            last_login=Greatest(Coalesce(F('last_login'), latest), latest),
+        )
+
+
+class LastLoginBuffer:
+    def __init__(self, interval=None, max_size=None):
+        self.interval = interval or getattr(settings, 'LAST_LOGIN_FLUSH_INTERVAL', 5)
+        self.max_size = max_size or getattr(settings, 'LAST_LOGIN_FLUSH_SIZE', 500)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        atexit.register(self.close)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def record(self, user_id, when):
+        with self._lock:
+            previous = self._pending.get(user_id)
+            if previous is None or when > previous:
+                self._pending[user_id] = when
+            full = len(self._pending) >= self.max_size
+        self._ensure_worker()
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            write_last_logins(pending)
+        except Exception:
+            # Put the timestamps back (newer ones recorded meanwhile win) and
+            # let the next flush retry.
+            logger.exception("Failed to flush %d last_login updates", len(pending))
+            with self._lock:
+                for user_id, when in pending.items():
+                    current = self._pending.get(user_id)
+                    if current is None or when > current:
+                        self._pending[user_id] = when
+            return 0
+        return len(pending)
+
+    def close(self):
+        """Stop the worker and flush what is left; safe to call twice."""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.interval + 5)
+        self.flush()
+
+    def _ensure_worker(self):
+        # A forked worker inherits the buffer but not the thread.
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='last-login-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                self._wake.wait(self.interval)
+                self._wake.clear()
+                # close() does the final flush from its own thread.
+                if self._stopping.is_set():
+                    break
+                self.flush()
+        finally:
+            connections.close_all()
+
+
+@lru_cache(maxsize=None)
+def get_last_login_buffer():
+    return LastLoginBuffer()
+
+
+@receiver(setting_changed)
+def _reset_buffer(setting, **kwargs):
+    if setting.startswith('LAST_LOGIN_') and get_last_login_buffer.cache_info().currsize:
+        get_last_login_buffer().close()
+        get_last_login_buffer.cache_clear()
+
+
+def record_login(user, when=None):
+    """Set ``user.last_login`` now and persist it, behind or in line."""
+    when = when or timezone.now()
+    user.last_login = when
+    if getattr(settings, 'LAST_LOGIN_WRITE_BEHIND', True):
+        get_last_login_buffer().record(user.pk, when)
+    else:
+        write_last_logins({user.pk: when})
+
+
+def update_last_login(sender, user, **kwargs):
+    """``user_logged_in`` receiver replacing django.contrib.auth's."""
+    record_login(user)
@@ -0,0 +1,37 @@
+"""
+Logging helpers wired up in ``settings.LOGGING``.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record, with any ``profile`` extra merged in."""
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        data.update(getattr(record, 'profile', {}))
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class QueuedStreamHandler(logging.handlers.QueueHandler):
+    """
+    Stream handler whose writes happen on a background thread, so logging
+    from a request never blocks on stdout/stderr.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(queue.SimpleQueue())
+        self.listener = logging.handlers.QueueListener(self.queue, logging.StreamHandler(stream))
+        self.listener.start()
+        atexit.register(self.listener.stop)
@@ -0,0 +1,59 @@
+import logging
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from core.images import IMAGE_FIELDS, generate_variants
+
+logger = logging.getLogger(__name__)
+
+
+def missing_variants(label, batch_size):
+    """``(pk, name)`` of every row whose image has no variants for it yet."""
+    image_field, variants_field = IMAGE_FIELDS[label]
+    rows = (
+        apps.get_model(label)._base_manager.exclude(**{image_field: ''})
+        .exclude(**{f'{image_field}__isnull': True})
+        .order_by('pk')
+        .values_list('pk', image_field, variants_field)
+    )
+    last_pk = 0
+    while True:
+        # Seek by primary key so no cursor is held open while generating.
+        batch = list(rows.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        for pk, name, variants in batch:
+            if (variants or {}).get('source') != name:
+                yield pk, name
+        last_pk = batch[-1][0]
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the image variants missing for any Session.image or User.avatar, e.g. jobs "
+        "lost when a worker restarted before its background thread pool ran them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help="Report missing variants without generating them.")
+
+    def handle(self, *args, batch_size, dry_run, **options):
+        generated = failed = 0
+        for label in IMAGE_FIELDS:
+            for pk, name in missing_variants(label, batch_size):
+                if dry_run:
+                    generated += 1
+                    continue
+                try:
+                    generate_variants(label, pk, name)
+                except Exception:
+                    # A missing or unreadable original; leave it for next time.
+                    logger.exception("Failed to generate image variants for %s %s", label, pk)
+                    failed += 1
+                else:
+                    generated += 1
+
+        verb = 'Found' if dry_run else 'Generated'
+        self.stdout.write(self.style.SUCCESS(f"{verb} variants for {generated} image(s), {failed} failed."))
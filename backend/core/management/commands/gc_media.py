@@ -0,0 +1,128 @@
+import heapq
+import tempfile
+from datetime import timedelta
+from itertools import islice
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.images import IMAGE_FIELDS
+from core.s3 import get_client, option
+
+
+def referenced_names(run_size):
+    """
+    Every media name the database points at, sorted and unique.
+
+    Originals and their variants are read in one pass per model, sorted in
+    runs of ``run_size`` spilled to temporary files, and merged back, so
+    memory stays bounded however many rows there are. Python string order
+    is code point order, the same as S3's UTF-8 byte order for listings.
+    """
+    def names():
+        for label, (image_field, variants_field) in IMAGE_FIELDS.items():
+            rows = (
+                apps.get_model(label)._base_manager.exclude(**{image_field: ''})
+                .exclude(**{f'{image_field}__isnull': True})
+                .values_list(image_field, variants_field).iterator(chunk_size=2000)
+            )
+            for name, variants in rows:
+                yield name
+                for sizes in (variants or {}).get('formats', {}).values():
+                    yield from sizes.values()
+
+    runs = []
+    stream = (name.lstrip('/') for name in names())
+    try:
+        while run := sorted(set(islice(stream, run_size))):
+            spill = tempfile.TemporaryFile('w+', encoding='utf-8')
+            runs.append(spill)
+            spill.writelines(f'{name}\n' for name in run)
+            spill.seek(0)
+        previous = None
+        for name in heapq.merge(*((line.rstrip('\n') for line in run) for run in runs)):
+            if name != previous:
+                yield name
+                previous = name
+    finally:
+        for spill in runs:
+            spill.close()
+
+
+def bucket_objects(client, bucket, prefix=''):
+    """``(key, last_modified, size)`` for every object, in key order."""
+    for page in client.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            yield obj['Key'], obj['LastModified'], obj['Size']
+
+
+def orphaned(objects, referenced):
+    """Merge-join two sorted streams: objects no name refers to."""
+    referenced = iter(referenced)
+    current = next(referenced, None)
+    for obj in objects:
+        key = obj[0]
+        while current is not None and current < key:
+            current = next(referenced, None)
+        if current != key:
+            yield obj
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete bucket objects that no Session.image, User.avatar or image variant refers to "
+        "and that are older than the grace period."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bucket', default=None)
+        parser.add_argument('--prefix', default='')
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help="Keep orphans younger than this (uploads not yet attached, variants in progress).")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Keys per delete request (max 1000).")
+        parser.add_argument('--run-size', type=int, default=100_000, help="Names sorted in memory at once.")
+        parser.add_argument('--dry-run', action='store_true', help="Report orphans without deleting them.")
+
+    def handle(self, *args, bucket, prefix, grace_hours, batch_size, run_size, dry_run, **options):
+        self.verbosity = options['verbosity']
+        client = get_client()
+        bucket = bucket or option('AWS_STORAGE_BUCKET_NAME')
+        batch_size = max(1, min(batch_size, 1000))
+        # Taken before the scan, so objects written during it are always young.
+        cutoff = timezone.now() - timedelta(hours=grace_hours)
+
+        stats = dict.fromkeys(('orphans', 'young', 'bytes', 'deleted'), 0)
+        objects = bucket_objects(client, bucket, prefix)
+        batch = []
+        for key, last_modified, size in orphaned(objects, referenced_names(run_size)):
+            if last_modified > cutoff:
+                stats['young'] += 1
+                continue
+            stats['orphans'] += 1
+            stats['bytes'] += size
+            batch.append(key)
+            if len(batch) >= batch_size:
+                stats['deleted'] += self.delete(client, bucket, batch, dry_run)
+                batch = []
+        if batch:
+            stats['deleted'] += self.delete(client, bucket, batch, dry_run)
+
+        verb = 'Would delete' if dry_run else 'Deleted'
+        count = stats['orphans'] if dry_run else stats['deleted']
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {count} orphaned object(s), {stats['bytes'] / 1024 / 1024:.1f} MB; "
+            f"kept {stats['young']} orphan(s) inside the grace period."
+        ))
+
+    def delete(self, client, bucket, keys, dry_run):
+        if dry_run:
+            if self.verbosity > 1:
+                self.stdout.write('\n'.join(f"orphan: {key}" for key in keys))
+            return 0
+        response = client.delete_objects(
+            Bucket=bucket, Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True},
+        )
+        for error in response.get('Errors', []):
+            self.stderr.write(f"Failed to delete {error['Key']}: {error.get('Message')}")
+        return len(keys) - len(response.get('Errors', []))
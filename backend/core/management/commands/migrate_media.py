@@ -0,0 +1,245 @@
+import json
+import mimetypes
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from botocore.exceptions import ClientError
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.cache import bump_catalog_version
+from core.images import IMAGE_FIELDS
+from core.s3 import get_client, option, transfer_config
+from core.storage import content_hashed_name, is_content_hashed, media_cache_control
+
+# Older deployments kept session images under this directory.
+LEGACY_DIRS = ('session-images',)
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy Session.image and User.avatar files (and their variants) from local media or "
+        "legacy keys to the bucket under content-hashed names, as MinIOMediaStorage stores them. "
+        "Legacy objects are left for gc_media. Resumable via a checkpoint file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=str(settings.MEDIA_ROOT), help="Local media directory.")
+        parser.add_argument('--bucket', default=None)
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--checkpoint', default='migrate_media.checkpoint.json')
+        parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint and start over.")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would happen without writing.")
+        parser.add_argument('--models', nargs='+', default=list(IMAGE_FIELDS), choices=list(IMAGE_FIELDS))
+
+    def handle(self, *args, source, bucket, workers, batch_size, checkpoint, restart, dry_run, models, **options):
+        self.source = source
+        self.bucket = bucket or option('AWS_STORAGE_BUCKET_NAME')
+        self.acl = getattr(settings, 'AWS_DEFAULT_ACL', 'public-read')
+        self.dry_run = dry_run
+        self.client = get_client()
+        self.transfer_config = transfer_config()
+        self.checkpoint_path = checkpoint
+        self.checkpoint = {} if restart or dry_run else self.load_checkpoint()
+
+        with ThreadPoolExecutor(workers, thread_name_prefix='migrate-media') as pool:
+            for label in models:
+                self.migrate_model(label, pool, batch_size)
+
+    def migrate_model(self, label, pool, batch_size):
+        model = apps.get_model(label)
+        image_field, variants_field = IMAGE_FIELDS[label]
+        after = self.checkpoint.get(label, 0)
+        rows = (
+            model._base_manager.filter(pk__gt=after).exclude(**{image_field: ''})
+            .exclude(**{f'{image_field}__isnull': True})
+            .only('pk', image_field, variants_field).order_by('pk')
+            .iterator(chunk_size=batch_size)
+        )
+
+        totals = dict.fromkeys(('rows', 'uploaded', 'copied', 'present', 'missing', 'failed', 'bytes'), 0)
+        start = time.perf_counter()
+        changed = False
+        while batch := list(islice(rows, batch_size)):
+            results = list(pool.map(lambda row: self.migrate_row(row, image_field, variants_field), batch))
+
+            updates, resume_after = [], None
+            for index, (row, (status, nbytes)) in enumerate(zip(batch, results)):
+                totals['rows'] += 1
+                totals['bytes'] += nbytes
+                for outcome in status:
+                    totals[outcome] += 1
+                if 'failed' in status:
+                    if resume_after is None:
+                        resume_after = batch[index - 1].pk if index else self.checkpoint.get(label, 0)
+                elif getattr(row, '_migrated', False):
+                    updates.append(row)
+
+            if updates and not self.dry_run:
+                # Sessions show their image and embed their creator's avatar.
+                changed = self.save_rows(model, updates, image_field, variants_field) or changed
+            self.report(label, totals, start)
+
+            if resume_after is not None:
+                # Rows after the first failure are safe to redo on resume.
+                self.save_checkpoint(label, resume_after)
+                if changed:
+                    bump_catalog_version()
+                raise CommandError(f"{totals['failed']} file(s) failed for {label}; rerun to resume.")
+            self.save_checkpoint(label, batch[-1].pk)
+
+        if changed:
+            bump_catalog_version()
+        self.report(label, totals, start, done=True)
+
+    def save_rows(self, model, rows, image_field, variants_field):
+        """
+        Write the new names, but only where the row still holds the image
+        that was copied: one replaced meanwhile keeps its new file, and the
+        copies made for the old one are left for gc_media.
+        """
+        saved = 0
+        for row in rows:
+            saved += model._base_manager.filter(pk=row.pk, **{image_field: row._previous_name}).update(**{
+                image_field: getattr(row, image_field).name, variants_field: getattr(row, variants_field),
+            })
+        return saved
+
+    def migrate_row(self, row, image_field, variants_field):
+        """Move one row's image and variants; rename them on ``row`` in place."""
+        file = getattr(row, image_field)
+        directory = row._meta.get_field(image_field).upload_to
+        status, nbytes = [], 0
+
+        outcome, size, new_name = self.migrate_file(file.name, directory)
+        status.append(outcome)
+        nbytes += size
+        if outcome in ('missing', 'failed'):
+            return status, nbytes
+
+        variants = getattr(row, variants_field) or {}
+        if variants.get('source') == file.name:
+            formats = {}
+            for fmt, sizes in variants.get('formats', {}).items():
+                for width, name in sizes.items():
+                    outcome, size, target = self.migrate_file(name, directory)
+                    status.append(outcome)
+                    nbytes += size
+                    if outcome == 'failed':
+                        return status, nbytes
+                    if outcome != 'missing':
+                        formats.setdefault(fmt, {})[width] = target
+            variants = {'source': new_name, 'formats': formats}
+        else:
+            variants = {}
+
+        row._migrated = file.name != new_name or getattr(row, variants_field) != variants
+        row._previous_name = file.name
+        file.name = new_name
+        setattr(row, variants_field, variants)
+        return status, nbytes
+
+    def migrate_file(self, name, directory):
+        """
+        Return (outcome, bytes uploaded, stored name) for one file, stored
+        in ``directory`` under the hash of its content.
+        """
+        name = name.lstrip('/')
+        target = os.path.join(directory, os.path.basename(name))
+        try:
+            local = self.local_path(name)
+            if local:
+                with open(local, 'rb') as fh:
+                    key = content_hashed_name(target, iter(lambda: fh.read(1024 * 1024), b''))
+                if self.exists(key):
+                    return 'present', 0, key
+                if not self.dry_run:
+                    self.client.upload_file(
+                        local, self.bucket, key, ExtraArgs=self.object_args(key), Config=self.transfer_config,
+                    )
+                return 'uploaded', os.path.getsize(local), key
+            if name == target and is_content_hashed(name):
+                # Migrated by an earlier run.
+                return ('present', 0, name) if self.exists(name) else ('missing', 0, None)
+            if not self.exists(name):
+                return 'missing', 0, None
+            body = self.client.get_object(Bucket=self.bucket, Key=name)['Body']
+            with body:
+                key = content_hashed_name(target, body.iter_chunks(1024 * 1024))
+            if self.exists(key):
+                return 'present', 0, key
+            if not self.dry_run:
+                # Replace the metadata: legacy objects lack the immutable
+                # Cache-Control that hashed names are served with. The old
+                # object stays until gc_media finds nothing refers to it.
+                self.client.copy_object(
+                    Bucket=self.bucket, Key=key, CopySource={'Bucket': self.bucket, 'Key': name},
+                    MetadataDirective='REPLACE', **self.object_args(key),
+                )
+            return 'copied', 0, key
+        except (ClientError, OSError) as error:
+            self.stderr.write(f"Failed to migrate {name}: {error}")
+            return 'failed', 0, None
+
+    def object_args(self, key):
+        args = {
+            'ContentType': mimetypes.guess_type(key)[0] or 'application/octet-stream',
+            'CacheControl': media_cache_control(),
+        }
+        if self.acl:
+            args['ACL'] = self.acl
+        return args
+
+    def local_path(self, name):
+        candidates = [name] + [os.path.join(directory, os.path.basename(name)) for directory in LEGACY_DIRS]
+        for candidate in candidates:
+            path = os.path.join(self.source, candidate)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def stored_size(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)['ContentLength']
+        except ClientError as error:
+            if error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def exists(self, key):
+        return self.stored_size(key) is not None
+
+    def load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as fh:
+                checkpoint = json.load(fh)
+        except FileNotFoundError:
+            return {}
+        if checkpoint:
+            self.stdout.write(f"Resuming from {self.checkpoint_path}: {checkpoint}")
+        return checkpoint
+
+    def save_checkpoint(self, label, pk):
+        if self.dry_run:
+            return
+        self.checkpoint[label] = pk
+        tmp = f'{self.checkpoint_path}.tmp'
+        with open(tmp, 'w') as fh:
+            json.dump(self.checkpoint, fh)
+        os.replace(tmp, self.checkpoint_path)
+
+    def report(self, label, totals, start, done=False):
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        files = totals['uploaded'] + totals['copied'] + totals['present']
+        line = (
+            f"{label}: {totals['rows']} rows, {totals['uploaded']} uploaded, {totals['copied']} copied, "
+            f"{totals['present']} present, {totals['missing']} missing, {totals['failed']} failed; "
+            f"{files / elapsed:.1f} files/s, {totals['bytes'] / elapsed / 1024 / 1024:.1f} MB/s"
+        )
+        if self.dry_run:
+            line += ' (dry run)'
+        self.stdout.write(self.style.SUCCESS(line) if done else line)
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from core.cache import bump_catalog_version
+from core.models import Booking, Session
+
+
+def actual_bookings_count():
+    counts = (
+        Booking.objects.filter(session=OuterRef('pk'))
+        .order_by().values('session').annotate(n=Count('pk')).values('n')
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+class Command(BaseCommand):
+    help = "Recompute Session.bookings_count wherever it has drifted from the bookings table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without fixing it.")
+
+    def handle(self, *args, batch_size, dry_run, **options):
+        drifted = (
+            Session.objects.annotate(actual=actual_bookings_count())
+            .exclude(bookings_count=F('actual'))
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+
+        fixed = 0
+        last_pk = 0
+        while True:
+            # Seek by primary key so memory stays bounded and no cursor is
+            # held open across the updates.
+            batch = list(drifted.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            fixed += self.fix(batch, dry_run)
+            last_pk = batch[-1]
+
+        if fixed and not dry_run:
+            bump_catalog_version()
+        verb = 'Found' if dry_run else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {fixed} session(s) with a drifted bookings_count."))
+
+    def fix(self, pks, dry_run):
+        if dry_run:
+            return len(pks)
+        # Recompute in the UPDATE itself so bookings made since the scan count.
+        return Session.objects.filter(pk__in=pks).update(bookings_count=actual_bookings_count())
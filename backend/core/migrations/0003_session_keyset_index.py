@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_session_image'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='session',
+            name='image',
+            field=models.ImageField(blank=True, null=True, upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, upload_to='avatars/'),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['-created_at', '-id'], name='session_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_session_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['date', 'id'], name='session_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['price', 'id'], name='session_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['creator', '-created_at', '-id'], name='session_creator_created_idx'),
+        ),
+    ]
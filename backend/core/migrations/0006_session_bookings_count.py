@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:39
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_bookings_count(apps, schema_editor):
+    Session = apps.get_model('core', 'Session')
+    Booking = apps.get_model('core', 'Booking')
+    counts = (
+        Booking.objects.filter(session=OuterRef('pk'))
+        .order_by().values('session').annotate(n=Count('pk')).values('n')
+    )
+    Session.objects.update(bookings_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_session_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='bookings_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['-bookings_count', '-id'], name='session_popularity_idx'),
+        ),
+        migrations.RunPython(backfill_bookings_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:40
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+from django.db.models.functions import Greatest
+
+
+def delete_duplicate_bookings(apps, schema_editor):
+    """Keep the earliest booking per (user, session) so the constraint applies."""
+    Booking = apps.get_model('core', 'Booking')
+    Session = apps.get_model('core', 'Session')
+    duplicates = (
+        Booking.objects.order_by().values('user', 'session')
+        .annotate(keep=Min('pk'), n=Count('pk')).filter(n__gt=1)
+    )
+    for row in duplicates.iterator():
+        deleted, _ = (
+            Booking.objects.filter(user=row['user'], session=row['session'])
+            .exclude(pk=row['keep']).delete()
+        )
+        Session.objects.filter(pk=row['session']).update(
+            bookings_count=Greatest(F('bookings_count') - deleted, 0)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_session_bookings_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(delete_duplicate_bookings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.UniqueConstraint(fields=('user', 'session'), name='unique_booking_per_user_session'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+from django.core.exceptions import FieldDoesNotExist
+
+
+class SparseFieldsViewMixin:
+    """
+    Query parameters that shape read payloads:
+
+    ?fields=id,title   render only these top-level fields
+    ?view=compact      use ``compact_serializer_class`` (list representation)
+    ?expand=creator    embed the full object for a compact nested field
+
+    Whenever the payload is narrowed, the columns the serializer reads are
+    pushed down into ``QuerySet.only()`` and ``select_related`` is trimmed to
+    the relations that are still rendered.
+    """
+    compact_serializer_class = None
+
+    def get_list_param(self, name):
+        value = self.request.query_params.get(name, '')
+        return [part.strip() for part in value.split(',') if part.strip()]
+
+    def is_compact(self):
+        return (
+            self.compact_serializer_class is not None
+            and self.request.query_params.get('view') == 'compact'
+        )
+
+    def get_serializer_class(self):
+        if self.is_compact():
+            return self.compact_serializer_class
+        return super().get_serializer_class()
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_list_param('fields'))
+        kwargs.setdefault('expand', self.get_list_param('expand'))
+        return super().get_serializer(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        # Applied here rather than in get_queryset() so that views overriding
+        # get_queryset() still get the narrowing.
+        queryset = super().filter_queryset(queryset)
+        if not (self.is_compact() or self.get_list_param('fields')):
+            return queryset
+
+        columns = set(self.get_serializer().get_model_columns())
+        columns.update(self.get_ordering_columns(queryset))
+        columns.add('pk')
+
+        queryset = queryset.select_related(None)
+        relations = {column.rsplit('__', 1)[0] for column in columns if '__' in column}
+        if relations:
+            queryset = queryset.select_related(*relations)
+        return queryset.only(*columns)
+
+    def get_ordering_columns(self, queryset):
+        # The paginator reads the ordering values of the last row to build
+        # the next cursor; deferring them would cost a query per page.
+        paginator = self.paginator
+        if paginator is None or not hasattr(paginator, 'get_ordering'):
+            return []
+        columns = []
+        for name in paginator.get_ordering(self.request, queryset, self):
+            name = name.lstrip('-')
+            try:
+                queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            columns.append(name)
+        return columns
@@ -18,6 +18,15 @@ class User(AbstractUser):
     )
 
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    # Resized copies of the avatar, filled in by core.images
+    avatar_variants = models.JSONField(default=dict, blank=True)
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # Users built from token claims (core.authentication) load the rest
+        # of the row on first access instead of one column at a time.
+        if fields is not None and getattr(self, '_from_claims', False):
+            fields = set(fields) | self.get_deferred_fields()
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
 
     @property
     def avatar_url(self):
@@ -44,8 +53,26 @@ class Session(models.Model):
         default=0
     )
     image = models.ImageField(upload_to='', blank=True, null=True)
+    # Resized copies of the image, filled in by core.images
+    image_variants = models.JSONField(default=dict, blank=True)
+    # Denormalized; maintained by the booking views, repaired by the
+    # reconcile_booking_counts management command.
+    bookings_count = models.PositiveIntegerField(default=0)
+    # Maximum number of bookings; unlimited when empty.
+    capacity = models.PositiveIntegerField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Backs keyset pagination of the public catalog.
+            models.Index(fields=['-created_at', '-id'], name='session_created_id_idx'),
+            # Back the catalog filters and sorts (see core.filters).
+            models.Index(fields=['date', 'id'], name='session_date_id_idx'),
+            models.Index(fields=['price', 'id'], name='session_price_id_idx'),
+            models.Index(fields=['creator', '-created_at', '-id'], name='session_creator_created_idx'),
+            models.Index(fields=['-bookings_count', '-id'], name='session_popularity_idx'),
+        ]
+
     @property
     def image_url(self):
         if self.image:
@@ -69,5 +96,17 @@ class Booking(models.Model):
     )
     booked_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'session'], name='unique_booking_per_user_session'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} → {self.session.title}"
+
+
+class ThrottleCounter(models.Model):
+    """Request counter of one client and time window (core.throttling)."""
+    key = models.CharField(max_length=255, primary_key=True)
+    count = models.PositiveIntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
@@ -0,0 +1,183 @@
+import base64
+import binascii
+import datetime
+import decimal
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def _cursor_default(value):
+    # Unlike DjangoJSONEncoder, keep full microsecond precision: a truncated
+    # timestamp would make the seek skip or repeat rows.
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise TypeError(f'Cannot encode {type(value).__name__} in a cursor')
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over a unique ordering.
+
+    Instead of OFFSET, each page is fetched with a seek past the last row of
+    the previous page, e.g. ``created_at <= c AND (created_at < c OR
+    (created_at = c AND id < i))``. With a matching composite index the cost
+    of a page does not depend on how deep the client has scrolled or how
+    large the table is, and cursors stay stable while new rows are inserted.
+
+    The cursor is an opaque, url-safe token. Clients that still expect a
+    plain list can pass ``?legacy=true`` to get the unpaginated response.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    legacy_query_param = 'legacy'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.is_legacy(request):
+            return None
+        return self.set_page(list(self.get_page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        if self.is_legacy(request):
+            return None
+        return self.set_page([obj async for obj in self.get_page_queryset(queryset, request, view)])
+
+    def get_page_queryset(self, queryset, request, view):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = self.decode_cursor(request, queryset.model)
+        if cursor is not None:
+            queryset = queryset.filter(self.get_seek_filter(cursor))
+        # Fetch one extra row to know whether there is a next page.
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def is_legacy(self, request):
+        value = request.query_params.get(self.legacy_query_param, '')
+        return value.lower() in ('1', 'true', 'yes')
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Ordering used for the seek. The last field must be unique so that
+        every row has a distinct position. A filter backend on the view that
+        implements ``get_ordering`` (like DRF's OrderingFilter) takes
+        precedence over the default.
+        """
+        for backend in getattr(view, 'filter_backends', ()):
+            if hasattr(backend, 'get_ordering'):
+                return tuple(backend().get_ordering(request, queryset, view))
+        return tuple(self.ordering)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        token = self.encode_cursor(self.page[-1])
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def get_seek_filter(self, values):
+        """
+        Expand ``(f1, f2, ...) > (v1, v2, ...)`` into
+        ``f1 >= v1 AND (f1 > v1 OR (f1 = v1 AND f2 > v2) OR ...)``
+        honouring the direction of each ordering field. Row-value syntax
+        can't mix directions, and the planner can't turn the bare OR into
+        an index range; the redundant bound on ``f1`` gives it one.
+        """
+        seek = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            seek |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        if len(self.ordering) > 1:
+            first = self.ordering[0]
+            lookup = 'lte' if first.startswith('-') else 'gte'
+            seek = Q(**{f'{first.lstrip("-")}__{lookup}': values[0]}) & seek
+        return seek
+
+    def encode_cursor(self, obj):
+        values = [getattr(obj, field.lstrip('-')) for field in self.ordering]
+        payload = json.dumps(values, default=_cursor_default, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, model):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                self.to_python(model, field.lstrip('-'), value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def to_python(self, model, name, value):
+        if name == 'pk':
+            name = model._meta.pk.name
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Annotations are compared as they were serialized.
+            return value
+        return field.to_python(value)
+
+
+class SearchPagination(KeysetPagination):
+    """
+    Keyset pagination over search relevance, most relevant first.
+    Search results are never returned unpaginated.
+    """
+    ordering = ('-rank', '-id')
+
+    def is_legacy(self, request):
+        return False
@@ -0,0 +1,215 @@
+"""
+Per-request profiling.
+
+``ProfilingMiddleware`` samples ``PROFILING_SAMPLE_RATE`` of requests. For a
+sampled request it records:
+
+- total time,
+- DB query count and time, through ``connection.execute_wrapper``,
+- DB connect time (``db_connect``): opening a connection or, with
+  ``DB_POOL``, waiting to check one out of the pool,
+- serialization time (``SparseFieldsMixin.to_representation``),
+- render time (``core.renderers``),
+- storage time (``core.storage``).
+
+The numbers go out as a structured ``core.profiling`` log record and, when
+``PROFILING_SERVER_TIMING`` is on, as a ``Server-Timing`` header. With
+``DB_POOL`` the log record also carries each pool's size, idle connections,
+waiting requests and cumulative wait (``db_pool``).
+
+Spans can overlap: queries triggered while serializing count towards both
+``serialize`` and ``db``. Unsampled requests pay one context-variable lookup
+per instrumented call.
+"""
+import contextvars
+import logging
+import random
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('request_profile', default=None)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.total = None
+        self.queries = 0
+        self.timings = defaultdict(float)
+        self._active = set()
+
+    @contextmanager
+    def timed(self, name):
+        # Only the outermost span of a name counts (nested serializers).
+        if name in self._active:
+            yield
+            return
+        self._active.add(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - start
+            self._active.discard(name)
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        self.queries += 1
+        with self.timed('db'):
+            return execute(sql, params, many, context)
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+
+    def server_timing(self):
+        entries = [f'total;dur={self.total * 1000:.1f}']
+        entries.append(f'db;dur={self.timings.get("db", 0) * 1000:.1f};desc="{self.queries} queries"')
+        entries.extend(
+            f'{name};dur={seconds * 1000:.1f}'
+            for name, seconds in self.timings.items() if name != 'db'
+        )
+        return ', '.join(entries)
+
+    def as_dict(self):
+        data = {'total_ms': round(self.total * 1000, 2), 'db_queries': self.queries}
+        data.update((f'{name}_ms', round(seconds * 1000, 2)) for name, seconds in self.timings.items())
+        data.setdefault('db_ms', 0.0)
+        return data
+
+
+def current_profile():
+    return _current.get()
+
+
+@contextmanager
+def activate(profile):
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed_connect(connection, profile):
+    """Time ``connection``'s connects as ``db_connect`` (pool checkouts too)."""
+    get_new_connection = connection.get_new_connection
+
+    def timed_get_new_connection(conn_params):
+        with profile.timed('db_connect'):
+            return get_new_connection(conn_params)
+
+    connection.get_new_connection = timed_get_new_connection
+    try:
+        yield
+    finally:
+        del connection.get_new_connection
+
+
+def pool_stats():
+    """Gauges and wait counters of each database's connection pool."""
+    stats = {}
+    for alias in connections:
+        if not connections.settings[alias].get('OPTIONS', {}).get('pool'):
+            continue
+        pool = connections[alias].pool.get_stats()
+        stats[alias] = {
+            'size': pool.get('pool_size', 0),
+            'available': pool.get('pool_available', 0),
+            'waiting': pool.get('requests_waiting', 0),
+            # Cumulative since the pool opened; diff between records.
+            'requests': pool.get('requests_num', 0),
+            'wait_ms': pool.get('requests_wait_ms', 0),
+            'timeouts': pool.get('requests_errors', 0),
+        }
+    return stats
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to the current request's ``name``."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    with profile.timed(name):
+        yield
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        with activate(profile), self.wrap_connections(profile):
+            response = self.get_response(request)
+        profile.finish()
+        return self.report(request, response, profile)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        profile = RequestProfile()
+        with activate(profile):
+            # Under ASGI the ORM runs on the request's thread-sensitive
+            # executor thread, whose connections are separate objects; the
+            # query wrappers have to be installed there.
+            wrappers = await sync_to_async(self.wrap_connections)(profile)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(wrappers.close)()
+        profile.finish()
+        return self.report(request, response, profile)
+
+    def sampled(self):
+        sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+        return sample_rate > 0 and random.random() < sample_rate
+
+    def wrap_connections(self, profile):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(profile.db_wrapper))
+            stack.enter_context(timed_connect(connection, profile))
+        return stack
+
+    def report(self, request, response, profile):
+        if getattr(settings, 'PROFILING_SERVER_TIMING', False):
+            existing = response.get('Server-Timing')
+            timing = profile.server_timing()
+            response['Server-Timing'] = f'{existing}, {timing}' if existing else timing
+
+        match = request.resolver_match
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            **profile.as_dict(),
+        }
+        if pools := pool_stats():
+            record['db_pool'] = pools
+        logger.info(
+            "%s %s %s %.1fms %d queries", request.method, request.path, response.status_code,
+            record['total_ms'], profile.queries, extra={'profile': record},
+        )
+        return response
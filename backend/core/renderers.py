@@ -0,0 +1,104 @@
+"""
+Fast JSON and MessagePack renderers/parsers for the API.
+
+``ORJSONRenderer`` and ``ORJSONParser`` are drop-in replacements for DRF's
+JSON classes that fall back to them when ``orjson`` is not installed.
+The MessagePack classes need ``msgpack`` and are only enabled in settings
+when it is available; clients opt in with ``Accept: application/msgpack``.
+"""
+import datetime
+import decimal
+import uuid
+
+from django.utils.functional import Promise
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .profiling import timed
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+
+def encode_default(value):
+    """
+    Encode what serializers can hand us beyond plain JSON types: Decimal
+    prices stay exact as strings and datetimes keep their UTC offset.
+    """
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        text = value.isoformat()
+        return text[:-6] + 'Z' if text.endswith('+00:00') else text
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (uuid.UUID, Promise)):
+        return str(value)
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    if hasattr(value, '__iter__'):
+        return list(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not serializable')
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer backed by orjson."""
+    # Route datetimes through encode_default so JSON and MessagePack agree;
+    # allow the integer keys DRF uses for per-item list errors.
+    options = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        # orjson only emits compact output; leave indented responses
+        # (?indent / browsable API) to the stdlib encoder.
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        with timed('render'):
+            return orjson.dumps(data, default=encode_default, option=self.options)
+
+
+class ORJSONParser(JSONParser):
+    """JSONParser backed by orjson."""
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        with timed('render'):
+            return msgpack.packb(data, default=encode_default, use_bin_type=True, datetime=False)
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
@@ -0,0 +1,128 @@
+"""
+Shared S3/MinIO clients.
+
+``MinIOMediaStorage``, the ``migrate_media`` command and ``setup_minio.py``
+all get their clients here, so
+connection pooling and multipart transfers are tuned in one place:
+
+- ``S3_MAX_POOL_CONNECTIONS``: HTTP connections per client (botocore's
+  default is 10). Threads share a client, so size it for all of them.
+- ``S3_MULTIPART_THRESHOLD`` / ``S3_MULTIPART_CHUNKSIZE``: files above the
+  threshold are uploaded in parts of this size.
+- ``S3_MAX_CONCURRENCY``: parts of one file uploaded in parallel.
+
+Values come from Django settings when they are configured and from the
+environment otherwise, so the scripts work without Django.
+"""
+import os
+from functools import lru_cache
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+MB = 1024 * 1024
+
+# setting name -> (environment variable, default)
+OPTIONS = {
+    'AWS_S3_ENDPOINT_URL': ('MINIO_ENDPOINT', 'http://minio:9000'),
+    'AWS_ACCESS_KEY_ID': ('MINIO_ACCESS_KEY', 'minioadmin'),
+    'AWS_SECRET_ACCESS_KEY': ('MINIO_SECRET_KEY', 'minioadmin'),
+    'AWS_STORAGE_BUCKET_NAME': ('MINIO_BUCKET_NAME', 'session-images'),
+    'AWS_S3_REGION_NAME': ('MINIO_REGION', 'us-east-1'),
+    'S3_MAX_POOL_CONNECTIONS': ('S3_MAX_POOL_CONNECTIONS', 32),
+    'S3_MULTIPART_THRESHOLD': ('S3_MULTIPART_THRESHOLD', 8 * MB),
+    'S3_MULTIPART_CHUNKSIZE': ('S3_MULTIPART_CHUNKSIZE', 8 * MB),
+    'S3_MAX_CONCURRENCY': ('S3_MAX_CONCURRENCY', 8),
+}
+
+
+def option(name):
+    env, default = OPTIONS[name]
+    try:
+        from django.conf import settings
+        if settings.configured and hasattr(settings, name):
+            return getattr(settings, name)
+    except ImportError:
+        pass
+    value = os.getenv(env)
+    if value is None:
+        return default
+    return type(default)(value)
+
+
+def client_config(**overrides):
+    options = {
+        'signature_version': 's3v4',
+        'max_pool_connections': option('S3_MAX_POOL_CONNECTIONS'),
+        'retries': {'max_attempts': 5, 'mode': 'standard'},
+        'tcp_keepalive': True,
+        **overrides,
+    }
+    return Config(**options)
+
+
+def transfer_config():
+    return TransferConfig(
+        multipart_threshold=option('S3_MULTIPART_THRESHOLD'),
+        multipart_chunksize=option('S3_MULTIPART_CHUNKSIZE'),
+        max_concurrency=option('S3_MAX_CONCURRENCY'),
+        use_threads=True,
+    )
+
+
+@lru_cache(maxsize=None)
+def make_client(endpoint_url, access_key, secret_key, region_name, verify=None, use_ssl=True,
+                addressing_style=None):
+    """Process-wide client for one set of connection parameters. Clients are thread-safe; share them."""
+    config = {'s3': {'addressing_style': addressing_style}} if addressing_style else {}
+    return boto3.session.Session().client(
+        's3',
+        endpoint_url=endpoint_url,
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+        region_name=region_name,
+        verify=verify,
+        use_ssl=use_ssl,
+        config=client_config(**config),
+    )
+
+
+def get_client():
+    """The client for the configured MinIO/S3 endpoint."""
+    return make_client(
+        option('AWS_S3_ENDPOINT_URL') or None,
+        option('AWS_ACCESS_KEY_ID'),
+        option('AWS_SECRET_ACCESS_KEY'),
+        option('AWS_S3_REGION_NAME'),
+    )
+
+
+@lru_cache(maxsize=None)
+def _resource_class():
+    session = boto3.session.Session(aws_access_key_id='-', aws_secret_access_key='-')
+    return type(session.resource('s3', region_name='us-east-1'))
+
+
+def get_resource(client=None):
+    """
+    An S3 resource on top of a shared client. Resources are not
+    thread-safe, so make one per thread; they only wrap the client.
+    """
+    return _resource_class()(client=client or get_client())
+
+
+def reset():
+    make_client.cache_clear()
+
+
+try:
+    from django.core.signals import setting_changed
+except ImportError:
+    pass
+else:
+    def _reset_clients(*, setting, **kwargs):
+        if setting in OPTIONS:
+            reset()
+
+    setting_changed.connect(_reset_clients)
@@ -0,0 +1,147 @@
+"""
+Full-text search over session titles and descriptions.
+
+PostgreSQL keeps a stored, generated ``tsvector`` column on ``core_session``
+behind a GIN index. SQLite (used by the test suite) falls back to an
+external-content FTS5 table kept in sync by triggers. The column and the
+FTS table are not declared on the model, so the ORM never selects them;
+``search_sessions`` reaches them through raw SQL fragments.
+"""
+from django.db import connection
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from .models import Session
+
+SEARCH_CONFIG = 'english'
+
+POSTGRES_INSTALL = [
+    f"""
+    ALTER TABLE core_session ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX session_search_vector_idx ON core_session USING GIN (search_vector)",
+]
+
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS session_search_vector_idx",
+    "ALTER TABLE core_session DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_TABLE = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS core_session_fts USING fts5(
+        title, description,
+        content='core_session', content_rowid='id', tokenize='porter unicode61'
+    )
+"""
+
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS core_session_fts_ai AFTER INSERT ON core_session BEGIN
+        INSERT INTO core_session_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_session_fts_ad AFTER DELETE ON core_session BEGIN
+        INSERT INTO core_session_fts(core_session_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_session_fts_au AFTER UPDATE OF title, description ON core_session BEGIN
+        INSERT INTO core_session_fts(core_session_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO core_session_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS core_session_fts_ai",
+    "DROP TRIGGER IF EXISTS core_session_fts_ad",
+    "DROP TRIGGER IF EXISTS core_session_fts_au",
+    "DROP TABLE IF EXISTS core_session_fts",
+]
+
+
+def install_search_index(conn):
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            for sql in POSTGRES_INSTALL:
+                cursor.execute(sql)
+        elif conn.vendor == 'sqlite':
+            ensure_sqlite_triggers(conn)
+
+
+def uninstall_search_index(conn):
+    statements = {'postgresql': POSTGRES_UNINSTALL, 'sqlite': SQLITE_UNINSTALL}.get(conn.vendor, [])
+    with conn.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def ensure_sqlite_triggers(conn):
+    """
+    SQLite migrations that alter ``core_session`` rebuild the table, which
+    drops its triggers. Recreate them (and reindex) whenever they are gone.
+    """
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+            ['core_session_fts_%'],
+        )
+        if cursor.fetchone()[0] == len(SQLITE_TRIGGERS):
+            return
+        cursor.execute(SQLITE_TABLE)
+        for sql in SQLITE_TRIGGERS:
+            cursor.execute(sql)
+        cursor.execute("INSERT INTO core_session_fts(core_session_fts) VALUES ('rebuild')")
+
+
+def search_sessions(query, queryset=None):
+    """
+    Sessions matching ``query``, annotated with a ``rank`` (higher is more
+    relevant). Title matches weigh more than description matches.
+    """
+    if queryset is None:
+        queryset = Session.objects.all()
+
+    if connection.vendor == 'postgresql':
+        tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        rank = RawSQL(
+            f"ts_rank_cd(core_session.search_vector, {tsquery})::double precision",
+            [query], output_field=FloatField(),
+        )
+        match = RawSQL(
+            f"core_session.search_vector @@ {tsquery}", [query], output_field=BooleanField(),
+        )
+    elif connection.vendor == 'sqlite':
+        fts_query = _fts5_query(query)
+        # bm25() is lower-is-better; negate it so both backends rank descending.
+        rank = RawSQL(
+            "(SELECT -bm25(core_session_fts, 10.0, 1.0) FROM core_session_fts"
+            " WHERE core_session_fts MATCH %s AND rowid = core_session.id)",
+            [fts_query], output_field=FloatField(),
+        )
+        match = RawSQL(
+            "core_session.id IN (SELECT rowid FROM core_session_fts WHERE core_session_fts MATCH %s)",
+            [fts_query], output_field=BooleanField(),
+        )
+    else:
+        raise NotImplementedError(f'Full-text search is not supported on {connection.vendor}')
+
+    return queryset.annotate(rank=rank).filter(match)
+
+
+def _fts5_query(query):
+    # Quote every term so user input cannot inject FTS5 operators; quoted
+    # terms separated by spaces are ANDed together.
+    terms = query.split()
+    return ' '.join('"%s"' % term.replace('"', '""') for term in terms)
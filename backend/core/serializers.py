@@ -1,33 +1,148 @@
-from rest_framework import serializers
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Q
+from rest_framework import exceptions, serializers
+from .images import variant_srcsets
 from .models import User, Session, Booking
+from .profiling import current_profile
 
+DESCRIPTION_PREVIEW_LENGTH = 160
 
-class UserSerializer(serializers.ModelSerializer):
+
+class SparseFieldsMixin:
+    """
+    Sparse fieldsets for model serializers.
+
+    ``fields`` limits the top-level fields that are rendered, and ``expand``
+    swaps a field for the richer serializer listed in ``Meta.expandable``.
+    ``get_model_columns()`` reports the columns the remaining fields read,
+    so views can push the selection down into ``QuerySet.only()``.
+    """
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        expandable = getattr(self.Meta, 'expandable', {})
+        for name in expand or ():
+            if name in expandable and name in self.fields:
+                self.fields[name] = expandable[name](read_only=True)
+
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def to_representation(self, instance):
+        profile = current_profile()
+        if profile is None:
+            return super().to_representation(instance)
+        with profile.timed('serialize'):
+            return super().to_representation(instance)
+
+    def get_model_columns(self):
+        method_sources = getattr(self.Meta, 'method_field_sources', {})
+        columns = []
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.SerializerMethodField):
+                columns.extend(method_sources.get(name, ()))
+                continue
+            source = field.source.replace('.', '__')
+            columns.append(source)
+            if isinstance(field, SparseFieldsMixin):
+                columns.extend(f'{source}__{column}' for column in field.get_model_columns())
+        return columns
+
+
+class TruncatedCharField(serializers.CharField):
+    def __init__(self, max_length, **kwargs):
+        self.truncate_at = max_length
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        value = super().to_representation(value)
+        if len(value) <= self.truncate_at:
+            return value
+        return value[:self.truncate_at - 1].rstrip() + '…'
+
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     avatar_url = serializers.SerializerMethodField()
+    avatar_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = User
-        fields = ["id", "username", "email", "role", "avatar", "avatar_url"]
+        fields = ["id", "username", "email", "role", "avatar", "avatar_url", "avatar_srcset"]
         extra_kwargs = {'avatar': {'write_only': True}}
+        method_field_sources = {'avatar_url': ['avatar'], 'avatar_srcset': ['avatar', 'avatar_variants']}
+
+    def update(self, instance, validated_data):
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        # Only the submitted columns, so post_save receivers see what changed.
+        instance.save(update_fields=list(validated_data))
+        return instance
 
     def get_avatar_url(self, obj):
         return obj.avatar_url
 
+    def get_avatar_srcset(self, obj):
+        # {"avif": "url 320w, ...", "webp": ...}; empty until generated
+        return variant_srcsets(obj.avatar, obj.avatar_variants)
 
-class SessionSerializer(serializers.ModelSerializer):
+
+class UserSummarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """A user reduced to what list views show next to their content."""
+    class Meta:
+        model = User
+        fields = ["id", "username"]
+
+
+class SessionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     creator = UserSerializer(read_only=True)
     image_url = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Session
-        fields = ["id", "creator", "title", "description", "date", "price", "image", "image_url", "created_at"]
-        read_only_fields = ["creator", "image_url", "created_at"]
+        fields = [
+            "id", "creator", "title", "description", "date", "price", "capacity",
+            "image", "image_url", "image_srcset", "bookings_count", "created_at",
+        ]
+        read_only_fields = ["creator", "image_url", "bookings_count", "created_at"]
+        method_field_sources = {'image_url': ['image'], 'image_srcset': ['image', 'image_variants']}
 
     def get_image_url(self, obj):
         return obj.image_url
 
+    def get_image_srcset(self, obj):
+        # {"avif": "url 320w, ...", "webp": ...}; empty until generated
+        return variant_srcsets(obj.image, obj.image_variants)
+
 
-class BookingSerializer(serializers.ModelSerializer):
+class SessionCompactSerializer(SessionSerializer):
+    """
+    List representation of a session: a description preview and the
+    creator as id and username. ``?expand=creator`` restores the full user.
+    """
+    creator = UserSummarySerializer(read_only=True)
+    description = TruncatedCharField(max_length=DESCRIPTION_PREVIEW_LENGTH, read_only=True)
+
+    class Meta(SessionSerializer.Meta):
+        fields = ["id", "creator", "title", "description", "date", "price", "capacity", "image_url", "image_srcset", "bookings_count"]
+        expandable = {'creator': UserSerializer}
+
+
+class CreatorSessionStatsSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """A creator's own session with the booking stats annotated by the view."""
+    booking_count = serializers.IntegerField(read_only=True)
+    revenue = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    last_booked_at = serializers.DateTimeField(read_only=True)
+
+    class Meta:
+        model = Session
+        fields = ["id", "title", "date", "price", "capacity", "booking_count", "revenue", "last_booked_at"]
+
+
+class BookingSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     session = SessionSerializer(read_only=True)
     session_id = serializers.IntegerField(write_only=True, source='session.id')
     user = UserSerializer(read_only=True)
@@ -39,11 +154,120 @@ class BookingSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         session_id = validated_data.pop('session')['id']
-        validated_data['session_id'] = session_id
-        
-        # Check if user already enrolled in this session
-        user = self.context['request'].user
-        if Booking.objects.filter(user=user, session_id=session_id).exists():
+        user = validated_data.pop('user')
+
+        try:
+            with transaction.atomic():
+                # Claim a seat with a single conditional UPDATE: it only
+                # matches while the session has room, and the row lock it
+                # takes serializes concurrent bookings of the same session.
+                claimed = (
+                    Session.objects.filter(pk=session_id)
+                    .filter(Q(capacity__isnull=True) | Q(bookings_count__lt=F('capacity')))
+                    .update(bookings_count=F('bookings_count') + 1)
+                )
+                if not claimed:
+                    if not Session.objects.filter(pk=session_id).exists():
+                        raise serializers.ValidationError({"session_id": "Session not found"})
+                    raise serializers.ValidationError({"error": "This session is fully booked"})
+
+                # The unique constraint rejects a second booking by the same
+                # user, rolling the seat claim back with it.
+                return Booking.objects.create(user=user, session_id=session_id, **validated_data)
+        except IntegrityError:
             raise serializers.ValidationError({"error": "u have already enrolled"})
-        
-        return super().create(validated_data)
+
+
+class BookingCompactSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    List representation of a booking with compact session and user.
+    ``?expand=session,user`` restores the full nested objects.
+    """
+    session = SessionCompactSerializer(read_only=True)
+    user = UserSummarySerializer(read_only=True)
+
+    class Meta:
+        model = Booking
+        fields = ["id", "user", "session", "booked_at"]
+        expandable = {'session': SessionSerializer, 'user': UserSerializer}
+
+
+class BookingConflict(exceptions.APIException):
+    status_code = 409
+    default_detail = 'A concurrent booking changed these sessions, please retry.'
+    default_code = 'booking_conflict'
+
+
+class BookingBulkSerializer(serializers.Serializer):
+    """
+    Book several sessions for one user in a single transaction.
+
+    Sessions are validated and locked with one query, bookings the user
+    already holds are skipped, and the rest are inserted with one
+    ``bulk_create``. ``save()`` returns one result per requested id.
+    """
+    BOOKED = 'booked'
+    ALREADY_BOOKED = 'already_booked'
+    FULL = 'full'
+    NOT_FOUND = 'not_found'
+
+    session_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=100,
+    )
+
+    def create(self, validated_data):
+        user = validated_data['user']
+        session_ids = list(dict.fromkeys(validated_data['session_ids']))
+
+        with transaction.atomic():
+            sessions = {
+                session.pk: session
+                for session in Session.objects.filter(pk__in=session_ids)
+                .select_for_update(of=('self',))
+                .order_by('pk')
+                .only('id', 'capacity', 'bookings_count')
+                .annotate(already_booked=Exists(
+                    Booking.objects.filter(user=user, session=OuterRef('pk'))
+                ))
+            }
+
+            statuses = {}
+            to_book = []
+            for session_id in session_ids:
+                session = sessions.get(session_id)
+                if session is None:
+                    statuses[session_id] = self.NOT_FOUND
+                elif session.already_booked:
+                    statuses[session_id] = self.ALREADY_BOOKED
+                elif session.capacity is not None and session.bookings_count >= session.capacity:
+                    statuses[session_id] = self.FULL
+                else:
+                    to_book.append(session_id)
+
+            bookings = {}
+            if to_book:
+                claimed = (
+                    Session.objects.filter(pk__in=to_book)
+                    .filter(Q(capacity__isnull=True) | Q(bookings_count__lt=F('capacity')))
+                    .update(bookings_count=F('bookings_count') + 1)
+                )
+                if claimed != len(to_book):
+                    # Only reachable where SELECT ... FOR UPDATE is a no-op
+                    # (SQLite): a concurrent booking took a seat meanwhile.
+                    raise BookingConflict()
+                try:
+                    created = Booking.objects.bulk_create(
+                        [Booking(user=user, session_id=session_id) for session_id in to_book]
+                    )
+                except IntegrityError:
+                    raise BookingConflict()
+                bookings = {booking.session_id: booking for booking in created}
+
+        return [
+            {
+                'session_id': session_id,
+                'status': self.BOOKED if session_id in bookings else statuses[session_id],
+                'booking_id': bookings[session_id].pk if session_id in bookings else None,
+            }
+            for session_id in session_ids
+        ]
@@ -1,12 +1,162 @@
+import hashlib
+import os
+import re
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
 from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name
+
+from . import s3
+from .profiling import timed
+
+
+class TimedStorageMixin:
+    """Count storage calls towards the request profile's ``storage`` time."""
+
+    def _save(self, name, content):
+        with timed('storage'):
+            return super()._save(name, content)
+
+    def _open(self, name, mode='rb'):
+        with timed('storage'):
+            return super()._open(name, mode)
+
+    def delete(self, name):
+        with timed('storage'):
+            return super().delete(name)
+
+    def exists(self, name):
+        with timed('storage'):
+            return super().exists(name)
+
+    def size(self, name):
+        with timed('storage'):
+            return super().size(name)
+
+
+class ContentHashedMixin:
+    """
+    Store files under the SHA-256 of their content, keeping the directory
+    and extension: ``avatars/me.png`` -> ``avatars/3f2a...c9.png``. A name
+    then always means the same bytes, so it can be cached forever, and
+    uploading a file that is already stored just returns its name.
+    """
+    hash_length = 32
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def hashed_name(self, name, content):
+        hashed = content_hashed_name(name, content.chunks(), self.hash_length)
+        if content.seekable():
+            content.seek(0)
+        return hashed
+
 
+def content_hashed_name(name, chunks, length=ContentHashedMixin.hash_length):
+    """The name ``ContentHashedMixin`` stores ``chunks`` under."""
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    directory, filename = os.path.split(name)
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join(directory, f'{digest.hexdigest()[:length]}{extension}')
 
-class MinIOMediaStorage(S3Boto3Storage):
-    """Custom storage for MinIO"""
+
+def is_content_hashed(name, length=ContentHashedMixin.hash_length):
+    stem, extension = os.path.splitext(os.path.basename(name))
+    return bool(re.fullmatch(f'[0-9a-f]{{{length}}}', stem)) and extension == extension.lower()
+
+
+def media_cache_control():
+    return getattr(settings, 'MEDIA_CACHE_CONTROL', 'public, max-age=31536000, immutable')
+
+
+class MediaStorage(TimedStorageMixin, FileSystemStorage):
+    """Local filesystem media storage"""
+
+
+class MinIOMediaStorage(TimedStorageMixin, ContentHashedMixin, S3Boto3Storage):
+    """Custom storage for MinIO, with content-hashed, immutable keys"""
     location = ''  # store files at bucket root
     file_overwrite = False
 
+    def __init__(self, **options):
+        super().__init__(**options)
+        if 'transfer_config' not in options and not getattr(settings, 'AWS_S3_TRANSFER_CONFIG', None):
+            self.transfer_config = s3.transfer_config()
+
+    @property
+    def connection(self):
+        """Per-thread resource over the shared, pooled client from core.s3."""
+        connection = getattr(self._connections, 'connection', None)
+        if connection is None:
+            connection = self._connections.connection = s3.get_resource(self.client)
+        return connection
+
+    @property
+    def client(self):
+        return s3.make_client(
+            self.endpoint_url, self.access_key, self.secret_key, self.region_name,
+            verify=self.verify, use_ssl=self.use_ssl, addressing_style=self.addressing_style,
+        )
+
+    def get_object_parameters(self, name):
+        params = super().get_object_parameters(name)
+        params.setdefault('CacheControl', media_cache_control())
+        return params
+
     def url(self, name):
         """Always expose media URLs through nginx /media/ proxy"""
         name = name.lstrip('/')
         return f'/media/{name}'
+
+    def presigned_post(self, name, content_type, max_size, expires=600):
+        """
+        Presigned POST letting a client upload ``name`` straight to the
+        bucket. The policy pins the key, content type, ACL and size range.
+        """
+        key = self._normalize_name(clean_name(name))
+        # Presigned keys are random and never reused, so they are immutable too.
+        fields = {'Content-Type': content_type, 'Cache-Control': media_cache_control()}
+        conditions = [
+            {'Content-Type': content_type},
+            {'Cache-Control': fields['Cache-Control']},
+            ['content-length-range', 1, max_size],
+        ]
+        if self.default_acl:
+            fields['acl'] = self.default_acl
+            conditions.append({'acl': self.default_acl})
+        with timed('storage'):
+            presigned = self.client.generate_presigned_post(
+                self.bucket_name, key, Fields=fields, Conditions=conditions, ExpiresIn=expires,
+            )
+        # The API reaches MinIO on the internal network; browsers use the
+        # public endpoint. POST policy signatures do not cover the host.
+        public_endpoint = getattr(settings, 'MINIO_UPLOAD_ENDPOINT', None)
+        if public_endpoint and self.endpoint_url:
+            presigned['url'] = presigned['url'].replace(self.endpoint_url.rstrip('/'), public_endpoint.rstrip('/'), 1)
+        return presigned
+
+    def stat(self, name):
+        """``{'size', 'content_type'}`` of a stored object, or None if missing."""
+        with timed('storage'):
+            try:
+                head = self.client.head_object(
+                    Bucket=self.bucket_name, Key=self._normalize_name(clean_name(name)),
+                )
+            except ClientError as error:
+                if error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                    return None
+                raise
+        return {'size': head['ContentLength'], 'content_type': head.get('ContentType')}
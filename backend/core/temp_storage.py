@@ -1,30 +1,178 @@
 """
 Temporary storage for OAuth role selection
-This uses cache/database to persist role across OAuth redirects
+
+The role a user picks before the OAuth redirect is kept in a state store,
+keyed by the ``state`` token that comes back on the callback. Stores are
+pluggable through ``settings.OAUTH_STATE_STORE``:
+
+- ``SignedStateStore`` (default) keeps nothing server-side: the role is
+  carried inside a signed, timestamped token, so any worker can read it.
+- ``CacheStateStore`` keeps entries in the Django cache, shared by all
+  workers when the cache is (Redis, Memcached).
+- ``LocalStateStore`` is a bounded in-process LRU, for single-process use.
+
+Every store expires entries after ``OAUTH_STATE_TTL`` seconds and consumes a
+token at most once.
 """
-from django.core.cache import cache
-from django.db import models
+import logging
+import threading
+import time
 import uuid
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 600
+
+
+class BaseStateStore:
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else getattr(settings, 'OAUTH_STATE_TTL', DEFAULT_TTL)
+
+    def put(self, value):
+        """Store ``value`` and return the state token that retrieves it."""
+        raise NotImplementedError
+
+    def pop(self, token):
+        """
+        Atomically return and forget the value for ``token``; None when it is
+        unknown, expired or was already consumed.
+        """
+        raise NotImplementedError
+
+
+class LocalStateStore(BaseStateStore):
+    """
+    In-process store bounded by a TTL and a maximum size. Entries share one
+    TTL, so insertion order is also expiry order and the oldest entry is the
+    least recently used one.
+    """
+    def __init__(self, ttl=None, max_entries=None, clock=time.monotonic):
+        super().__init__(ttl)
+        self.max_entries = max_entries or getattr(settings, 'OAUTH_STATE_MAX_ENTRIES', 10000)
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, value):
+        token = str(uuid.uuid4())
+        now = self.clock()
+        with self._lock:
+            self._evict(now)
+            self._entries[token] = (now + self.ttl, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return token
+
+    def pop(self, token):
+        with self._lock:
+            entry = self._entries.pop(token, None)
+        if entry is None or entry[0] <= self.clock():
+            return None
+        return entry[1]
+
+    def _evict(self, now):
+        while self._entries:
+            token, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            del self._entries[token]
+
+
+class CacheStateStore(BaseStateStore):
+    """
+    Store backed by the Django cache. The cache enforces the TTL and its own
+    size limit (MAX_ENTRIES for LocMem, maxmemory policy for Redis).
+    """
+    key_prefix = 'oauth-state:'
+
+    def __init__(self, ttl=None, alias=None):
+        super().__init__(ttl)
+        self.cache = caches[alias or getattr(settings, 'OAUTH_STATE_CACHE_ALIAS', 'default')]
+
+    def put(self, value):
+        token = str(uuid.uuid4())
+        self.cache.set(self.key_prefix + token, value, self.ttl)
+        return token
+
+    def pop(self, token):
+        key = self.key_prefix + token
+        value = self.cache.get(key)
+        # delete() only reports True to the caller that actually removed the
+        # key, so exactly one of several racing callbacks consumes it.
+        if value is None or not self.cache.delete(key):
+            return None
+        return value
+
+
+class SignedStateStore(BaseStateStore):
+    """
+    Self-contained store: the value travels inside a signed, timestamped
+    token and nothing is kept per flow, so abandoned flows cost nothing.
+    With ``single_use`` a consumed token's nonce is remembered in the cache
+    until it would have expired anyway, so it cannot be replayed.
+    """
+    salt = 'core.temp_storage.oauth-state'
+    used_key_prefix = 'oauth-state-used:'
+
+    def __init__(self, ttl=None, single_use=True, alias=None):
+        super().__init__(ttl)
+        self.single_use = single_use
+        self.cache = caches[alias or getattr(settings, 'OAUTH_STATE_CACHE_ALIAS', 'default')]
+        self.signer = signing.TimestampSigner(salt=self.salt)
+
+    def put(self, value):
+        return self.signer.sign_object({'v': value, 'n': uuid.uuid4().hex}, compress=True)
+
+    def pop(self, token):
+        try:
+            payload = self.signer.unsign_object(token, max_age=self.ttl)
+        except signing.BadSignature:
+            return None
+        if self.single_use and not self.cache.add(self.used_key_prefix + payload['n'], True, self.ttl):
+            return None
+        return payload['v']
+
+
+@lru_cache(maxsize=None)
+def get_state_store():
+    path = getattr(settings, 'OAUTH_STATE_STORE', 'core.temp_storage.SignedStateStore')
+    return import_string(path)()
+
+
+@receiver(setting_changed)
+def _reset_state_store(setting, **kwargs):
+    if setting.startswith('OAUTH_STATE_') or setting == 'CACHES':
+        get_state_store.cache_clear()
 
-# Simple in-memory storage (will work better than sessions for OAuth)
-_role_storage = {}
 
 def store_role_for_oauth(role='user'):
     """
     Store role and return a unique state token
     """
-    state_token = str(uuid.uuid4())
-    _role_storage[state_token] = role
-    print(f"[ROLE STORAGE] Stored role '{role}' with token '{state_token}'")
+    state_token = get_state_store().put(role)
+    logger.debug("Stored role %r for OAuth state", role)
     return state_token
 
+
 def get_role_from_state(state_token):
     """
-    Retrieve role from state token
+    Retrieve role from state token, consuming it
     """
-    role = _role_storage.get(state_token, 'user')
-    print(f"[ROLE STORAGE] Retrieved role '{role}' for token '{state_token}'")
-    # Clean up after use
-    if state_token in _role_storage:
-        del _role_storage[state_token]
+    role = get_state_store().pop(state_token)
+    if role is None:
+        logger.info("OAuth state token unknown, expired or already used")
+        return 'user'
+    logger.debug("Retrieved role %r for OAuth state", role)
     return role
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.db import connections
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        # Replica aliases are test mirrors of the primary: separate
+        # connections that can't see a TestCase's uncommitted rows. Read
+        # from the primary unless a test routes to a replica itself.
+        settings.DATABASE_REPLICAS = []
+        if settings.DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+            self.configure_sqlite()
+
+    def configure_sqlite(self):
+        # The default in-memory SQLite test database fails concurrent writers
+        # with "table is locked" instead of letting them wait; a file-backed
+        # one honours the busy timeout, which the concurrency tests rely on.
+        default = settings.DATABASES['default']
+        default['TEST'] = {**default.get('TEST', {}), 'NAME': settings.BASE_DIR / 'test_db.sqlite3'}
+        # A second database standing in for a lagging read replica in the
+        # router tests, which list it in DATABASE_REPLICAS themselves. Added
+        # before the suite is built so their ``databases`` can include it.
+        settings.DATABASES.setdefault('replica', {'ENGINE': 'django.db.backends.sqlite3'})
+        connections.configure_settings(settings.DATABASES)
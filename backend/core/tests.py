@@ -1,3 +1,1869 @@
-from django.test import TestCase
+import json
+import os
+import re
+import time
+import tracemalloc
+import unittest
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
+from tempfile import TemporaryDirectory
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+import requests
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .authentication import CHANGED_KEY, ClaimsRefreshToken, get_user_cache, invalidate_user
+from . import db_router
+from .cache import get_catalog_version
+from .last_login import LastLoginBuffer
+from .management.commands.gc_media import orphaned, referenced_names
+from .management.commands.migrate_media import Command as MigrateMediaCommand
+from .images import enabled_formats
+from .logs import JSONFormatter
+from .profiling import ProfilingMiddleware, RequestProfile, activate
+from .s3 import get_client
+from .storage import MinIOMediaStorage, content_hashed_name
+from .throttling import SlidingWindowThrottle
+from .views import AsyncSessionBookingsView, AsyncSessionDetailView, AsyncSessionListView
+from .models import Booking, Session, ThrottleCounter, User
+from .renderers import MessagePackRenderer, ORJSONParser, ORJSONRenderer, msgpack
+try:
+    from moto import mock_aws
+except ImportError:  # moto is only needed for the S3 storage tests
+    mock_aws = None
+requires_moto = unittest.skipUnless(mock_aws, 'moto is not installed: pip install -r requirements-dev.txt')
+from .temp_storage import (
+    CacheStateStore, LocalStateStore, SignedStateStore, get_role_from_state, store_role_for_oauth,
+)
+
+
+@override_settings(LAST_LOGIN_WRITE_BEHIND=False)
+class APITestCase(TestCase):
+    def setUp(self):
+        # Throttle history lives in the default cache; start every test clean.
+        cache.clear()
+        self.client = APIClient()
+        self.creator = User.objects.create_user(
+            username='creator', email='creator@example.com', role=User.CREATOR,
+        )
+
+    def make_sessions(self, count, creator=None, **kwargs):
+        creator = creator or self.creator
+        return [
+            Session.objects.create(
+                creator=creator,
+                title=kwargs.get('title', f'Session {i}'),
+                description=kwargs.get('description', 'About this session'),
+                date=kwargs.get('date', timezone.now() + timedelta(days=i + 1)),
+                price=kwargs.get('price', 10),
+            )
+            for i in range(count)
+        ]
+
+    def make_user(self, username, **kwargs):
+        return User.objects.create_user(
+            username=username, email=f'{username}@example.com', **kwargs,
+        )
+
+
+class QueryBudgetMixin:
+    """
+    Pin the number of queries an endpoint may run, at several data sizes.
+
+    ``grow(count)`` adds ``count`` more related rows before each request so
+    that an N+1 regression shows up as a budget overrun at the larger sizes.
+    """
+    budget_sizes = (1, 10, 50)
+
+    def assertQueryBudget(self, url, max_queries, grow, sizes=None, **extra):
+        total = 0
+        for size in sizes or self.budget_sizes:
+            grow(size - total)
+            total = size
+            with self.subTest(size=size):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, **extra)
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(
+                    len(queries), max_queries,
+                    '%s ran %d queries with %d rows (budget %d):\n%s' % (
+                        url, len(queries), size, max_queries,
+                        '\n'.join(q['sql'] for q in queries.captured_queries),
+                    ),
+                )
+
+
+class SessionKeysetPaginationTests(APITestCase):
+    url = reverse('session-list')
+
+    def collect_pages(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_walks_every_session_once_newest_first(self):
+        sessions = self.make_sessions(7)
+        ids = self.collect_pages(f'{self.url}?page_size=3')
+        self.assertEqual(ids, [s.id for s in reversed(sessions)])
+
+    def test_ties_on_created_at_are_broken_by_id(self):
+        sessions = self.make_sessions(5)
+        Session.objects.update(created_at=timezone.now())
+        ids = self.collect_pages(f'{self.url}?page_size=2')
+        self.assertEqual(ids, sorted((s.id for s in sessions), reverse=True))
+
+    def test_cursor_is_stable_while_sessions_are_inserted(self):
+        sessions = self.make_sessions(4)
+        first = self.client.get(f'{self.url}?page_size=2')
+        self.make_sessions(3)
+
+        second = self.client.get(first.data['next'])
+        self.assertEqual(
+            [row['id'] for row in second.data['results']],
+            [sessions[1].id, sessions[0].id],
+        )
+        self.assertIsNone(second.data['next'])
+
+    def test_invalid_cursor_returns_404(self):
+        response = self.client.get(f'{self.url}?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_legacy_mode_returns_plain_list(self):
+        self.make_sessions(3)
+        response = self.client.get(f'{self.url}?legacy=true')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response.data, list)
+        self.assertEqual(len(response.data), 3)
+
+
+class QueryBudgetTests(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.student = self.make_user('student')
+        self.session = self.make_sessions(1)[0]
+
+    def book_sessions(self, count):
+        creator = self.make_user(f'creator{Session.objects.count()}', role=User.CREATOR)
+        for session in self.make_sessions(count, creator=creator):
+            Booking.objects.create(user=self.student, session=session)
+
+    def book_students(self, count):
+        offset = User.objects.count()
+        for i in range(count):
+            Booking.objects.create(user=self.make_user(f'student{offset + i}'), session=self.session)
+
+    def add_sessions(self, count):
+        creator = self.make_user(f'creator{Session.objects.count()}', role=User.CREATOR)
+        self.make_sessions(count, creator=creator)
+
+    def test_session_list(self):
+        self.assertQueryBudget(reverse('session-list'), 1, self.add_sessions)
+
+    def test_session_list_legacy(self):
+        self.assertQueryBudget(f"{reverse('session-list')}?legacy=true", 1, self.add_sessions)
+
+    def test_session_detail(self):
+        self.assertQueryBudget(reverse('session-detail', args=[self.session.pk]), 1, self.book_students)
+
+    def test_user_bookings(self):
+        self.client.force_authenticate(self.student)
+        self.assertQueryBudget(reverse('my-bookings'), 1, self.book_sessions)
+
+    def test_session_bookings(self):
+        self.assertQueryBudget(reverse('session-bookings', args=[self.session.pk]), 1, self.book_students)
+
+
+class CatalogCacheTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.session = self.make_sessions(1)[0]
+        self.list_url = reverse('session-list')
+        self.detail_url = reverse('session-detail', args=[self.session.pk])
+
+    def test_repeat_reads_are_served_from_cache(self):
+        for url in (self.list_url, self.detail_url):
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+            self.assertEqual(second.status_code, 200)
+            self.assertEqual(second.data, first.data)
+            self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_matching_etag_returns_304_without_queries(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_query_strings_are_cached_separately(self):
+        self.make_sessions(2)
+        full = self.client.get(self.list_url)
+        small = self.client.get(f'{self.list_url}?page_size=1')
+        self.assertEqual(len(full.data['results']), 3)
+        self.assertEqual(len(small.data['results']), 1)
+        self.assertNotEqual(full['ETag'], small['ETag'])
+
+    def test_session_writes_invalidate_cache(self):
+        etag = self.client.get(self.list_url)['ETag']
+        self.client.force_authenticate(self.creator)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse('session-update', args=[self.session.pk]), {'title': 'Renamed'},
+            )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['title'], 'Renamed')
+
+    def test_booking_writes_invalidate_cache(self):
+        version = get_catalog_version()
+        self.client.force_authenticate(self.make_user('student'))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('booking-create'), {'session_id': self.session.pk})
+        self.assertEqual(response.status_code, 201)
+        self.assertGreater(get_catalog_version(), version)
+
+    def test_creator_profile_changes_invalidate_cache(self):
+        etag = self.client.get(f'{self.list_url}?expand=creator')['ETag']
+        self.client.force_authenticate(self.creator)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('user-profile'), {'username': 'renamed', 'email': 'new@example.com'})
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(f'{self.list_url}?expand=creator', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['creator']['username'], 'renamed')
+        self.assertEqual(response.data['results'][0]['creator']['email'], 'new@example.com')
+
+    def test_other_profile_changes_keep_cache(self):
+        version = get_catalog_version()
+        self.client.force_authenticate(self.creator)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('user-profile'), {'role': User.CREATOR})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_catalog_version(), version)
+
+
+class SessionSearchTests(APITestCase):
+    url = reverse('session-search')
+
+    def setUp(self):
+        super().setUp()
+        self.make_sessions(1, title='Intro to Python', description='Variables and loops')
+        self.make_sessions(1, title='Watercolor basics', description='Painting with python-green pigments')
+        self.make_sessions(1, title='Advanced Rust', description='Ownership and lifetimes')
+
+    def search(self, query, **params):
+        return self.client.get(self.url, {'q': query, **params})
+
+    def test_ranks_title_matches_first(self):
+        response = self.search('python')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [row['title'] for row in response.data['results']],
+            ['Intro to Python', 'Watercolor basics'],
+        )
+
+    def test_all_terms_must_match(self):
+        response = self.search('rust lifetimes')
+        self.assertEqual([row['title'] for row in response.data['results']], ['Advanced Rust'])
+        self.assertEqual(self.search('rust python').data['results'], [])
+
+    def test_index_follows_updates_and_deletes(self):
+        session = Session.objects.get(title='Advanced Rust')
+        session.title = 'Advanced Go'
+        session.save()
+        self.assertEqual(self.search('rust').data['results'], [])
+        self.assertEqual(len(self.search('go').data['results']), 1)
+
+        session.delete()
+        cache.clear()
+        self.assertEqual(self.search('go').data['results'], [])
+
+    def test_paginates_by_rank(self):
+        self.make_sessions(5, title='Python patterns')
+        first = self.search('python', page_size=4)
+        second = self.client.get(first.data['next'])
+        ids = [row['id'] for row in first.data['results'] + second.data['results']]
+        self.assertEqual(len(ids), 7)
+        self.assertEqual(len(set(ids)), 7)
+        self.assertIsNone(second.data['next'])
+
+    def test_operators_in_input_are_treated_as_text(self):
+        for query in ('"', 'python OR', 'NEAR(python', '*', 'title:rust'):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query).status_code, 200)
+
+    def test_query_is_required(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+
+
+class SessionFilterTests(APITestCase):
+    url = reverse('session-list')
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        self.other = self.make_user('other', role=User.CREATOR)
+        self.past = self.make_sessions(1, title='Past', date=now - timedelta(days=3), price=5)[0]
+        self.soon = self.make_sessions(1, title='Soon', date=now + timedelta(days=1), price=30)[0]
+        self.later = self.make_sessions(1, creator=self.other, title='Later', date=now + timedelta(days=10), price=15)[0]
+
+    def titles(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [row['title'] for row in response.data['results']]
+
+    def test_filters(self):
+        self.assertEqual(self.titles(upcoming='true', sort='date'), ['Soon', 'Later'])
+        self.assertEqual(self.titles(price_min='10', price_max='20'), ['Later'])
+        self.assertEqual(self.titles(creator=self.other.pk), ['Later'])
+        self.assertEqual(
+            self.titles(date_after=self.past.date.isoformat(), date_before=self.soon.date.isoformat(), sort='date'),
+            ['Past', 'Soon'],
+        )
+
+    def test_sorts(self):
+        Booking.objects.create(user=self.make_user('a'), session=self.later)
+        Booking.objects.create(user=self.make_user('b'), session=self.later)
+        Booking.objects.create(user=self.make_user('c'), session=self.past)
+        call_command('reconcile_booking_counts', stdout=StringIO())
+
+        self.assertEqual(self.titles(), ['Later', 'Soon', 'Past'])
+        self.assertEqual(self.titles(sort='date'), ['Past', 'Soon', 'Later'])
+        self.assertEqual(self.titles(sort='-date'), ['Later', 'Soon', 'Past'])
+        self.assertEqual(self.titles(sort='price'), ['Past', 'Later', 'Soon'])
+        self.assertEqual(self.titles(sort='-price'), ['Soon', 'Later', 'Past'])
+        self.assertEqual(self.titles(sort='popularity'), ['Later', 'Past', 'Soon'])
+
+    def test_sorted_pages_follow_the_sort(self):
+        self.make_sessions(4, price=Decimal('15.00'))
+        for sort in ('price', '-date', 'popularity'):
+            with self.subTest(sort=sort):
+                full = self.client.get(self.url, {'sort': sort}).data['results']
+                ids, url = [], f'{self.url}?sort={sort}&page_size=2'
+                while url:
+                    page = self.client.get(url).data
+                    ids.extend(row['id'] for row in page['results'])
+                    url = page['next']
+                self.assertEqual(ids, [row['id'] for row in full])
+
+    def test_invalid_parameters_return_400(self):
+        for params in ({'sort': 'title'}, {'price_min': 'cheap'}, {'date_after': 'tomorrow'}, {'creator': 'x'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+
+class SessionFilterQueryPlanTests(APITestCase):
+    """
+    Every supported filter and sort must be answered from an index, never a
+    sequential scan of core_session, and a range filter from its own index
+    whatever the sort. The table is seeded and analyzed so the planner
+    chooses on real statistics.
+    """
+    url = reverse('session-list')
+    cases = [
+        {},
+        {'sort': 'date'},
+        {'sort': '-date'},
+        {'sort': 'price'},
+        {'sort': '-price'},
+        {'upcoming': 'true', 'sort': 'date'},
+        {'date_after': '2030-01-01', 'date_before': '2030-02-01'},
+        {'date_after': '2030-01-01', 'sort': 'date'},
+        {'price_min': '10', 'price_max': '20'},
+        {'price_min': '10', 'sort': 'price'},
+        {'creator': None},
+        {'creator': None, 'sort': 'date'},
+        {'sort': 'popularity'},
+        {'upcoming': 'true', 'sort': 'popularity'},
+    ]
+    sorts = [None, 'date', '-date', 'price', '-price', 'popularity']
+    range_indexes = [
+        ({'price_min': '10', 'price_max': '20'}, 'session_price_id_idx'),
+        ({'date_after': '2030-01-01', 'date_before': '2030-02-01'}, 'session_date_id_idx'),
+    ]
+    sort_indexes = [
+        (None, 'session_created_id_idx', 'created_at'),
+        ('date', 'session_date_id_idx', 'date'),
+        ('-date', 'session_date_id_idx', 'date'),
+        ('price', 'session_price_id_idx', 'price'),
+        ('-price', 'session_price_id_idx', 'price'),
+        ('popularity', 'session_popularity_idx', 'bookings_count'),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        creators = [self.creator] + [self.make_user(f'creator{i}', role=User.CREATOR) for i in range(19)]
+        start = datetime(2027, 1, 1, tzinfo=dt_timezone.utc)
+        # 2000 sessions over ~5.5 years with 500 distinct prices: each range
+        # filter below keeps ~2% of the rows.
+        Session.objects.bulk_create([
+            Session(
+                creator=creators[i % len(creators)], title=f'Session {i}', description='About',
+                date=start + timedelta(days=i), price=Decimal(i * 7 % 500), bookings_count=i * 13 % 50,
+            )
+            for i in range(2000)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE core_session' if connection.vendor == 'postgresql' else 'ANALYZE')
+
+    def plan(self, params, url=None):
+        if 'creator' in params:
+            params = {**params, 'creator': self.creator.pk}
+        params = {key: value for key, value in params.items() if value is not None}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url or self.url, None if url else params)
+        self.assertEqual(response.status_code, 200)
+        sql = next(q['sql'] for q in queries.captured_queries if 'FROM "core_session"' in q['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {sql}' if connection.vendor == 'postgresql' else f'EXPLAIN QUERY PLAN {sql}')
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+    def assertNoSequentialScan(self, plan):
+        if connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan on core_session', plan)
+        else:
+            self.assertIsNone(re.search(r'SCAN core_session\b(?! USING)', plan), plan)
+
+    def test_catalog_queries_use_indexes(self):
+        for params in self.cases:
+            with self.subTest(params=params):
+                self.assertNoSequentialScan(self.plan(params))
+
+    def test_range_filters_use_their_index_with_every_sort(self):
+        for filters, index in self.range_indexes:
+            for sort in self.sorts:
+                params = {**filters, 'sort': sort}
+                with self.subTest(params=params):
+                    self.assertIn(index, self.plan(params))
+
+    def test_cursor_pages_seek_a_range_of_the_sort_index(self):
+        for sort, index, column in self.sort_indexes:
+            params = {'sort': sort, 'page_size': 100}
+            with self.subTest(sort=sort):
+                url = self.client.get(self.url, {key: value for key, value in params.items() if value})
+                url = self.client.get(url.data['next']).data['next']  # page 3
+                plan = self.plan(params, url=url)
+                self.assertIn(index, plan)
+                # The cursor bounds the index scan rather than filtering it.
+                if connection.vendor == 'postgresql':
+                    self.assertRegex(plan, rf'Index Cond: .*\b{column}\b')
+                else:
+                    self.assertRegex(plan, rf'SEARCH core_session USING INDEX {index} \({column}')
+
+
+class BookingCountTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.session = self.make_sessions(1)[0]
+        self.student = self.make_user('student')
+        self.client.force_authenticate(self.student)
+
+    def test_booking_views_maintain_count(self):
+        response = self.client.post(reverse('booking-create'), {'session_id': self.session.pk})
+        self.assertEqual(response.status_code, 201)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.bookings_count, 1)
+
+        response = self.client.delete(reverse('booking-delete', args=[response.data['id']]))
+        self.assertEqual(response.status_code, 204)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.bookings_count, 0)
+
+    def test_serializer_exposes_count(self):
+        Session.objects.filter(pk=self.session.pk).update(bookings_count=7)
+        response = self.client.get(reverse('session-detail', args=[self.session.pk]))
+        self.assertEqual(response.data['bookings_count'], 7)
+
+    def test_reconcile_command_fixes_drift(self):
+        other = self.make_sessions(1)[0]
+        for i in range(3):
+            Booking.objects.create(user=self.make_user(f'user{i}'), session=self.session)
+        Session.objects.filter(pk=other.pk).update(bookings_count=5)
+
+        out = StringIO()
+        call_command('reconcile_booking_counts', '--dry-run', stdout=out)
+        self.assertIn('Found 2', out.getvalue())
+        self.assertEqual(Session.objects.get(pk=self.session.pk).bookings_count, 0)
+
+        call_command('reconcile_booking_counts', '--batch-size=1', stdout=out)
+        self.assertEqual(Session.objects.get(pk=self.session.pk).bookings_count, 3)
+        self.assertEqual(Session.objects.get(pk=other.pk).bookings_count, 0)
+
+
+class BookingCapacityTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.session = self.make_sessions(1)[0]
+        self.session.capacity = 1
+        self.session.save()
+
+    def book(self, user, session=None):
+        self.client.force_authenticate(user)
+        return self.client.post(reverse('booking-create'), {'session_id': (session or self.session).pk})
+
+    def test_full_session_rejects_bookings(self):
+        self.assertEqual(self.book(self.make_user('first')).status_code, 201)
+        response = self.book(self.make_user('second'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'This session is fully booked')
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_double_booking_is_rejected_and_rolled_back(self):
+        self.session.capacity = None
+        self.session.save()
+        user = self.make_user('student')
+        self.assertEqual(self.book(user).status_code, 201)
+        response = self.book(user)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'u have already enrolled')
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.bookings_count, 1)
+
+    def test_unknown_session(self):
+        response = self.client.post(reverse('booking-create'), {'session_id': 0})
+        self.assertEqual(response.status_code, 401)
+        self.client.force_authenticate(self.make_user('student'))
+        response = self.client.post(reverse('booking-create'), {'session_id': 999})
+        self.assertEqual(response.status_code, 400)
+
+
+class BookingConcurrencyTests(TransactionTestCase):
+    """
+    Fire hundreds of simultaneous booking requests at one session and check
+    that it is neither overbooked nor double-booked.
+    """
+    capacity = 50
+    students = 120
+    attempts_per_student = 2
+
+    def setUp(self):
+        cache.clear()
+        creator = User.objects.create_user(username='creator', role=User.CREATOR)
+        self.session = Session.objects.create(
+            creator=creator, title='Popular', description='Everyone wants in',
+            date=timezone.now() + timedelta(days=1), capacity=self.capacity,
+        )
+        self.users = [User.objects.create_user(username=f'student{i}') for i in range(self.students)]
+
+    def book(self, user):
+        try:
+            client = APIClient()
+            client.force_authenticate(user)
+            return client.post(reverse('booking-create'), {'session_id': self.session.pk}).status_code
+        finally:
+            connections.close_all()
+
+    def test_concurrent_bookings_respect_capacity_and_uniqueness(self):
+        requests = self.users * self.attempts_per_student
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            statuses = list(pool.map(self.book, requests))
+
+        self.assertEqual(len(statuses), self.students * self.attempts_per_student)
+        self.assertEqual(set(statuses), {201, 400})
+        self.assertEqual(statuses.count(201), self.capacity)
+
+        bookings = Booking.objects.filter(session=self.session)
+        self.assertEqual(bookings.count(), self.capacity)
+        self.assertEqual(bookings.values('user').distinct().count(), self.capacity)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.bookings_count, self.capacity)
+
+
+class BookingBulkCreateTests(APITestCase):
+    url = reverse('booking-bulk-create')
+
+    def setUp(self):
+        super().setUp()
+        self.student = self.make_user('student')
+        self.client.force_authenticate(self.student)
+
+    def test_books_skips_and_reports_per_item(self):
+        free, taken, full = self.make_sessions(3)
+        Session.objects.filter(pk=full.pk).update(capacity=0)
+        Booking.objects.create(user=self.student, session=taken)
+
+        response = self.client.post(
+            self.url, {'session_ids': [free.pk, taken.pk, full.pk, 999, free.pk]}, format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [(row['session_id'], row['status']) for row in response.data['results']],
+            [(free.pk, 'booked'), (taken.pk, 'already_booked'), (full.pk, 'full'), (999, 'not_found')],
+        )
+        booking = Booking.objects.get(user=self.student, session=free)
+        self.assertEqual(response.data['results'][0]['booking_id'], booking.pk)
+        self.assertEqual(Session.objects.get(pk=free.pk).bookings_count, 1)
+
+    def test_nothing_to_book_returns_200(self):
+        session = self.make_sessions(1)[0]
+        Booking.objects.create(user=self.student, session=session)
+        response = self.client.post(self.url, {'session_ids': [session.pk]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['status'], 'already_booked')
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        counts = []
+        for size in (1, 20):
+            ids = [s.pk for s in self.make_sessions(size)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(self.url, {'session_ids': ids}, format='json')
+            self.assertEqual(response.status_code, 201)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_validation(self):
+        for payload in ({}, {'session_ids': []}, {'session_ids': ['x']}, {'session_ids': list(range(1, 102))}):
+            with self.subTest(payload=payload):
+                self.assertEqual(self.client.post(self.url, payload, format='json').status_code, 400)
+
+
+class SparseFieldsTests(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.session = self.make_sessions(1, description='x' * 500)[0]
+        self.student = self.make_user('student')
+        Booking.objects.create(user=self.student, session=self.session)
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, ' '.join(q['sql'] for q in queries.captured_queries)
+
+    def test_fields_limit_payload_and_columns(self):
+        response, sql = self.get(reverse('session-list'), fields='id,title')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title'})
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn('core_user', sql)
+
+    def test_fields_on_detail(self):
+        response, sql = self.get(reverse('session-detail', args=[self.session.pk]), fields='title,creator')
+        self.assertEqual(set(response.data), {'title', 'creator'})
+        self.assertEqual(response.data['creator']['username'], 'creator')
+
+    def test_compact_sessions(self):
+        response, sql = self.get(reverse('session-list'), view='compact')
+        row = response.data['results'][0]
+        self.assertEqual(row['creator'], {'id': self.creator.pk, 'username': 'creator'})
+        self.assertLessEqual(len(row['description']), 160)
+        self.assertTrue(row['description'].endswith('…'))
+        self.assertNotIn('"email"', sql)
+
+        response, _ = self.get(reverse('session-list'), view='compact', expand='creator')
+        self.assertEqual(response.data['results'][0]['creator']['email'], 'creator@example.com')
+
+    def test_compact_bookings(self):
+        self.client.force_authenticate(self.student)
+        response, sql = self.get(reverse('my-bookings'), view='compact')
+        row = response.data[0]
+        self.assertEqual(row['user'], {'id': self.student.pk, 'username': 'student'})
+        self.assertEqual(row['session']['creator'], {'id': self.creator.pk, 'username': 'creator'})
+        self.assertNotIn('"email"', sql)
+
+        response, _ = self.get(reverse('my-bookings'), view='compact', expand='session')
+        self.assertEqual(response.data[0]['session']['description'], 'x' * 500)
+
+    def test_sparse_queries_stay_within_budget(self):
+        def grow(count):
+            creator = self.make_user(f'creator{Session.objects.count()}', role=User.CREATOR)
+            for session in self.make_sessions(count, creator=creator):
+                Booking.objects.create(user=self.student, session=session)
+
+        self.client.force_authenticate(self.student)
+        for params in ('view=compact', 'fields=id,title,creator', 'view=compact&expand=creator&sort=price'):
+            with self.subTest(params=params):
+                self.assertQueryBudget(f"{reverse('session-list')}?{params}", 1, grow)
+        for params in ('view=compact', 'fields=id,session', 'view=compact&expand=session,user'):
+            with self.subTest(params=params):
+                self.assertQueryBudget(f"{reverse('my-bookings')}?{params}", 1, grow)
+
+
+class RendererTests(APITestCase):
+    data = {
+        'price': Decimal('12.50'),
+        'date': datetime(2030, 1, 2, 3, 4, 5, 678901, tzinfo=dt_timezone.utc),
+        'local': datetime(2030, 1, 2, 3, 4, 5, tzinfo=dt_timezone(timedelta(hours=5, minutes=30))),
+        'errors': {0: ['A valid integer is required.']},
+    }
+    expected = {
+        'price': '12.50',
+        'date': '2030-01-02T03:04:05.678901Z',
+        'local': '2030-01-02T03:04:05+05:30',
+        'errors': {'0': ['A valid integer is required.']},
+    }
+
+    def test_json_renderer_encodes_decimals_and_aware_datetimes(self):
+        self.assertEqual(json.loads(ORJSONRenderer().render(self.data)), self.expected)
+
+    def test_json_parser(self):
+        self.assertEqual(ORJSONParser().parse(BytesIO(b'{"session_ids": [1, 2]}')), {'session_ids': [1, 2]})
+
+    @unittest.skipUnless(msgpack, 'msgpack is not installed')
+    def test_msgpack_renderer_encodes_decimals_and_aware_datetimes(self):
+        decoded = msgpack.unpackb(MessagePackRenderer().render(self.data), strict_map_key=False)
+        self.assertEqual(decoded, {**self.expected, 'errors': {0: ['A valid integer is required.']}})
+
+    @unittest.skipUnless(msgpack, 'msgpack is not installed')
+    def test_content_negotiation(self):
+        session = self.make_sessions(1, price=Decimal('9.99'))[0]
+        url = reverse('session-detail', args=[session.pk])
+
+        as_json = self.client.get(url)
+        self.assertEqual(as_json['Content-Type'], 'application/json')
+        as_msgpack = self.client.get(url, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(as_msgpack['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(as_msgpack.content), json.loads(as_json.content))
+        self.assertEqual(msgpack.unpackb(as_msgpack.content)['price'], '9.99')
+        self.assertNotEqual(as_json['ETag'], as_msgpack['ETag'])
+
+    @unittest.skipUnless(msgpack, 'msgpack is not installed')
+    def test_msgpack_request_body(self):
+        session = self.make_sessions(1)[0]
+        self.client.force_authenticate(self.make_user('student'))
+        response = self.client.post(
+            reverse('booking-bulk-create'), msgpack.packb({'session_ids': [session.pk]}),
+            content_type='application/msgpack',
+        )
+        self.assertEqual(response.status_code, 201)
+
+
+class OAuthStateStoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def race(self, store, token, workers=8):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda _: store.pop(token), range(workers)))
+
+    def test_state_is_shared_across_workers(self):
+        # Each worker process builds its own store; they only share the cache.
+        for store_class in (CacheStateStore, SignedStateStore):
+            with self.subTest(store=store_class.__name__):
+                worker_a, worker_b = store_class(), store_class()
+                token = worker_a.put('creator')
+                self.assertEqual(worker_b.pop(token), 'creator')
+                self.assertIsNone(worker_a.pop(token))
+
+    def test_token_is_consumed_exactly_once(self):
+        for store in (LocalStateStore(), CacheStateStore(), SignedStateStore()):
+            with self.subTest(store=type(store).__name__):
+                token = store.put('creator')
+                results = self.race(store, token)
+                self.assertEqual(results.count('creator'), 1)
+                self.assertEqual(results.count(None), len(results) - 1)
+
+    def test_unknown_and_tampered_tokens(self):
+        for store in (LocalStateStore(), CacheStateStore(), SignedStateStore()):
+            with self.subTest(store=type(store).__name__):
+                token = store.put('creator')
+                self.assertIsNone(store.pop('not-a-token'))
+                self.assertIsNone(store.pop(token[:-1] + ('A' if token[-1] != 'A' else 'B')))
+
+    def test_local_store_expires_entries(self):
+        now = [0.0]
+        store = LocalStateStore(ttl=60, clock=lambda: now[0])
+        expired = store.put('creator')
+        now[0] = 30
+        fresh = store.put('user')
+        now[0] = 61
+        self.assertIsNone(store.pop(expired))
+        self.assertEqual(store.pop(fresh), 'user')
+
+        store.put('creator')
+        now[0] = 200
+        store.put('creator')
+        self.assertEqual(len(store), 1)
+
+    def test_signed_store_expires_tokens(self):
+        store = SignedStateStore(ttl=60)
+        token = store.put('creator')
+        with mock.patch('django.core.signing.time.time', return_value=timezone.now().timestamp() + 61):
+            self.assertIsNone(store.pop(token))
+
+    def test_local_store_is_bounded_under_abandoned_flows(self):
+        store = LocalStateStore(max_entries=1000)
+        oldest = store.put('creator')
+        for _ in range(1000):
+            store.put('user')
+        self.assertIsNone(store.pop(oldest))
+
+        tracemalloc.start()
+        try:
+            store = LocalStateStore(max_entries=1000)
+            for _ in range(1000):
+                store.put('creator')
+            full = tracemalloc.get_traced_memory()[0]
+            for _ in range(50000):
+                store.put('creator')
+            flooded = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(len(store), 1000)
+        self.assertLess(flooded - full, 64 * 1024)
+
+    def test_signed_store_keeps_nothing_for_abandoned_flows(self):
+        store = SignedStateStore()
+        for _ in range(1000):
+            store.put('creator')
+        self.assertEqual(len(cache._cache), 0)
+
+    @override_settings(OAUTH_STATE_STORE='core.temp_storage.CacheStateStore')
+    def test_public_api_uses_configured_store(self):
+        token = store_role_for_oauth('creator')
+        self.assertIn(CacheStateStore.key_prefix + token, [key.split(':', 2)[-1] for key in cache._cache])
+        self.assertEqual(get_role_from_state(token), 'creator')
+        self.assertEqual(get_role_from_state(token), 'user')
+
+
+class ClaimsJWTAuthenticationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        get_user_cache.cache_clear()
+        self.student = User.objects.create_user(username='student', email='student@example.com', password='pw')
+
+    def authorize(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token.access_token}')
+
+    def user_queries(self, url, method='get', **kwargs):
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, **kwargs)
+        return response, [q['sql'] for q in ctx.captured_queries if 'FROM "core_user"' in q['sql']]
+
+    def test_obtained_tokens_carry_role_claims(self):
+        response = self.client.post('/api/token/', {'username': 'student', 'password': 'pw'})
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        response, queries = self.user_queries(reverse('my-bookings'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+
+    def test_creator_permission_checked_from_claims(self):
+        data = {'title': 'Yoga', 'description': 'Stretch', 'date': '2030-01-01T10:00:00Z', 'price': '5.00'}
+        self.authorize(ClaimsRefreshToken.for_user(self.student))
+        response, queries = self.user_queries(reverse('session-create'), method='post', data=data)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(queries, [])
+
+        self.authorize(ClaimsRefreshToken.for_user(self.creator))
+        self.assertEqual(self.client.post(reverse('session-create'), data).status_code, 201)
+        self.assertEqual(Session.objects.get().creator, self.creator)
+
+    def test_full_user_is_loaded_lazily_in_one_query(self):
+        self.authorize(ClaimsRefreshToken.for_user(self.student))
+        response, queries = self.user_queries(reverse('user-profile'))
+        self.assertEqual(response.data['email'], 'student@example.com')
+        self.assertEqual(len(queries), 1)
+
+    def test_tokens_without_claims_are_looked_up_once(self):
+        self.authorize(RefreshToken.for_user(self.student))
+        _, first = self.user_queries(reverse('my-bookings'))
+        _, second = self.user_queries(reverse('my-bookings'))
+        self.assertEqual(len(first), 1)
+        self.assertEqual(second, [])
+
+    def test_role_change_invalidates_claims(self):
+        token = ClaimsRefreshToken.for_user(self.creator)
+        self.authorize(token)
+        self.assertEqual(self.client.patch(reverse('user-profile'), {'role': 'user'}).status_code, 200)
+
+        response = self.client.post(reverse('session-create'), {
+            'title': 'Yoga', 'description': 'Stretch', 'date': '2030-01-01T10:00:00Z', 'price': '5.00',
+        })
+        self.assertEqual(response.status_code, 403)
+        # Access tokens minted later from the same refresh token are stale too.
+        self.authorize(token)
+        self.assertEqual(self.client.get(reverse('user-profile')).data['role'], 'user')
+
+    def test_deactivated_user_is_rejected(self):
+        self.authorize(ClaimsRefreshToken.for_user(self.student))
+        self.assertEqual(self.client.get(reverse('my-bookings')).status_code, 200)
+        User.objects.filter(pk=self.student.pk).update(is_active=False)
+        invalidate_user(self.student)
+        self.assertEqual(self.client.get(reverse('my-bookings')).status_code, 401)
+
+    def test_profile_update_does_not_write_back_stale_claims(self):
+        self.authorize(ClaimsRefreshToken.for_user(self.student))
+        # Changed without invalidating, so the token's claims are trusted.
+        User.objects.filter(pk=self.student.pk).update(role=User.CREATOR, is_active=False)
+        response = self.client.patch(reverse('user-profile'), {'email': 'new@example.com'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            User.objects.values('email', 'role', 'is_active').get(pk=self.student.pk),
+            {'email': 'new@example.com', 'role': User.CREATOR, 'is_active': False},
+        )
+
+    def test_username_change_invalidates_claims(self):
+        self.authorize(ClaimsRefreshToken.for_user(self.student))
+        self.assertEqual(self.client.patch(reverse('user-profile'), {'username': 'student2'}).status_code, 200)
+        self.assertEqual(self.client.get(reverse('user-profile')).data['username'], 'student2')
+
+    def test_saving_a_user_invalidates_claims(self):
+        self.authorize(ClaimsRefreshToken.for_user(self.student))
+        self.assertEqual(self.client.get(reverse('my-bookings')).status_code, 200)
+        self.student.email = 'other@example.com'
+        self.student.save(update_fields=['email'])
+        self.assertIsNone(cache.get(CHANGED_KEY.format(self.student.pk)))
+
+        # e.g. deactivated in the admin site
+        self.student.is_active = False
+        self.student.save()
+        self.assertEqual(self.client.get(reverse('my-bookings')).status_code, 401)
+
+    def test_invalidation_by_another_process_drops_cached_snapshot(self):
+        self.authorize(ClaimsRefreshToken.for_user(self.student))
+        self.assertEqual(self.client.get(reverse('my-bookings')).status_code, 200)
+        User.objects.filter(pk=self.student.pk).update(is_active=False)
+        # Another worker's invalidate_user(): the shared marker, without
+        # touching this process's snapshot cache.
+        cache.set(CHANGED_KEY.format(self.student.pk), time.time())
+        self.assertEqual(self.client.get(reverse('my-bookings')).status_code, 401)
+
+    def test_refresh_reads_current_claims(self):
+        refresh = ClaimsRefreshToken.for_user(self.creator)
+        User.objects.filter(pk=self.creator.pk).update(role=User.USER)
+        response = self.client.post(reverse('token_refresh'), {'refresh': str(refresh)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AccessToken(response.data['access'])['role'], 'user')
+
+        User.objects.filter(pk=self.creator.pk).update(is_active=False)
+        response = self.client.post(reverse('token_refresh'), {'refresh': str(refresh)})
+        self.assertEqual(response.status_code, 401)
+
+
+class LastLoginTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.student = User.objects.create_user(username='student', password='pw')
+        self.other = self.make_user('other')
+
+    def last_login(self, user):
+        return User.objects.values_list('last_login', flat=True).get(pk=user.pk)
+
+    def test_synchronous_mode_writes_on_login(self):
+        response = self.client.post('/api/token/', {'username': 'student', 'password': 'pw'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(self.last_login(self.student))
+
+    @override_settings(LAST_LOGIN_WRITE_BEHIND=True, LAST_LOGIN_FLUSH_INTERVAL=3600)
+    def test_write_behind_keeps_login_off_the_request_path(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/token/', {'username': 'student', 'password': 'pw'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')])
+        self.assertIsNone(self.last_login(self.student))
+
+    def test_flush_coalesces_per_user_in_one_update(self):
+        buffer = LastLoginBuffer(interval=3600)
+        self.addCleanup(buffer.close)
+        base = timezone.now()
+        for minutes in (1, 3, 2):
+            buffer.record(self.student.pk, base + timedelta(minutes=minutes))
+        buffer.record(self.other.pk, base)
+        self.assertEqual(len(buffer), 2)
+        self.assertIsNone(self.last_login(self.student))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(self.last_login(self.student), base + timedelta(minutes=3))
+        self.assertEqual(self.last_login(self.other), base)
+
+    def test_flush_never_moves_last_login_backwards(self):
+        now = timezone.now()
+        User.objects.filter(pk=self.student.pk).update(last_login=now)
+        buffer = LastLoginBuffer(interval=3600)
+        self.addCleanup(buffer.close)
+        buffer.record(self.student.pk, now - timedelta(hours=1))
+        buffer.flush()
+        self.assertEqual(self.last_login(self.student), now)
+
+
+class LastLoginWorkerTests(TransactionTestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f'user{i}') for i in range(3)]
+
+    def wait_for_last_logins(self, count, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if User.objects.filter(last_login__isnull=False).count() >= count:
+                return True
+            time.sleep(0.02)
+        return False
+
+    def test_size_threshold_triggers_background_flush(self):
+        buffer = LastLoginBuffer(interval=3600, max_size=3)
+        self.addCleanup(buffer.close)
+        for user in self.users[:2]:
+            buffer.record(user.pk, timezone.now())
+        self.assertFalse(self.wait_for_last_logins(1, timeout=0.2))
+        buffer.record(self.users[2].pk, timezone.now())
+        self.assertTrue(self.wait_for_last_logins(3))
+
+    def test_interval_triggers_background_flush(self):
+        buffer = LastLoginBuffer(interval=0.05)
+        self.addCleanup(buffer.close)
+        buffer.record(self.users[0].pk, timezone.now())
+        self.assertTrue(self.wait_for_last_logins(1))
+
+    def test_close_flushes_pending_logins(self):
+        buffer = LastLoginBuffer(interval=3600)
+        for user in self.users:
+            buffer.record(user.pk, timezone.now())
+        buffer.close()
+        self.assertEqual(User.objects.filter(last_login__isnull=False).count(), 3)
+
+
+class FixedKeyThrottle(SlidingWindowThrottle):
+    rate = '10/min'
+
+    def __init__(self, clock):
+        super().__init__()
+        self.timer = lambda: clock[0]
+
+    def get_cache_key(self, request, view):
+        return 'throttle_test'
+
+
+class ThrottleTests(APITestCase):
+    stores = ['core.throttling.CacheCounterStore', 'core.throttling.DatabaseCounterStore']
+
+    def hit(self, throttle, times):
+        return [throttle.allow_request(None, None) for _ in range(times)]
+
+    def test_sliding_window_weights_previous_window(self):
+        for store in self.stores:
+            with self.subTest(store=store), override_settings(THROTTLE_STORE=store):
+                cache.clear()
+                clock = [6000.0]
+                throttle = FixedKeyThrottle(clock)
+                self.assertEqual(self.hit(throttle, 11), [True] * 10 + [False])
+                self.assertAlmostEqual(throttle.wait(), 60 + 60 * (1 - 9 / 11))
+
+                # Halfway into the next window half of the 11 still count.
+                clock[0] = 6090.0
+                self.assertEqual(self.hit(throttle, 5), [True] * 4 + [False])
+                self.assertGreater(throttle.wait(), 0)
+
+                clock[0] = 6240.0
+                self.assertTrue(throttle.allow_request(None, None))
+
+    def test_workers_share_counts(self):
+        for store in self.stores:
+            with self.subTest(store=store), override_settings(THROTTLE_STORE=store):
+                cache.clear()
+                clock = [6000.0]
+                # Each worker builds its own throttle; only the store is shared.
+                workers = [FixedKeyThrottle(clock) for _ in range(5)]
+                results = [worker.allow_request(None, None) for _ in range(3) for worker in workers]
+                self.assertEqual(results.count(True), 10)
+
+    @override_settings(THROTTLE_STORE='core.throttling.DatabaseCounterStore')
+    def test_state_per_client_is_constant(self):
+        clock = [6000.0]
+        throttle = FixedKeyThrottle(clock)
+        self.hit(throttle, 1000)
+        self.assertEqual(list(ThrottleCounter.objects.values_list('count', flat=True)), [1000])
+
+        ThrottleCounter.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        clock[0] = 6060.0
+        with mock.patch('core.throttling.DatabaseCounterStore.prune_probability', 1):
+            throttle.allow_request(None, None)
+        self.assertEqual(list(ThrottleCounter.objects.values_list('count', flat=True)), [1])
+
+    def test_booking_scope_is_stricter(self):
+        rates = {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], 'bookings': '2/min'}
+        sessions = self.make_sessions(3)
+        self.client.force_authenticate(self.make_user('student'))
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates}):
+            statuses = [
+                self.client.post(reverse('booking-create'), {'session_id': s.pk}).status_code
+                for s in sessions
+            ]
+            self.assertEqual(statuses, [201, 201, 429])
+            self.assertEqual(self.client.get(reverse('my-bookings')).status_code, 200)
+
+
+@override_settings(PROFILING_SAMPLE_RATE=1.0, PROFILING_SERVER_TIMING=True)
+class ProfilingTests(APITestCase):
+    def timings(self, response):
+        return {
+            entry.split(';')[0]: entry
+            for entry in response['Server-Timing'].split(', ')
+        }
+
+    def test_server_timing_reports_request_breakdown(self):
+        self.make_sessions(3)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('session-list'))
+        timings = self.timings(response)
+        self.assertTrue({'total', 'db', 'serialize', 'render'} <= set(timings))
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', timings['db'])
+
+    def test_profile_is_logged_per_view(self):
+        self.make_sessions(1)
+        with self.assertLogs('core.profiling', 'INFO') as logs:
+            self.client.get(reverse('session-list'))
+        profile = logs.records[0].profile
+        self.assertEqual(profile['view'], 'session-list')
+        self.assertEqual(profile['status'], 200)
+        self.assertGreater(profile['db_queries'], 0)
+
+        formatted = json.loads(JSONFormatter().format(logs.records[0]))
+        self.assertEqual(formatted['view'], 'session-list')
+        self.assertEqual(formatted['level'], 'INFO')
+
+    @override_settings(PROFILING_SAMPLE_RATE=0.0)
+    def test_unsampled_requests_are_untouched(self):
+        response = self.client.get(reverse('session-list'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_storage_calls_are_timed(self):
+        with TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            with activate(RequestProfile()) as profile:
+                name = default_storage.save('profile.txt', ContentFile(b'hello'))
+                self.assertTrue(default_storage.exists(name))
+        self.assertIn('storage', profile.timings)
+
+    def test_async_middleware_counts_queries(self):
+        # AsyncClient goes through the ASGI handler, so the middleware runs
+        # in async mode and the view's queries run on the executor thread.
+        self.make_sessions(2)
+        with CaptureQueriesContext(connection) as ctx:
+            response = async_to_sync(AsyncClient().get)(reverse('session-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', self.timings(response)['db'])
+
+    def test_connects_are_timed(self):
+        def query():
+            # A fresh thread opens its own connection.
+            profile = RequestProfile()
+            try:
+                with ProfilingMiddleware(lambda request: None).wrap_connections(profile):
+                    User.objects.count()
+                self.assertNotIn('get_new_connection', vars(connection))
+            finally:
+                connection.close()
+            return profile
+
+        with ThreadPoolExecutor(1) as pool:
+            profile = pool.submit(query).result()
+        self.assertEqual(profile.queries, 1)
+        self.assertIn('db_connect', profile.timings)
+
+    def test_pool_stats_are_logged(self):
+        pool = mock.Mock()
+        pool.get_stats.return_value = {
+            'pool_size': 4, 'pool_available': 1, 'requests_waiting': 2,
+            'requests_num': 10, 'requests_wait_ms': 35,
+        }
+        with mock.patch.dict(connection.settings_dict['OPTIONS'], {'pool': {'max_size': 4}}), \
+                mock.patch.object(type(connections['default']), 'pool', pool, create=True), \
+                self.assertLogs('core.profiling', 'INFO') as logs:
+            self.client.get(reverse('session-list'))
+        self.assertEqual(logs.records[0].profile['db_pool'], {'default': {
+            'size': 4, 'available': 1, 'waiting': 2, 'requests': 10, 'wait_ms': 35, 'timeouts': 0,
+        }})
+
+
+class CreatorDashboardTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_creator = self.make_user('other', role=User.CREATOR)
+        self.sessions = self.make_sessions(3, price=Decimal('12.50'))
+        self.make_sessions(1, creator=self.other_creator)
+        self.students = [self.make_user(f'student{i}') for i in range(3)]
+        for student in self.students:
+            Booking.objects.create(user=student, session=self.sessions[0])
+        Booking.objects.create(user=self.students[0], session=self.sessions[1])
+
+    def test_stats_in_one_query(self):
+        self.client.force_authenticate(self.creator)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('creator-dashboard'))
+        self.assertEqual(response.status_code, 200)
+        stats = {row['id']: row for row in response.data['results']}
+        self.assertEqual(set(stats), {s.pk for s in self.sessions})
+
+        first = stats[self.sessions[0].pk]
+        self.assertEqual(first['booking_count'], 3)
+        self.assertEqual(first['revenue'], '37.50')
+        self.assertEqual(
+            first['last_booked_at'],
+            Booking.objects.filter(session=self.sessions[0]).latest('booked_at').booked_at.isoformat().replace('+00:00', 'Z'),
+        )
+        self.assertEqual(stats[self.sessions[2].pk]['booking_count'], 0)
+        self.assertEqual(stats[self.sessions[2].pk]['revenue'], '0.00')
+        self.assertIsNone(stats[self.sessions[2].pk]['last_booked_at'])
+
+    def test_paginated(self):
+        self.client.force_authenticate(self.creator)
+        first = self.client.get(reverse('creator-dashboard'), {'page_size': 2, 'sort': 'popularity'})
+        self.assertEqual(len(first.data['results']), 2)
+        second = self.client.get(first.data['next'])
+        ids = [row['id'] for row in first.data['results'] + second.data['results']]
+        self.assertEqual(sorted(ids), sorted(s.pk for s in self.sessions))
+        self.assertIsNone(second.data['next'])
+
+    def test_creators_only(self):
+        self.client.force_authenticate(self.students[0])
+        self.assertEqual(self.client.get(reverse('creator-dashboard')).status_code, 403)
+
+    def test_update_and_delete_are_scoped_to_own_sessions(self):
+        theirs = Session.objects.get(creator=self.other_creator)
+        self.client.force_authenticate(self.creator)
+        self.assertEqual(self.client.patch(reverse('session-update', args=[theirs.pk]), {'title': 'Mine'}).status_code, 404)
+        self.assertEqual(self.client.delete(reverse('session-delete', args=[theirs.pk])).status_code, 404)
+        self.assertTrue(Session.objects.filter(pk=theirs.pk, title='Session 0').exists())
+
+        mine = self.sessions[2]
+        self.assertEqual(self.client.patch(reverse('session-update', args=[mine.pk]), {'title': 'Renamed'}).status_code, 200)
+        self.assertEqual(self.client.delete(reverse('session-delete', args=[mine.pk])).status_code, 204)
+
+
+def make_image_upload(name='photo.png', size=(400, 300)):
+    buffer = BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+@override_settings(IMAGE_VARIANTS_SYNC=True, IMAGE_VARIANT_WIDTHS=[100, 200, 4000])
+class ImageVariantTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client.force_authenticate(self.creator)
+
+    def create_session(self, **extra):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('session-create'), {
+                'title': 'Yoga', 'description': 'Stretch', 'date': '2030-01-01T10:00:00Z',
+                'price': '5.00', 'image': make_image_upload(), **extra,
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return Session.objects.get(pk=response.data['id'])
+
+    def test_variants_are_generated_next_to_the_original(self):
+        session = self.create_session()
+        variants = session.image_variants
+        self.assertEqual(variants['source'], session.image.name)
+        self.assertEqual(set(variants['formats']), set(enabled_formats()))
+        # 4000 is wider than the original, so it collapses to 400.
+        self.assertEqual(set(variants['formats']['webp']), {'100', '200', '400'})
+
+        name = variants['formats']['webp']['100']
+        self.assertEqual(os.path.dirname(name), os.path.dirname(session.image.name))
+        with default_storage.open(name) as variant:
+            self.assertEqual(Image.open(variant).size, (100, 75))
+
+    def test_srcset_in_api(self):
+        session = self.create_session()
+        data = self.client.get(reverse('session-detail', args=[session.pk])).data
+        self.assertEqual(data['image_url'], session.image.url)
+        srcset = data['image_srcset']['webp'].split(', ')
+        self.assertEqual([entry.split(' ')[1] for entry in srcset], ['100w', '200w', '400w'])
+
+    def test_replaced_image_hides_stale_variants(self):
+        session = self.create_session()
+        session.image.save('other.png', make_image_upload('other.png'))
+        self.assertEqual(self.client.get(reverse('session-detail', args=[session.pk])).data['image_srcset'], {})
+
+    def test_avatar_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('user-profile'), {'avatar': make_image_upload('me.png')}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.creator.refresh_from_db()  # force_authenticate reuses this instance
+        self.assertIn('100w', self.client.get(reverse('user-profile')).data['avatar_srcset']['webp'])
+
+    def test_avatar_variants_invalidate_catalog(self):
+        self.make_sessions(1)
+        url = f"{reverse('session-list')}?expand=creator"
+        self.client.get(url)
+        self.creator.avatar.save('me.png', make_image_upload('me.png'), save=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            # Variants are attached after the avatar itself was saved.
+            self.creator.save(update_fields=['avatar'])
+        creator = self.client.get(url).data['results'][0]['creator']
+        self.assertIn('100w', creator['avatar_srcset']['webp'])
+
+    @override_settings(IMAGE_VARIANTS_SYNC=False)
+    def test_generated_off_the_request_thread(self):
+        with mock.patch('core.images.get_executor') as get_executor:
+            session = self.create_session()
+        get_executor.return_value.submit.assert_called_once()
+        self.assertEqual(session.image_variants, {})
+
+    def test_backfill_generates_lost_variants(self):
+        # Queued on a worker that was recycled before running them.
+        with override_settings(IMAGE_VARIANTS_SYNC=False), mock.patch('core.images.get_executor'):
+            session = self.create_session()
+            self.creator.avatar.save('me.png', make_image_upload('me.png'))
+        done = self.create_session()
+        Session.objects.filter(pk=done.pk).update(image='other.png')  # replaced since
+
+        out = StringIO()
+        call_command('backfill_image_variants', '--dry-run', stdout=out)
+        self.assertIn('Found variants for 3 image(s)', out.getvalue())
+        with self.assertLogs('core.management.commands.backfill_image_variants', 'ERROR'):
+            call_command('backfill_image_variants', '--batch-size=1', stdout=out)
+        self.assertIn('Generated variants for 2 image(s), 1 failed', out.getvalue())
+
+        session.refresh_from_db()
+        self.creator.refresh_from_db()
+        self.assertEqual(session.image_variants['source'], session.image.name)
+        self.assertEqual(self.creator.avatar_variants['source'], self.creator.avatar.name)
+        call_command('backfill_image_variants', '--dry-run', stdout=out)
+        self.assertIn('Found variants for 1 image(s)', out.getvalue())
+
+
+@requires_moto
+@override_settings(
+    STORAGES={**settings.STORAGES, 'default': {'BACKEND': 'core.storage.MinIOMediaStorage'}},
+    AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing', AWS_S3_REGION_NAME='us-east-1',
+    AWS_STORAGE_BUCKET_NAME='session-images', AWS_DEFAULT_ACL='public-read', AWS_QUERYSTRING_AUTH=False,
+    DIRECT_UPLOAD_MAX_SIZE=50_000, IMAGE_VARIANTS_SYNC=True, IMAGE_VARIANT_WIDTHS=[100],
+)
+class DirectUploadTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        default_storage.connection.meta.client.create_bucket(Bucket='session-images')
+        self.session = self.make_sessions(1)[0]
+        self.client.force_authenticate(self.creator)
+
+    def presign(self, **data):
+        data = {'target': 'session', 'session_id': self.session.pk, 'filename': 'photo.png',
+                'content_type': 'image/png', 'size': 2000, **data}
+        data = {name: value for name, value in data.items() if value is not None}
+        return self.client.post(reverse('upload-presign'), data, format='json')
+
+    def upload(self, presigned, content, content_type='image/png'):
+        response = requests.post(
+            presigned['url'], data=presigned['fields'], files={'file': ('photo.png', content, content_type)},
+        )
+        self.assertLess(response.status_code, 300)
+
+    def confirm(self, token):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('upload-confirm'), {'upload_token': token}, format='json')
+
+    def test_presign_upload_and_confirm_session_image(self):
+        response = self.presign()
+        self.assertEqual(response.status_code, 201)
+        key = response.data['key']
+        self.assertRegex(key, r'^[0-9a-f]{32}\.png$')
+        fields = response.data['fields']
+        self.assertEqual(fields['key'], key)
+        self.assertEqual(fields['Content-Type'], 'image/png')
+        self.assertEqual(fields['acl'], 'public-read')
+        self.assertIn('immutable', fields['Cache-Control'])
+
+        self.upload(response.data, make_image_upload().read())
+        version = get_catalog_version()
+        confirmed = self.confirm(response.data['upload_token'])
+        self.assertEqual(confirmed.status_code, 200)
+        self.assertEqual(confirmed.data['image_url'], f'/media/{key}')
+        self.assertGreater(get_catalog_version(), version)
+
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.image.name, key)
+        # Variants are built from the object the client uploaded.
+        self.assertEqual(self.session.image_variants['source'], key)
+        self.assertIn('100', self.session.image_variants['formats']['webp'])
+
+    def test_avatar_upload(self):
+        student = self.make_user('student')
+        self.client.force_authenticate(student)
+        response = self.presign(target='avatar', session_id=None)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['key'].startswith('avatars/'))
+        self.upload(response.data, make_image_upload().read())
+        self.assertEqual(self.confirm(response.data['upload_token']).status_code, 200)
+        student.refresh_from_db()
+        self.assertEqual(student.avatar.name, response.data['key'])
+
+    def test_presign_validation(self):
+        self.assertEqual(self.presign(size=60_000).status_code, 400)
+        self.assertEqual(self.presign(content_type='application/pdf').status_code, 400)
+        other = self.make_sessions(1, creator=self.make_user('other', role=User.CREATOR))[0]
+        self.assertEqual(self.presign(session_id=other.pk).status_code, 404)
+        self.client.force_authenticate(self.make_user('student'))
+        self.assertEqual(self.presign().status_code, 403)
+
+    def test_confirm_rejects_missing_or_mismatched_objects(self):
+        response = self.presign()
+        self.assertEqual(self.confirm(response.data['upload_token']).status_code, 400)
+
+        # The bucket accepted something other than what was presigned.
+        self.upload(response.data, b'x' * 60_000)
+        self.assertEqual(self.confirm(response.data['upload_token']).status_code, 400)
+        self.assertIsNone(default_storage.stat(response.data['key']))
+        self.session.refresh_from_db()
+        self.assertFalse(self.session.image)
+
+    def test_confirm_rejects_files_that_are_not_images(self):
+        jpeg = BytesIO()
+        Image.new('RGB', (10, 10)).save(jpeg, 'JPEG')
+        for content in (b'<script>alert(1)</script>', make_image_upload().read()[:100], jpeg.getvalue()):
+            with self.subTest(content=content[:10]):
+                response = self.presign()
+                self.upload(response.data, content)
+                confirmed = self.confirm(response.data['upload_token'])
+                self.assertEqual(confirmed.status_code, 400)
+                self.assertIsNone(default_storage.stat(response.data['key']))
+        self.session.refresh_from_db()
+        self.assertFalse(self.session.image)
+
+    def test_token_is_bound_to_the_user(self):
+        response = self.presign()
+        self.upload(response.data, make_image_upload().read())
+        self.client.force_authenticate(self.make_user('student'))
+        self.assertEqual(self.confirm(response.data['upload_token']).status_code, 400)
+        self.assertEqual(self.confirm('forged').status_code, 400)
+
+    @override_settings(STORAGES=settings.STORAGES)
+    def test_presign_needs_object_storage(self):
+        self.assertEqual(self.presign().status_code, 400)
+
+
+@requires_moto
+@override_settings(
+    AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing', AWS_S3_REGION_NAME='us-east-1',
+    AWS_STORAGE_BUCKET_NAME='session-images', S3_MAX_POOL_CONNECTIONS=4,
+    S3_MULTIPART_THRESHOLD=5 * 1024 * 1024, S3_MULTIPART_CHUNKSIZE=5 * 1024 * 1024,
+)
+class SharedS3ClientTests(TestCase):
+    def setUp(self):
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+
+    def test_storages_and_threads_share_one_tuned_client(self):
+        first, second = MinIOMediaStorage(), MinIOMediaStorage()
+        with ThreadPoolExecutor(2) as pool:
+            connection = pool.submit(lambda: first.connection).result()
+        self.assertIsNot(connection, first.connection)
+        self.assertIs(connection.meta.client, second.connection.meta.client)
+        self.assertEqual(first.client.meta.config.max_pool_connections, 4)
+        self.assertEqual(first.transfer_config.multipart_threshold, 5 * 1024 * 1024)
+
+    def test_large_files_are_uploaded_in_parts(self):
+        storage = MinIOMediaStorage()
+        storage.client.create_bucket(Bucket='session-images')
+        with mock.patch.object(storage.client, 'create_multipart_upload',
+                               wraps=storage.client.create_multipart_upload) as multipart:
+            name = storage.save('large.bin', ContentFile(os.urandom(11 * 1024 * 1024)))
+        multipart.assert_called_once()
+        self.assertEqual(storage.size(name), 11 * 1024 * 1024)
+
+
+@requires_moto
+@override_settings(
+    AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing', AWS_S3_REGION_NAME='us-east-1',
+    AWS_STORAGE_BUCKET_NAME='session-images', MEDIA_CACHE_CONTROL='public, max-age=60, immutable',
+)
+class ContentHashedStorageTests(TestCase):
+    def setUp(self):
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        self.storage = MinIOMediaStorage()
+        self.storage.client.create_bucket(Bucket='session-images')
+
+    def test_names_are_content_hashes(self):
+        name = self.storage.save('avatars/Me.PNG', ContentFile(b'avatar'))
+        self.assertRegex(name, r'^avatars/[0-9a-f]{32}\.png$')
+        self.assertNotEqual(self.storage.save('avatars/me.png', ContentFile(b'other')), name)
+
+    def test_identical_uploads_are_stored_once(self):
+        first = self.storage.save('photo.jpg', ContentFile(b'same bytes'))
+        with mock.patch.object(self.storage.client, 'put_object') as put:
+            second = self.storage.save('copy.jpg', ContentFile(b'same bytes'))
+        self.assertEqual(first, second)
+        put.assert_not_called()
+        objects = self.storage.client.list_objects_v2(Bucket='session-images')['Contents']
+        self.assertEqual(len(objects), 1)
+
+    def test_objects_are_written_immutable(self):
+        name = self.storage.save('photo.jpg', ContentFile(b'bytes'))
+        head = self.storage.client.head_object(Bucket='session-images', Key=name)
+        self.assertEqual(head['CacheControl'], 'public, max-age=60, immutable')
+        self.assertEqual(head['ContentType'], 'image/jpeg')
+
+
+@requires_moto
+@override_settings(
+    AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing', AWS_S3_REGION_NAME='us-east-1',
+    AWS_S3_ENDPOINT_URL=None, AWS_STORAGE_BUCKET_NAME='session-images', AWS_DEFAULT_ACL='public-read',
+)
+class MigrateMediaTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        self.s3 = get_client()
+        self.s3.create_bucket(Bucket='session-images')
+
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = media.name
+        self.checkpoint = os.path.join(self.media, 'checkpoint.json')
+        self.sessions = self.make_sessions(5)
+        for i, session in enumerate(self.sessions):
+            self.write(f'session-images/{i}.jpg')
+            session.image.name = f'session-images/{i}.jpg'
+            session.image_variants = {
+                'source': session.image.name, 'formats': {'webp': {'100': f'session-images/{i}.w100.webp'}},
+            }
+            self.write(f'session-images/{i}.w100.webp')
+        Session.objects.bulk_update(self.sessions, ['image', 'image_variants'])
+
+    def write(self, name):
+        path = os.path.join(self.media, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fh:
+            fh.write(self.content(name))
+
+    def content(self, name):
+        return f'bytes of {os.path.basename(name)}'.encode()
+
+    def hashed(self, name, directory=''):
+        return content_hashed_name(os.path.join(directory, os.path.basename(name)), [self.content(name)])
+
+    def migrate(self, *args):
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('migrate_media', f'--source={self.media}', f'--checkpoint={self.checkpoint}',
+                         '--batch-size=2', '--workers=3', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def keys(self):
+        return {obj['Key'] for obj in self.s3.list_objects_v2(Bucket='session-images').get('Contents', [])}
+
+    def test_dry_run_writes_nothing(self):
+        out = self.migrate('--dry-run')
+        self.assertIn('core.session: 5 rows, 10 uploaded', out)
+        self.assertEqual(self.keys(), set())
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self.sessions[0].refresh_from_db()
+        self.assertEqual(self.sessions[0].image.name, 'session-images/0.jpg')
+
+    def test_migrates_images_variants_and_avatars(self):
+        student = self.make_user('student')
+        self.write('avatars/me.png')
+        User.objects.filter(pk=student.pk).update(avatar='avatars/me.png')
+        version = get_catalog_version()
+
+        out = self.migrate()
+        self.assertIn('core.user: 1 rows, 1 uploaded', out)
+        self.assertEqual(self.keys(), (
+            {self.hashed(f'{i}.jpg') for i in range(5)} | {self.hashed(f'{i}.w100.webp') for i in range(5)}
+            | {self.hashed('me.png', 'avatars')}
+        ))
+        session = Session.objects.get(pk=self.sessions[2].pk)
+        self.assertEqual(session.image.name, self.hashed('2.jpg'))
+        self.assertEqual(session.image_variants, {
+            'source': self.hashed('2.jpg'), 'formats': {'webp': {'100': self.hashed('2.w100.webp')}},
+        })
+        head = self.s3.head_object(Bucket='session-images', Key=session.image.name)
+        self.assertEqual(head['ContentType'], 'image/jpeg')
+        self.assertEqual(head['CacheControl'], settings.MEDIA_CACHE_CONTROL)
+        self.assertEqual(User.objects.get(pk=student.pk).avatar.name, self.hashed('me.png', 'avatars'))
+        self.assertGreater(get_catalog_version(), version)
+        with open(self.checkpoint) as fh:
+            self.assertEqual(json.load(fh)['core.session'], self.sessions[-1].pk)
+
+        # Already migrated rows are untouched on a fresh run.
+        self.assertIn('core.session: 5 rows, 0 uploaded, 0 copied, 10 present', self.migrate('--restart'))
+
+    def test_avatar_renames_invalidate_catalog(self):
+        self.write('avatars/me.png')
+        User.objects.filter(pk=self.creator.pk).update(avatar='avatars/me.png')
+        version = get_catalog_version()
+        self.migrate('--models', 'core.user')
+        self.assertGreater(get_catalog_version(), version)
+
+    def test_copies_legacy_keys_inside_the_bucket(self):
+        os.remove(os.path.join(self.media, 'session-images/0.jpg'))
+        self.s3.put_object(
+            Bucket='session-images', Key='session-images/0.jpg', Body=self.content('0.jpg'),
+            ContentType='binary/octet-stream',
+        )
+        self.assertIn('1 copied', self.migrate('--models', 'core.session'))
+        key = self.hashed('0.jpg')
+        self.assertEqual(Session.objects.get(pk=self.sessions[0].pk).image.name, key)
+        head = self.s3.head_object(Bucket='session-images', Key=key)
+        self.assertEqual(head['CacheControl'], settings.MEDIA_CACHE_CONTROL)
+        self.assertEqual(head['ContentType'], 'image/jpeg')
+        # Left for gc_media, once nothing refers to it.
+        self.assertIn('session-images/0.jpg', self.keys())
+        self.assertIn('0 copied', self.migrate('--models', 'core.session', '--restart'))
+
+    def test_resumes_after_a_failure(self):
+        upload_file = self.s3.upload_file
+
+        def flaky(path, bucket, key, **kwargs):
+            if key == self.hashed('3.jpg'):
+                raise OSError('connection reset')
+            return upload_file(path, bucket, key, **kwargs)
+
+        with mock.patch.object(self.s3, 'upload_file', side_effect=flaky):
+            with self.assertRaisesMessage(CommandError, 'rerun to resume'):
+                self.migrate('--models', 'core.session')
+        with open(self.checkpoint) as fh:
+            self.assertEqual(json.load(fh), {'core.session': self.sessions[2].pk})
+        self.assertEqual(Session.objects.get(pk=self.sessions[3].pk).image.name, 'session-images/3.jpg')
+        # Nothing past the failing batch is attempted.
+        self.assertEqual(Session.objects.get(pk=self.sessions[4].pk).image.name, 'session-images/4.jpg')
+
+        out = self.migrate('--models', 'core.session')
+        self.assertIn('core.session: 2 rows', out)
+        self.assertEqual(Session.objects.get(pk=self.sessions[3].pk).image.name, self.hashed('3.jpg'))
+
+    def test_images_replaced_during_the_copy_are_kept(self):
+        class InlineExecutor:
+            # Copy on this thread, so the replacement below shares the
+            # test's transaction.
+            def __init__(self, *args, **kwargs):
+                pass
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                pass
+
+            map = staticmethod(map)
+
+        migrate_row = MigrateMediaCommand.migrate_row
+
+        def replace_first(command, row, *args):
+            if row.pk == self.sessions[0].pk:
+                Session.objects.filter(pk=row.pk).update(image='replaced.jpg', image_variants={})
+            return migrate_row(command, row, *args)
+
+        with mock.patch('core.management.commands.migrate_media.ThreadPoolExecutor', InlineExecutor), \
+                mock.patch.object(MigrateMediaCommand, 'migrate_row', replace_first):
+            self.migrate('--models', 'core.session')
+        self.assertEqual(Session.objects.get(pk=self.sessions[0].pk).image.name, 'replaced.jpg')
+        self.assertEqual(Session.objects.get(pk=self.sessions[1].pk).image.name, self.hashed('1.jpg'))
+
+
+@requires_moto
+@override_settings(
+    AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing', AWS_S3_REGION_NAME='us-east-1',
+    AWS_S3_ENDPOINT_URL=None, AWS_STORAGE_BUCKET_NAME='session-images',
+)
+class GCMediaTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        self.s3 = get_client()
+        self.s3.create_bucket(Bucket='session-images')
+
+        sessions = self.make_sessions(3)
+        for i, session in enumerate(sessions):
+            session.image.name = f'{i}.jpg'
+            session.image_variants = {'source': f'{i}.jpg', 'formats': {'webp': {'100': f'{i}v.webp'}}}
+        # Two sessions sharing one deduplicated image.
+        sessions[2].image.name = '0.jpg'
+        Session.objects.bulk_update(sessions, ['image', 'image_variants'])
+        User.objects.filter(pk=self.creator.pk).update(avatar='avatars/me.png')
+
+        self.referenced = {'0.jpg', '1.jpg', '0v.webp', '1v.webp', '2v.webp', 'avatars/me.png'}
+        self.orphans = {'2.jpg', 'old.jpg', 'avatars/old.png', 'zz.webp', 'a.jpg'}
+        for key in self.referenced | self.orphans:
+            self.s3.put_object(Bucket='session-images', Key=key, Body=b'x')
+
+    def keys(self):
+        return {obj['Key'] for obj in self.s3.list_objects_v2(Bucket='session-images').get('Contents', [])}
+
+    def gc(self, *args):
+        out = StringIO()
+        call_command('gc_media', '--grace-hours=0', '--run-size=2', '--batch-size=2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_deletes_only_unreferenced_objects(self):
+        self.assertIn('Deleted 5 orphaned object(s)', self.gc())
+        self.assertEqual(self.keys(), self.referenced)
+
+    def test_dry_run(self):
+        out = self.gc('--dry-run', '--verbosity=2')
+        self.assertIn('Would delete 5 orphaned object(s)', out)
+        self.assertIn('orphan: avatars/old.png', out)
+        self.assertEqual(self.keys(), self.referenced | self.orphans)
+
+    def test_grace_period_keeps_recent_objects(self):
+        out = StringIO()
+        call_command('gc_media', stdout=out)
+        self.assertIn('kept 5 orphan(s) inside the grace period', out.getvalue())
+        self.assertEqual(self.keys(), self.referenced | self.orphans)
+
+    def test_streams_are_merged_in_sorted_order(self):
+        self.assertEqual(list(referenced_names(run_size=2)), sorted(self.referenced))
+        objects = [(key,) for key in ['a', 'b', 'c', 'd', 'e']]
+        self.assertEqual([obj[0] for obj in orphaned(iter(objects), iter(['b', 'bb', 'd', 'f']))], ['a', 'c', 'e'])
+
+
+class AsyncReadViewTests(APITestCase):
+    """The async read views return exactly what the sync views do."""
+
+    def setUp(self):
+        super().setUp()
+        self.sessions = self.make_sessions(5)
+        self.student = self.make_user('student')
+        for session in self.sessions[:2]:
+            Booking.objects.create(user=self.student, session=session)
+
+    def call(self, view_class, url, **kwargs):
+        request = RequestFactory().get(url, HTTP_HOST='testserver')
+        response = async_to_sync(view_class.as_view())(request, **kwargs)
+        response.render()
+        return response
+
+    def test_views_are_async(self):
+        for view_class in (AsyncSessionListView, AsyncSessionDetailView, AsyncSessionBookingsView):
+            self.assertTrue(view_class.view_is_async)
+
+    def test_list_matches_sync_view(self):
+        for query in ('?page_size=2', '?page_size=2&sort=price&view=compact', '?fields=id,title&legacy=true'):
+            url = reverse('session-list') + query
+            expected = self.client.get(url)
+            cache.clear()
+            response = self.call(AsyncSessionListView, url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.content), json.loads(expected.content))
+
+        # Following the cursor works the same way.
+        cache.clear()
+        next_url = self.call(AsyncSessionListView, reverse('session-list') + '?page_size=2').data['next']
+        self.assertEqual(len(self.call(AsyncSessionListView, next_url).data['results']), 2)
+
+    def test_detail_and_bookings_match_sync_views(self):
+        session = self.sessions[0]
+        for view_class, name in ((AsyncSessionDetailView, 'session-detail'), (AsyncSessionBookingsView, 'session-bookings')):
+            url = reverse(name, args=[session.pk])
+            expected = self.client.get(url)
+            cache.clear()
+            response = self.call(view_class, url, pk=session.pk)
+            self.assertEqual(json.loads(response.content), json.loads(expected.content))
+
+        missing = self.call(AsyncSessionDetailView, reverse('session-detail', args=[999]), pk=999)
+        self.assertEqual(missing.status_code, 404)
+
+    def test_catalog_cache_hit_runs_no_queries(self):
+        url = reverse('session-detail', args=[self.sessions[0].pk])
+        first = self.call(AsyncSessionDetailView, url, pk=self.sessions[0].pk)
+        with self.assertNumQueries(0):
+            second = self.call(AsyncSessionDetailView, url, pk=self.sessions[0].pk)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_invalid_filters_are_rejected(self):
+        response = self.call(AsyncSessionListView, reverse('session-list') + '?sort=nope')
+        self.assertEqual(response.status_code, 400)
+
+
+@unittest.skipUnless('replica' in settings.DATABASES, 'needs the SQLite replica stand-in from core.test_runner')
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(APITestCase):
+    # The replica is a separate database that never catches up, so every
+    # read that reaches it misses what the test wrote to the primary.
+    databases = {'default', 'replica'} & set(settings.DATABASES)
+
+    def setUp(self):
+        super().setUp()
+        self.student = self.make_user('student')
+        self.session = self.make_sessions(1)[0]
+
+    def bookings(self):
+        response = self.client.get(reverse('my-bookings'))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_reads_go_to_the_replica(self):
+        self.assertEqual(self.client.get(reverse('session-list')).data['results'], [])
+        self.assertEqual(self.client.get(reverse('session-detail', args=[self.session.pk])).status_code, 404)
+        # Outside a request, reads stay on the primary.
+        self.assertEqual(Session.objects.count(), 1)
+
+    def test_asgi_requests_are_routed(self):
+        response = async_to_sync(AsyncClient().get)(reverse('session-detail', args=[self.session.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_writer_reads_own_writes_for_the_pin_window(self):
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.bookings(), [])
+
+        # The whole POST, including its reads, runs on the primary.
+        response = self.client.post(reverse('booking-create'), {'session_id': self.session.pk})
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Booking.objects.using('default').filter(pk=response.data['id']).exists())
+        self.assertEqual([b['id'] for b in self.bookings()], [response.data['id']])
+
+        other = APIClient()
+        other.force_authenticate(self.creator)
+        self.assertEqual(other.get(reverse('session-detail', args=[self.session.pk])).status_code, 404)
+
+        cache.delete(db_router.pin_key(self.student.pk))
+        self.assertEqual(self.bookings(), [])
+
+    def test_writes_to_primary_only_models_do_not_pin(self):
+        routing = db_router.RequestRouting(RequestFactory().get('/'))
+        token = db_router._routing.set(routing)
+        try:
+            self.assertEqual(db_router.PrimaryReplicaRouter().db_for_write(ThrottleCounter), 'default')
+            self.assertEqual(db_router.PrimaryReplicaRouter().db_for_read(ThrottleCounter), 'default')
+            self.assertFalse(routing.wrote)
+            self.assertEqual(db_router.PrimaryReplicaRouter().db_for_read(Session), 'replica')
+        finally:
+            db_router._routing.reset(token)
+
+    def test_catalog_cache_skips_replica_reads_after_a_write(self):
+        self.client.force_authenticate(self.creator)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('session-create'), {
+                'title': 'Yoga', 'description': 'Stretch', 'date': '2030-01-01T10:00:00Z', 'price': '5.00',
+            })
+        self.assertEqual(response.status_code, 201)
+
+        # Built from the lagging replica right after the write: not cached.
+        anonymous = APIClient()
+        self.assertEqual(anonymous.get(reverse('session-list')).data['results'], [])
+        # The pinned creator reads the primary and caches a fresh page...
+        self.assertEqual(len(self.client.get(reverse('session-list')).data['results']), 2)
+        # ...which everyone is then served.
+        self.assertEqual(len(anonymous.get(reverse('session-list')).data['results']), 2)
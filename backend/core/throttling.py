@@ -0,0 +1,143 @@
+"""
+Sliding-window-counter throttles backed by a shared counter store.
+
+DRF's throttles keep a list with one timestamp per request in the cache of
+the worker that served it. These keep two integers per client instead, the
+request counts of the current and previous fixed window, and estimate the
+rolling count as::
+
+    previous * (1 - elapsed / window) + current
+
+Counters live in a pluggable store selected by ``THROTTLE_STORE``:
+
+- ``CacheCounterStore`` uses atomic cache increments; with Redis or
+  Memcached as the cache every worker shares the same counts.
+- ``DatabaseCounterStore`` keeps them in the ``ThrottleCounter`` table, a
+  shared stand-in where no shared cache is available.
+
+Rates come from ``REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']``; views opt into
+a stricter scope with ``throttle_scope``.
+"""
+import random
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework import throttling
+from rest_framework.settings import api_settings
+
+from .models import ThrottleCounter
+
+
+class CacheCounterStore:
+    def __init__(self, alias=None):
+        self.cache = caches[alias or getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')]
+
+    def incr(self, key, ttl):
+        if self.cache.add(key, 1, ttl):
+            return 1
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Expired between add() and incr().
+            self.cache.add(key, 1, ttl)
+            return 1
+
+    def get(self, key):
+        return self.cache.get(key, 0)
+
+
+class DatabaseCounterStore:
+    # Expired rows are deleted by a small fraction of increments.
+    prune_probability = 0.01
+
+    def incr(self, key, ttl):
+        now = timezone.now()
+        with transaction.atomic():
+            # Keys carry their window number, so a key is never reused after
+            # it expires.
+            if not ThrottleCounter.objects.filter(key=key).update(count=F('count') + 1):
+                try:
+                    with transaction.atomic():
+                        ThrottleCounter.objects.create(key=key, count=1, expires_at=now + timedelta(seconds=ttl))
+                except IntegrityError:
+                    ThrottleCounter.objects.filter(key=key).update(count=F('count') + 1)
+            count = ThrottleCounter.objects.values_list('count', flat=True).get(key=key)
+        if random.random() < self.prune_probability:
+            ThrottleCounter.objects.filter(expires_at__lte=now).delete()
+        return count
+
+    def get(self, key):
+        counter = ThrottleCounter.objects.filter(key=key, expires_at__gt=timezone.now())
+        return counter.values_list('count', flat=True).first() or 0
+
+
+@lru_cache(maxsize=None)
+def get_counter_store():
+    path = getattr(settings, 'THROTTLE_STORE', 'core.throttling.CacheCounterStore')
+    return import_string(path)()
+
+
+@receiver(setting_changed)
+def _reset_counter_store(setting, **kwargs):
+    if setting.startswith('THROTTLE_') or setting == 'CACHES':
+        get_counter_store.cache_clear()
+
+
+class SlidingWindowThrottle(throttling.SimpleRateThrottle):
+    """Constant-memory replacement for ``SimpleRateThrottle``."""
+
+    def get_rate(self):
+        # Read the rates on use (not at import) so settings overrides apply.
+        self.THROTTLE_RATES = api_settings.DEFAULT_THROTTLE_RATES
+        return super().get_rate()
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        store = get_counter_store()
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        self.elapsed = self.now - window * self.duration
+        # Rejected requests count too, so hammering doesn't shorten the wait.
+        self.current = store.incr(f'{self.key}:{window}', 2 * self.duration)
+        self.previous = store.get(f'{self.key}:{window - 1}')
+        return self.estimate(self.elapsed) <= self.num_requests
+
+    def estimate(self, elapsed):
+        return self.previous * (1 - elapsed / self.duration) + self.current
+
+    def wait(self):
+        remaining = self.duration - self.elapsed
+        if self.current < self.num_requests:
+            # The previous window's share has to decay enough for one more.
+            if not self.previous:
+                return None
+            share = (self.num_requests - self.current - 1) / self.previous
+            return max(0.0, self.duration * (1 - share) - self.elapsed)
+        # Wait for the next window, then for this window's share to decay.
+        return remaining + max(0.0, self.duration * (1 - (self.num_requests - 1) / self.current))
+
+
+class AnonRateThrottle(throttling.AnonRateThrottle, SlidingWindowThrottle):
+    pass
+
+
+class UserRateThrottle(throttling.UserRateThrottle, SlidingWindowThrottle):
+    pass
+
+
+class ScopedRateThrottle(throttling.ScopedRateThrottle, SlidingWindowThrottle):
+    pass
@@ -0,0 +1,152 @@
+"""
+Direct-to-storage uploads of session images and avatars.
+
+1. ``POST /api/uploads/presign/`` validates the target and file, picks the
+   object key and returns a presigned POST from ``MinIOMediaStorage`` plus a
+   signed ``upload_token`` describing the pending upload.
+2. The client POSTs the file straight to the bucket.
+3. ``POST /api/uploads/confirm/`` checks the token and the stored object
+   (size, content type, and that Pillow reads it as an image of that type)
+   and attaches the key to the ``Session``/``User``.
+
+The file never passes through Django; the token keeps the flow stateless.
+"""
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from PIL import Image
+from rest_framework import exceptions, serializers
+
+from .cache import bump_catalog_version
+from .models import Session, User
+
+CONTENT_TYPES = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/webp': '.webp',
+    'image/gif': '.gif',
+}
+TOKEN_SALT = 'core.uploads'
+TARGETS = ('session', 'avatar')
+
+
+def max_upload_size():
+    return getattr(settings, 'DIRECT_UPLOAD_MAX_SIZE', 10 * 1024 * 1024)
+
+
+def upload_expires():
+    return getattr(settings, 'DIRECT_UPLOAD_EXPIRES', 600)
+
+
+def is_image(storage, name, content_type):
+    """Whether the stored object is an image of ``content_type``."""
+    try:
+        with storage.open(name) as fh:
+            image = Image.open(fh)
+            image.verify()
+    except Exception:
+        # Like Django's ImageField: anything Pillow can't read is invalid.
+        return False
+    return Image.MIME.get(image.format) == content_type
+
+
+def get_upload_storage():
+    if not hasattr(default_storage, 'presigned_post'):
+        raise exceptions.ValidationError('Direct uploads need the MinIO media storage.')
+    return default_storage
+
+
+class PresignUploadSerializer(serializers.Serializer):
+    target = serializers.ChoiceField(choices=TARGETS)
+    session_id = serializers.IntegerField(required=False, min_value=1)
+    filename = serializers.CharField(max_length=255)
+    content_type = serializers.ChoiceField(choices=list(CONTENT_TYPES))
+    size = serializers.IntegerField(min_value=1)
+
+    def validate_size(self, value):
+        if value > max_upload_size():
+            raise serializers.ValidationError(f'File is larger than {max_upload_size()} bytes.')
+        return value
+
+    def validate(self, attrs):
+        user = self.context['request'].user
+        if attrs['target'] == 'session':
+            if user.role != User.CREATOR:
+                raise exceptions.PermissionDenied('Only creators can upload session images.')
+            if 'session_id' not in attrs:
+                raise serializers.ValidationError({'session_id': 'This field is required.'})
+            if not Session.objects.filter(pk=attrs['session_id'], creator=user).exists():
+                raise exceptions.NotFound('Session not found.')
+            attrs['object_id'] = attrs['session_id']
+        else:
+            attrs['object_id'] = user.pk
+        return attrs
+
+    def get_key(self, attrs):
+        # The client's filename only informs validation; the key is ours.
+        extension = CONTENT_TYPES[attrs['content_type']]
+        prefix = 'avatars/' if attrs['target'] == 'avatar' else ''
+        return f'{prefix}{uuid.uuid4().hex}{extension}'
+
+    def save(self, **kwargs):
+        attrs = self.validated_data
+        storage = get_upload_storage()
+        key = self.get_key(attrs)
+        presigned = storage.presigned_post(
+            key, attrs['content_type'], max_size=max_upload_size(), expires=upload_expires(),
+        )
+        token = signing.dumps({
+            'key': key,
+            'target': attrs['target'],
+            'id': attrs['object_id'],
+            'user': self.context['request'].user.pk,
+            'content_type': attrs['content_type'],
+        }, salt=TOKEN_SALT)
+        return {**presigned, 'key': key, 'upload_token': token, 'expires_in': upload_expires()}
+
+
+class ConfirmUploadSerializer(serializers.Serializer):
+    upload_token = serializers.CharField()
+
+    def validate_upload_token(self, value):
+        try:
+            upload = signing.loads(value, salt=TOKEN_SALT, max_age=upload_expires() * 2)
+        except signing.BadSignature:
+            raise serializers.ValidationError('Invalid or expired upload token.')
+        if upload['user'] != self.context['request'].user.pk:
+            raise serializers.ValidationError('Invalid or expired upload token.')
+        return upload
+
+    def validate(self, attrs):
+        upload = attrs['upload_token']
+        stat = get_upload_storage().stat(upload['key'])
+        if stat is None:
+            raise serializers.ValidationError('The file has not been uploaded.')
+        if stat['size'] > max_upload_size() or stat['content_type'] != upload['content_type']:
+            get_upload_storage().delete(upload['key'])
+            raise serializers.ValidationError('The uploaded file does not match the upload request.')
+        # The content type is only what the client declared.
+        if not is_image(get_upload_storage(), upload['key'], upload['content_type']):
+            get_upload_storage().delete(upload['key'])
+            raise serializers.ValidationError('The uploaded file is not a valid image.')
+        return upload
+
+    def save(self, **kwargs):
+        upload = self.validated_data
+        user = self.context['request'].user
+        if upload['target'] == 'session':
+            instance = Session.objects.filter(pk=upload['id'], creator=user).first()
+            if instance is None:
+                raise exceptions.NotFound('Session not found.')
+            field = 'image'
+        else:
+            instance, field = user, 'avatar'
+
+        getattr(instance, field).name = upload['key']
+        # A regular save, so post_save queues the image variants.
+        instance.save(update_fields=[field])
+        # Sessions show their image and embed their creator's avatar.
+        bump_catalog_version()
+        return instance
@@ -1,31 +1,55 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     UserProfileView,
     SessionListView,
     SessionDetailView,
+    AsyncSessionListView,
+    AsyncSessionDetailView,
+    AsyncSessionBookingsView,
+    SessionSearchView,
     SessionCreateView,
     SessionUpdateView,
     SessionDeleteView,
+    CreatorDashboardView,
     BookingCreateView,
+    BookingBulkCreateView,
     BookingDeleteView,
     UserBookingsView,
     SessionBookingsView,
+    UploadPresignView,
+    UploadConfirmView,
 )
 
+# Hot public reads run on the async ORM when served under ASGI.
+if settings.ASYNC_READ_VIEWS:
+    session_list, session_detail, session_bookings = (
+        AsyncSessionListView, AsyncSessionDetailView, AsyncSessionBookingsView,
+    )
+else:
+    session_list, session_detail, session_bookings = SessionListView, SessionDetailView, SessionBookingsView
+
 urlpatterns = [
     # User endpoints
     path("users/me/", UserProfileView.as_view(), name="user-profile"),
     
     # Session endpoints
-    path("sessions/", SessionListView.as_view(), name="session-list"),
-    path("sessions/<int:pk>/", SessionDetailView.as_view(), name="session-detail"),
-    path("sessions/<int:pk>/bookings/", SessionBookingsView.as_view(), name="session-bookings"),
+    path("sessions/", session_list.as_view(), name="session-list"),
+    path("sessions/search/", SessionSearchView.as_view(), name="session-search"),
+    path("sessions/<int:pk>/", session_detail.as_view(), name="session-detail"),
+    path("sessions/<int:pk>/bookings/", session_bookings.as_view(), name="session-bookings"),
     path("sessions/create/", SessionCreateView.as_view(), name="session-create"),
     path("sessions/<int:pk>/update/", SessionUpdateView.as_view(), name="session-update"),
     path("sessions/<int:pk>/delete/", SessionDeleteView.as_view(), name="session-delete"),
+    path("creator/sessions/", CreatorDashboardView.as_view(), name="creator-dashboard"),
     
     # Booking endpoints
     path("bookings/create/", BookingCreateView.as_view(), name="booking-create"),
+    path("bookings/bulk/", BookingBulkCreateView.as_view(), name="booking-bulk-create"),
     path("bookings/<int:pk>/delete/", BookingDeleteView.as_view(), name="booking-delete"),
     path("bookings/my/", UserBookingsView.as_view(), name="my-bookings"),
+
+    # Direct-to-storage uploads
+    path("uploads/presign/", UploadPresignView.as_view(), name="upload-presign"),
+    path("uploads/confirm/", UploadConfirmView.as_view(), name="upload-confirm"),
 ]
@@ -1,13 +1,34 @@
+import logging
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max
 from rest_framework import generics, permissions
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework import status
+from .async_generics import AsyncListAPIView, AsyncRetrieveAPIView
+from .cache import AsyncCatalogCacheMixin, CatalogCacheMixin, bump_catalog_version
+from .filters import SessionFilterBackend, SessionOrderingFilter
+from .mixins import SparseFieldsViewMixin
 from .models import Session, Booking, User
-from .serializers import SessionSerializer, BookingSerializer, UserSerializer
+from .serializers import (
+    SessionSerializer,
+    SessionCompactSerializer,
+    CreatorSessionStatsSerializer,
+    BookingSerializer,
+    BookingCompactSerializer,
+    BookingBulkSerializer,
+    UserSerializer,
+)
+from .pagination import KeysetPagination, SearchPagination
 from .permissions import IsCreator
+from .search import search_sessions
 from .temp_storage import store_role_for_oauth
+from .uploads import ConfirmUploadSerializer, PresignUploadSerializer
+
+logger = logging.getLogger(__name__)
 
 
 # 🔓 Store role in session before OAuth
@@ -17,7 +38,7 @@ def set_role_session(request):
     """Store selected role and return state token for OAuth"""
     try:
         role = request.data.get('role', 'user')
-        print(f"[SET ROLE] Received role: {role}")
+        logger.debug("Set role: received role %r", role)
         
         # Store role in temp storage and get state token
         state_token = store_role_for_oauth(role)
@@ -27,7 +48,7 @@ def set_role_session(request):
         request.session.modified = True
         request.session.save()
         
-        print(f"[SET ROLE] Generated state token: {state_token}")
+        logger.debug("Set role: issued OAuth state for role %r", role)
         
         return Response({
             'status': 'success', 
@@ -35,36 +56,76 @@ def set_role_session(request):
             'state': state_token
         }, status=status.HTTP_200_OK)
     except Exception as e:
-        print(f"[SET ROLE] Error: {str(e)}")
+        logger.warning("Set role failed: %s", e)
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
 # 🔒 Get current user profile
 class UserProfileView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    # Profile fields the catalog embeds in each session's creator.
+    catalog_fields = {'username', 'email', 'avatar'}
 
     def get(self, request):
         serializer = UserSerializer(request.user)
         return Response(serializer.data)
 
     def patch(self, request):
-        serializer = UserSerializer(request.user, data=request.data, partial=True)
+        # request.user holds token claims, which may be stale; write through
+        # the real row. Saving it invalidates the claims when they change.
+        user = User.objects.get(pk=request.user.pk)
+        serializer = UserSerializer(user, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
+            if self.catalog_fields & set(serializer.validated_data):
+                bump_catalog_version()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 # 🔓 Public: list all sessions
-class SessionListView(generics.ListAPIView):
-    queryset = Session.objects.all().order_by('-created_at')
+class SessionListView(CatalogCacheMixin, SparseFieldsViewMixin, generics.ListAPIView):
+    queryset = Session.objects.select_related('creator')
     serializer_class = SessionSerializer
+    compact_serializer_class = SessionCompactSerializer
+    pagination_class = KeysetPagination
+    filter_backends = [SessionFilterBackend, SessionOrderingFilter]
 
 
 # 🔓 Public: get single session
-class SessionDetailView(generics.RetrieveAPIView):
-    queryset = Session.objects.all()
+class SessionDetailView(CatalogCacheMixin, SparseFieldsViewMixin, generics.RetrieveAPIView):
+    queryset = Session.objects.select_related('creator')
+    serializer_class = SessionSerializer
+    compact_serializer_class = SessionCompactSerializer
+
+
+# 🔓 Public: list all sessions, on the async ORM (served under ASGI)
+class AsyncSessionListView(AsyncCatalogCacheMixin, SparseFieldsViewMixin, AsyncListAPIView):
+    queryset = Session.objects.select_related('creator')
+    serializer_class = SessionSerializer
+    compact_serializer_class = SessionCompactSerializer
+    pagination_class = KeysetPagination
+    filter_backends = [SessionFilterBackend, SessionOrderingFilter]
+
+
+# 🔓 Public: get single session, on the async ORM (served under ASGI)
+class AsyncSessionDetailView(AsyncCatalogCacheMixin, SparseFieldsViewMixin, AsyncRetrieveAPIView):
+    queryset = Session.objects.select_related('creator')
+    serializer_class = SessionSerializer
+    compact_serializer_class = SessionCompactSerializer
+
+
+# 🔓 Public: full-text search over session titles and descriptions
+class SessionSearchView(CatalogCacheMixin, SparseFieldsViewMixin, generics.ListAPIView):
     serializer_class = SessionSerializer
+    compact_serializer_class = SessionCompactSerializer
+    pagination_class = SearchPagination
+
+    def get_queryset(self):
+        query = self.request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': 'This query parameter is required.'})
+        return search_sessions(query, Session.objects.select_related('creator'))
 
 
 # 🔒 Creator: create session (creator role only)
@@ -74,50 +135,118 @@ class SessionCreateView(generics.CreateAPIView):
 
     def perform_create(self, serializer):
         serializer.save(creator=self.request.user)
+        bump_catalog_version()
 
 
 # 🔒 Creator: update session (only own sessions)
 class SessionUpdateView(generics.UpdateAPIView):
-    queryset = Session.objects.all()
     serializer_class = SessionSerializer
     permission_classes = [permissions.IsAuthenticated, IsCreator]
 
+    def get_queryset(self):
+        # Other creators' sessions are simply not found.
+        return Session.objects.filter(creator=self.request.user).select_related('creator')
+
     def perform_update(self, serializer):
-        # Only allow creator to update their own session
-        if serializer.instance.creator != self.request.user:
-            raise PermissionDenied("You can only update your own sessions")
         serializer.save()
+        bump_catalog_version()
 
 
 # 🔒 Creator: delete session (only own sessions)
 class SessionDeleteView(generics.DestroyAPIView):
-    queryset = Session.objects.all()
     serializer_class = SessionSerializer
     permission_classes = [permissions.IsAuthenticated, IsCreator]
 
+    def get_queryset(self):
+        return Session.objects.filter(creator=self.request.user)
+
     def perform_destroy(self, instance):
-        # Only allow creator to delete their own session
-        if instance.creator != self.request.user:
-            raise PermissionDenied("You can only delete your own sessions")
         instance.delete()
+        bump_catalog_version()
+
+
+# 🔒 Creator: own sessions with booking stats
+class CreatorDashboardView(generics.ListAPIView):
+    serializer_class = CreatorSessionStatsSerializer
+    permission_classes = [permissions.IsAuthenticated, IsCreator]
+    pagination_class = KeysetPagination
+    filter_backends = [SessionFilterBackend, SessionOrderingFilter]
+
+    def get_queryset(self):
+        # One GROUP BY query over the creator's sessions and their bookings.
+        booking_count = Count('bookings')
+        return Session.objects.filter(creator=self.request.user).annotate(
+            booking_count=booking_count,
+            revenue=ExpressionWrapper(
+                F('price') * booking_count,
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+            last_booked_at=Max('bookings__booked_at'),
+        )
 
 
 # 🔒 User: book a session
 class BookingCreateView(generics.CreateAPIView):
     serializer_class = BookingSerializer
     permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = 'bookings'
 
     def perform_create(self, serializer):
+        # BookingSerializer.create claims the seat and inserts atomically.
         serializer.save(user=self.request.user)
+        bump_catalog_version()
+
+
+# 🔒 User: book several sessions at once
+class BookingBulkCreateView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = 'bookings'
+
+    def post(self, request):
+        serializer = BookingBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = serializer.save(user=request.user)
+
+        booked = any(result['status'] == BookingBulkSerializer.BOOKED for result in results)
+        if booked:
+            bump_catalog_version()
+        return Response(
+            {'results': results},
+            status=status.HTTP_201_CREATED if booked else status.HTTP_200_OK,
+        )
+
+
+# 🔒 User: presigned POST for uploading a session image or avatar to storage
+class UploadPresignView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = PresignUploadSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save(), status=status.HTTP_201_CREATED)
+
+
+# 🔒 User: attach a finished direct upload to its session or avatar
+class UploadConfirmView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = ConfirmUploadSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        instance = serializer.save()
+        if isinstance(instance, Session):
+            return Response(SessionSerializer(instance, context={'request': request}).data)
+        return Response(UserSerializer(instance, context={'request': request}).data)
 
 
 # 🔒 User: view own bookings
-class UserBookingsView(generics.ListAPIView):
+class UserBookingsView(SparseFieldsViewMixin, generics.ListAPIView):
     serializer_class = BookingSerializer
+    compact_serializer_class = BookingCompactSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Booking.objects.filter(user=self.request.user)
+        return Booking.objects.filter(user=self.request.user).select_related('session__creator', 'user')
 
 
 # 🔒 User: delete own booking
@@ -130,15 +259,32 @@ class BookingDeleteView(generics.DestroyAPIView):
         # Only allow user to delete their own booking
         if instance.user != self.request.user:
             raise PermissionDenied("You can only delete your own bookings")
-        instance.delete()
+        with transaction.atomic():
+            instance.delete()
+            Session.objects.filter(pk=instance.session_id, bookings_count__gt=0).update(
+                bookings_count=F('bookings_count') - 1
+            )
+        bump_catalog_version()
 
 
 # 🔓 Public: List all bookings for a specific session (to show enrolled students)
-class SessionBookingsView(generics.ListAPIView):
+class SessionBookingsView(SparseFieldsViewMixin, generics.ListAPIView):
     serializer_class = BookingSerializer
+    compact_serializer_class = BookingCompactSerializer
     permission_classes = [permissions.AllowAny]
 
     def get_queryset(self):
         session_id = self.kwargs['pk']
-        return Booking.objects.filter(session_id=session_id)
+        return Booking.objects.filter(session_id=session_id).select_related('session__creator', 'user')
+
+
 
+# 🔓 Public: bookings of a session, on the async ORM (served under ASGI)
+class AsyncSessionBookingsView(SparseFieldsViewMixin, AsyncListAPIView):
+    serializer_class = BookingSerializer
+    compact_serializer_class = BookingCompactSerializer
+    permission_classes = [permissions.AllowAny]
+
+    def get_queryset(self):
+        session_id = self.kwargs['pk']
+        return Booking.objects.filter(session_id=session_id).select_related('session__creator', 'user')
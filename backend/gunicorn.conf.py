@@ -0,0 +1,47 @@
+"""
+Production server settings, read by ``gunicorn -c gunicorn.conf.py``.
+
+By default the WSGI app runs on threaded (gthread) workers. Set
+``GUNICORN_APP=backend.asgi:application`` to run the ASGI app on uvicorn
+workers, which serve the async read views on an event loop; compare the two
+with ``python -m benchmarks.load``. Every knob below is an environment
+variable.
+"""
+import multiprocessing
+import os
+
+wsgi_app = os.getenv('GUNICORN_APP', 'backend.wsgi:application')
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+_asgi = wsgi_app.startswith('backend.asgi')
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'uvicorn_worker.UvicornWorker' if _asgi else 'gthread')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+# Catalog versions, throttle counts, auth claim invalidations and replica
+# pins live in the default cache; workers only agree on them through a
+# shared one.
+_cache = os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+if workers > 1 and _cache.rsplit('.', 1)[-1] in ('LocMemCache', 'DummyCache'):
+    raise RuntimeError(
+        f'{workers} workers need a shared CACHE_BACKEND (e.g. django.core.cache.backends.redis.RedisCache), '
+        f'not {_cache}; or set GUNICORN_WORKERS=1.'
+    )
+
+# Threads per worker; only used by the gthread worker class.
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+# Seconds an idle client connection is kept open (nginx reuses them).
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+# Recycle a worker after this many requests (plus jitter, so workers don't
+# all restart together), bounding slow leaks. 0 disables it.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '200'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+loglevel = os.getenv('LOG_LEVEL', 'info').lower()
+reload = os.getenv('GUNICORN_RELOAD', 'False') == 'True'
+# Load the app in the master so workers fork with it already imported.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'False') == 'True'
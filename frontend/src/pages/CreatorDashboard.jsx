@@ -105,10 +105,9 @@ const CreatorDashboard = () => {
 
   const fetchMySessions = async () => {
     try {
-      const response = await api.get('/sessions/');
-      // Filter sessions created by current user
-      const mySessions = response.data.filter(s => s.creator.id === user.id);
-      setSessions(mySessions);
+      // Filtered server-side to the current creator
+      const response = await api.get(`/sessions/?creator=${user.id}&legacy=true`);
+      setSessions(response.data);
     } catch (err) {
       setError('Failed to load your classes');
       console.error(err);
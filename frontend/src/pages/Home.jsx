@@ -6,6 +6,8 @@ import api from '../utils/api';
 const Home = () => {
   const [sessions, setSessions] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextPage, setNextPage] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState('');
   const { user } = useAuth();
   const navigate = useNavigate();
@@ -41,7 +43,8 @@ const Home = () => {
   const fetchSessions = async () => {
     try {
       const response = await api.get('/sessions/');
-      setSessions(response.data);
+      setSessions(response.data.results);
+      setNextPage(response.data.next);
     } catch (err) {
       setError('Failed to load classes');
       console.error(err);
@@ -50,6 +53,22 @@ const Home = () => {
     }
   };
 
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      // `next` is an absolute URL; keep its cursor query and stay on /api.
+      const { search } = new URL(nextPage, window.location.origin);
+      const response = await api.get(`/sessions/${search}`);
+      setSessions((previous) => [...previous, ...response.data.results]);
+      setNextPage(response.data.next);
+    } catch (err) {
+      setError('Failed to load more classes');
+      console.error(err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   if (loading) {
     return (
       <div className="min-h-screen bg-gray-50 flex items-center justify-center">
@@ -112,11 +131,22 @@ const Home = () => {
               >
                 <div className="aspect-video bg-gray-100 relative overflow-hidden">
                   {session.image_url ? (
-                    <img
-                      src={session.image_url}
-                      alt={session.title}
-                      className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-500"
-                    />
+                    <picture>
+                      {['avif', 'webp'].filter((format) => session.image_srcset?.[format]).map((format) => (
+                        <source
+                          key={format}
+                          type={`image/${format}`}
+                          srcSet={session.image_srcset[format]}
+                          sizes="(min-width: 1024px) 25vw, (min-width: 768px) 50vw, 100vw"
+                        />
+                      ))}
+                      <img
+                        src={session.image_url}
+                        alt={session.title}
+                        loading="lazy"
+                        className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-500"
+                      />
+                    </picture>
                   ) : (
                     <div className="w-full h-full flex items-center justify-center bg-indigo-50 text-indigo-300 text-4xl font-bold">
                       {session.title.charAt(0)}
@@ -187,6 +217,18 @@ const Home = () => {
             )}
           </div>
         )}
+
+        {nextPage && (
+          <div className="mt-10 text-center">
+            <button
+              onClick={loadMore}
+              disabled={loadingMore}
+              className="bg-indigo-600 text-white px-6 py-3 rounded-lg font-medium hover:bg-indigo-700 transition-colors disabled:opacity-50"
+            >
+              {loadingMore ? 'Loading...' : 'Load more classes'}
+            </button>
+          </div>
+        )}
       </div>
     </div>
   );
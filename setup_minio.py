@@ -6,17 +6,22 @@ This script creates the required buckets in MinIO for the Sessions Marketplace a
 Run this after docker-compose up to initialize MinIO storage.
 """
 
-import boto3
-from botocore.client import Config
+import os
+import sys
 import time
 
+# Share the tuned client factory with the backend (core.s3)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+os.environ.setdefault('MINIO_ENDPOINT', 'http://localhost:9000')
+
+from core.s3 import get_client, option
+
 def setup_minio_buckets():
     """Create MinIO buckets if they don't exist"""
     
-    # MinIO configuration
-    MINIO_ENDPOINT = 'http://localhost:9000'
-    ACCESS_KEY = 'minioadmin'
-    SECRET_KEY = 'minioadmin'
+    # MinIO configuration (MINIO_* environment variables)
+    ACCESS_KEY = option('AWS_ACCESS_KEY_ID')
+    SECRET_KEY = option('AWS_SECRET_ACCESS_KEY')
     
     # Buckets to create
     BUCKETS = ['session-images', 'avatars']
@@ -27,14 +32,7 @@ def setup_minio_buckets():
     max_retries = 10
     for i in range(max_retries):
         try:
-            s3_client = boto3.client(
-                's3',
-                endpoint_url=MINIO_ENDPOINT,
-                aws_access_key_id=ACCESS_KEY,
-                aws_secret_access_key=SECRET_KEY,
-                config=Config(signature_version='s3v4'),
-                region_name='us-east-1'
-            )
+            s3_client = get_client()
             s3_client.list_buckets()
             print("✅ Connected to MinIO")
             break